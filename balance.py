@@ -1,87 +1,297 @@
 from web3 import Web3
-from eth_account import Account
-import csv
+import json
 import os
+import threading
+from rpc import batch_request, chunked, RPCError
+from registry import WalletRegistry, ROLE_NAMES
 
-# RPC
-RPC_URL = "https://api.mainnet.abs.xyz"
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+# Режим наблюдения: как часто спрашивать номер блока без подписки
+WATCH_POLL_INTERVAL = 2.0
+# Сколько eth_getBlockByNumber уходит одним батчем при догоне
+BLOCKS_PER_BATCH = 20
 
-def get_address_from_private_key(private_key: str) -> str:
-    if private_key.startswith('0x'):
-        private_key = private_key[2:]
-    account = Account.from_key(private_key)
-    return account.address
+# RPC общий для всех скриптов (core.py)
+from core import rpc_pool, w3
 
-def check_balance(private_key: str) -> tuple:
+def fetch_registry_balances(registry: WalletRegistry, indices: list = None, batch_size: int = 100,
+                            block_number: int = None, strict: bool = False) -> int:
     """
-    Проверяет баланс адреса
-    
-    :return: (адрес, баланс в ETH)
+    Запрашивает балансы кошельков реестра JSON-RPC батчами и пишет их
+    прямо в массивы реестра, без промежуточного словаря
+
+    :param indices: номера кошельков (по умолчанию все)
+    :param strict: при любой ошибке бросить исключение и не менять реестр
+        (режим наблюдения: блоки будут обработаны заново)
+    :return: сколько балансов получено
     """
-    try:
-        address = get_address_from_private_key(private_key)
-        balance_wei = w3.eth.get_balance(address)
-        balance_eth = w3.from_wei(balance_wei, 'ether')
-        return address, float(balance_eth)
-    except Exception as e:
-        print(f"Ошибка при проверке баланса: {str(e)}")
-        return None, None
+    block = hex(block_number) if block_number is not None else 'latest'
+    fetched = 0
+    updates = []
+    for chunk in chunked(range(len(registry)) if indices is None else indices, batch_size):
+        addresses = registry.addresses(chunk)
+        try:
+            results = batch_request(rpc_pool, [('eth_getBalance', [address, block]) for address in addresses])
+        except Exception as e:
+            if strict:
+                raise
+            print(f"Ошибка при запросе балансов: {str(e)}")
+            continue
+
+        for index, address, result in zip(chunk, addresses, results):
+            if isinstance(result, RPCError):
+                if strict:
+                    raise result
+                print(f"Ошибка при проверке баланса {address}: {str(result)}")
+                continue
+            if strict:
+                updates.append((index, int(result, 16)))
+            else:
+                registry.set_balance(index, int(result, 16))
+            fetched += 1
+    for index, balance_wei in updates:
+        registry.set_balance(index, balance_wei)
+    return fetched
 
-def check_balances_from_csv(filename: str):
+def check_balances_from_csv(filename: str, batch_size: int = 100, block_number: int = None, min_balance: float = 0):
     """
     Проверяет балансы всех адресов из CSV файла
+
+    :param batch_size: сколько адресов запрашивать одним батчем
+    :param block_number: номер блока для среза; None - текущий блок
+    :param min_balance: выводить только адреса с балансом больше (ETH)
     """
     if not os.path.exists(filename):
         print(f"Файл {filename} не найден")
         return
     
-    print("\nПроверка балансов...")
-    print("=" * 100)
-    print(f"{'Адрес':42} | {'Тип':12} | {'Баланс ETH':15}")
-    print("=" * 100)
-    
-    # Словари для хранения уникальных адресов и их балансов
-    unique_addresses = {}
-    address_types = {}
-    
     try:
-        with open(filename, 'r') as file:
-            reader = csv.reader(file)
-            next(reader, None)  # Пропускаем заголовок
-            
-            for row in reader:
-                if len(row) >= 2:
-                    # Проверяем отправителей
-                    from_address, from_balance = check_balance(row[0].strip())
-                    if from_address and from_balance is not None:
-                        unique_addresses[from_address] = from_balance
-                        address_types[from_address] = "Отправитель"
-                    
-                    # Проверяем получателей
-                    to_address, to_balance = check_balance(row[1].strip())
-                    if to_address and to_balance is not None:
-                        unique_addresses[to_address] = to_balance
-                        # Если адрес уже является отправителем, добавляем информацию
-                        if to_address in address_types:
-                            address_types[to_address] = "Отпр/Получ"
-                        else:
-                            address_types[to_address] = "Получатель"
+        # Уникальные адреса и их роли в компактном реестре (ключи не нужны)
+        registry = WalletRegistry.from_csv(
+            filename, lambda index, e: print(f"Ошибка ключа в строке {index}: {str(e)}"), keep_keys=False
+        )
+        
+        # Все балансы берем с одного блока, чтобы срез был согласованным
+        if block_number is None:
+            block_number = w3.eth.block_number
+        
+        print("\nПроверка балансов...")
+        print(f"Блок: {block_number}, адресов: {len(registry)}")
+        print("=" * 100)
+        print(f"{'Адрес':42} | {'Тип':12} | {'Баланс ETH':15}")
+        print("=" * 100)
+        
+        fetched = fetch_registry_balances(registry, batch_size=batch_size, block_number=block_number)
         
         # Выводим уникальные адреса
-        total_balance = 0
-        for address, balance in unique_addresses.items():
-            addr_type = address_types[address]
-            print(f"{address} | {addr_type:12} | {balance:15.6f}")
-            total_balance += balance
+        shown = registry.select(w3.to_wei(min_balance, 'ether')) if min_balance else registry.indices(known=True)
+        for index in shown:
+            balance = float(w3.from_wei(registry.balance(index), 'ether'))
+            print(f"{registry.address(index)} | {ROLE_NAMES[registry.role(index)]:12} | {balance:15.6f}")
         
         print("=" * 100)
-        print(f"Общий баланс всех уникальных кошельков: {total_balance:.6f} ETH")
-        print(f"Всего уникальных адресов: {len(unique_addresses)}")
+        print(f"Общий баланс всех уникальных кошельков: {float(w3.from_wei(registry.total(), 'ether')):.6f} ETH")
+        print(f"Всего уникальных адресов: {len(registry)}")
+        if fetched < len(registry):
+            print(f"Балансы получены для {fetched} из {len(registry)} адресов")
         
     except Exception as e:
         print(f"Ошибка при чтении файла: {str(e)}")
 
+def print_balance_change(address: str, role: str, old_wei: int, new_wei: int, block_number: int):
+    """Колбэк наблюдения по умолчанию: строка изменения в вывод"""
+    # from_wei не принимает отрицательные значения
+    delta = float(Web3.from_wei(abs(new_wei - old_wei), 'ether')) * (1 if new_wei >= old_wei else -1)
+    balance = float(Web3.from_wei(new_wei, 'ether'))
+    print(f"[блок {block_number}] {address} | {role:12} | {delta:+15.6f} | {balance:15.6f}", flush=True)
+
+class BalanceWatcher:
+    """
+    Следит за балансами кошельков реестра по новым блокам: из транзакций
+    блоков берутся отправители и получатели, заново запрашиваются только
+    те из них, что есть в реестре. Число запросов растет с активностью
+    кошельков, а не с их количеством.
+    Переводы ETH изнутри контрактов (Disperse и т.п.) в полях from/to не
+    видны - для них full_refresh_blocks задает периодический полный срез
+    """
+
+    def __init__(self, registry: WalletRegistry, on_change=print_balance_change, batch_size: int = 100,
+                 full_refresh_blocks: int = 0):
+        self.registry = registry
+        self.on_change = on_change
+        self.batch_size = batch_size
+        self.full_refresh_blocks = full_refresh_blocks
+        self.last_block = None
+        self.last_hash = None
+        self.last_full = None
+        self.stats = {'blocks': 0, 'requeried': 0, 'changes': 0, 'full_refreshes': 0}
+
+    def start(self, block_number: int = None):
+        """Полный срез балансов на блоке block_number (по умолчанию текущий)"""
+        if block_number is None:
+            block_number = int(batch_request(rpc_pool, [('eth_blockNumber', [])])[0], 16)
+        self._refresh(None, block_number)
+        block = batch_request(rpc_pool, [('eth_getBlockByNumber', [hex(block_number), False])])[0]
+        if isinstance(block, RPCError):
+            raise block
+        self.last_block, self.last_hash, self.last_full = block_number, block['hash'], block_number
+
+    def advance(self, head: int = None) -> int:
+        """
+        Обрабатывает блоки с last_block + 1 до head и перезапрашивает затронутые
+        кошельки на блоке head. При смене родителя (реорг) делается полный срез
+
+        :return: число изменившихся балансов
+        """
+        if head is None:
+            head = int(batch_request(rpc_pool, [('eth_blockNumber', [])])[0], 16)
+        if head <= self.last_block:
+            return 0
+
+        touched = set()
+        parent_hash = self.last_hash
+        numbers = range(self.last_block + 1, head + 1)
+        for chunk in chunked(numbers, BLOCKS_PER_BATCH):
+            blocks = batch_request(rpc_pool, [('eth_getBlockByNumber', [hex(number), True]) for number in chunk])
+            for number, block in zip(chunk, blocks):
+                if isinstance(block, RPCError):
+                    raise block
+                if block is None:
+                    raise Exception(f"блок {number} еще недоступен")
+                if block['parentHash'] != parent_hash:
+                    print(f"Реорганизация на блоке {number}: полный срез балансов", flush=True)
+                    return self._finish(self._refresh(None, head), head, self._head_hash(head), full=True)
+                parent_hash = block['hash']
+                for transaction in block['transactions']:
+                    for field in ('from', 'to'):
+                        address = transaction.get(field)
+                        if address:
+                            index = self.registry.find(address)
+                            if index >= 0:
+                                touched.add(index)
+
+        # Ошибка запроса балансов выходит наружу до _finish: last_block остается прежним
+        if self.full_refresh_blocks and head - self.last_full >= self.full_refresh_blocks:
+            changes = self._refresh(None, head)
+            self.stats['blocks'] += len(numbers)
+            return self._finish(changes, head, parent_hash, full=True)
+        changes = self._refresh(sorted(touched), head)
+        self.stats['blocks'] += len(numbers)
+        self.stats['requeried'] += len(touched)
+        return self._finish(changes, head, parent_hash)
+
+    def _head_hash(self, head: int) -> str:
+        block = batch_request(rpc_pool, [('eth_getBlockByNumber', [hex(head), False])])[0]
+        if isinstance(block, RPCError):
+            raise block
+        return block['hash']
+
+    def _finish(self, changes: int, head: int, head_hash: str, full: bool = False) -> int:
+        self.last_block, self.last_hash = head, head_hash
+        if full:
+            self.last_full = head
+            self.stats['full_refreshes'] += 1
+        self.stats['changes'] += changes
+        return changes
+
+    def _refresh(self, indices: list, block_number: int) -> int:
+        """Перезапрашивает балансы (None - все) и сообщает об изменившихся"""
+        registry = self.registry
+        previous = {index: registry.balance(index) for index in indices} if indices is not None else None
+        if previous is None and self.last_block is not None:
+            # Полный срез после старта: старые значения нужны для дельт
+            previous = {index: registry.balance(index) for index in registry.indices(known=True)}
+        fetch_registry_balances(registry, indices, self.batch_size, block_number, strict=True)
+        if previous is None or self.on_change is None:
+            return 0
+
+        changes = 0
+        for index, old_balance in previous.items():
+            new_balance = registry.balance(index)
+            if old_balance is not None and new_balance != old_balance:
+                changes += 1
+                self.on_change(registry.address(index), ROLE_NAMES.get(registry.role(index), ''),
+                               old_balance, new_balance, block_number)
+        return changes
+
+def poll_new_heads(poll_interval: float = WATCH_POLL_INTERVAL, stop: threading.Event = None):
+    """Номера новых блоков опросом eth_blockNumber"""
+    stop = stop or threading.Event()
+    last = None
+    while not stop.is_set():
+        try:
+            head = int(batch_request(rpc_pool, [('eth_blockNumber', [])])[0], 16)
+            if head != last:
+                last = head
+                yield head
+        except Exception as e:
+            print(f"Ошибка при запросе номера блока: {str(e)}", flush=True)
+        stop.wait(poll_interval)
+
+def subscribe_new_heads(ws_url: str, stop: threading.Event = None, reconnect_delay: float = 5.0):
+    """
+    Номера новых блоков по подписке eth_subscribe("newHeads") через websocket.
+    После обрыва подключается заново: пропущенные блоки догоняет advance()
+    """
+    from websockets.sync.client import connect
+
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            with connect(ws_url) as connection:
+                connection.send(json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe', 'params': ['newHeads']}))
+                reply = json.loads(connection.recv(timeout=30))
+                if 'error' in reply:
+                    raise Exception(reply['error'].get('message'))
+                subscription = reply['result']
+                while not stop.is_set():
+                    try:
+                        message = json.loads(connection.recv(timeout=1))
+                    except TimeoutError:
+                        continue
+                    params = message.get('params') or {}
+                    if params.get('subscription') == subscription:
+                        yield int(params['result']['number'], 16)
+        except Exception as e:
+            print(f"Ошибка подписки на блоки: {str(e)}, повтор через {reconnect_delay} с", flush=True)
+            stop.wait(reconnect_delay)
+
+def watch_balances(filename: str, poll_interval: float = WATCH_POLL_INTERVAL, ws_url: str = None,
+                   batch_size: int = 100, full_refresh_blocks: int = 0, on_change=print_balance_change,
+                   stop: threading.Event = None) -> BalanceWatcher:
+    """
+    Наблюдение за балансами адресов из CSV: один полный срез, затем по
+    каждому новому блоку (подписка ws_url или опрос раз в poll_interval)
+    перезапрашиваются только кошельки из транзакций этих блоков,
+    изменения выводятся по мере появления. Останавливается по stop или Ctrl+C
+    """
+    if not os.path.exists(filename):
+        print(f"Файл {filename} не найден")
+        return None
+
+    registry = WalletRegistry.from_csv(
+        filename, lambda index, e: print(f"Ошибка ключа в строке {index}: {str(e)}"), keep_keys=False
+    )
+    watcher = BalanceWatcher(registry, on_change, batch_size, full_refresh_blocks)
+    watcher.start()
+    print(f"Наблюдение за {len(registry)} адресами с блока {watcher.last_block}, "
+          f"общий баланс {float(w3.from_wei(registry.total(), 'ether')):.6f} ETH", flush=True)
+
+    heads = subscribe_new_heads(ws_url, stop) if ws_url else poll_new_heads(poll_interval, stop)
+    try:
+        for head in heads:
+            try:
+                watcher.advance(head)
+            except Exception as e:
+                # last_block не сдвинулся: блоки будут обработаны со следующим
+                print(f"Ошибка при обработке блоков до {head}: {str(e)}", flush=True)
+    except KeyboardInterrupt:
+        pass
+
+    stats = watcher.stats
+    print(f"Блоков: {stats['blocks']}, перезапрошено адресов: {stats['requeried']}, "
+          f"изменений: {stats['changes']}, полных срезов: {stats['full_refreshes']}", flush=True)
+    return watcher
+
 if __name__ == "__main__":
     import sys
     import io
@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from web3 import Web3, AsyncWeb3
+
+from eth_account import Account
+from mock_rpc import MockChain, MockRPCServer
+from rpc_pool import RPCPool, PooledHTTPProvider, AsyncPooledHTTPProvider
+from nonce_manager import NonceManager, AsyncNonceManager
+from receipt_tracker import ReceiptTracker, CONFIRMED
+from gas_cache import GasCache
+import main
+import collector
+import token_collector
+
+WORKFLOWS = ('distribute', 'collect-eth', 'collect-nft')
+SIZES = (10, 1000, 10000)
+
+DESTINATION = Web3.to_checksum_address('0x' + 'ab' * 20)
+AMOUNT = 0.0031
+FUNDING = Web3.to_wei(10, 'ether')
+TOKENS_PER_HOLDER = 3
+
+def synthetic_key(seed: int) -> str:
+    """Детерминированный приватный ключ для синтетических кошельков"""
+    return '%064x' % (seed + 1)
+
+def generate_wallets_csv(path: str, rows: int, senders: int = None) -> list:
+    """
+    Пишет синтетический wallets.csv: rows строк, отправители повторяются
+    (по умолчанию один отправитель на 10 строк), получатели уникальны
+
+    :return: список строк (from_private_key, to_private_key)
+    """
+    senders = senders or max(1, rows // 10)
+    wallets = [(synthetic_key(index % senders), synthetic_key(1_000_000 + index)) for index in range(rows)]
+    with open(path, 'w', newline='') as file:
+        file.write('from_private_key,to_private_key\n')
+        for from_private_key, to_private_key in wallets:
+            file.write(f"{from_private_key},{to_private_key}\n")
+    return wallets
+
+class LatencyRecorder:
+    """Засекает время от постановки хэша в трекер до подтверждения"""
+
+    def __init__(self, tracker: ReceiptTracker):
+        self.latencies = []
+        self.confirmed = 0
+        self._lock = threading.Lock()
+        original_track = tracker.track
+
+        def track(tx_hash, callback=None, timeout=None):
+            started = time.monotonic()
+
+            def on_receipt(hash_, status, receipt):
+                with self._lock:
+                    self.latencies.append(time.monotonic() - started)
+                    if status == CONFIRMED:
+                        self.confirmed += 1
+                if callback is not None:
+                    callback(hash_, status, receipt)
+
+            return original_track(tx_hash, on_receipt, timeout)
+
+        tracker.track = track
+
+    def percentile(self, fraction: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def configure(module, url: str, poll_interval: float):
+    """Переключает общие объекты модуля на локальный RPC"""
+    module.rpc_pool = RPCPool([url])
+    module.w3 = Web3(PooledHTTPProvider(module.rpc_pool))
+    module.receipt_tracker = ReceiptTracker(module.rpc_pool, poll_interval=poll_interval)
+    module.gas_cache = GasCache(module.w3)
+    module.receipt_tracker.add_block_listener(module.gas_cache.on_block)
+    if hasattr(module, 'nonce_manager'):
+        module.nonce_manager = NonceManager(module.w3)
+    if hasattr(module, 'aw3'):
+        module.RPC_URL = url
+        module.aw3 = AsyncWeb3(AsyncPooledHTTPProvider(module.rpc_pool))
+        module.async_nonce_manager = AsyncNonceManager(module.aw3)
+    if hasattr(module, 'nft_contract'):
+        module.nft_contract = module.w3.eth.contract(address=module.NFT_ADDRESS, abi=module.load_nft_abi())
+    module.log_message = lambda message, level=None: None
+    return LatencyRecorder(module.receipt_tracker)
+
+def run_workflow(workflow: str, rows: int, latency: float = 0.0, error_rate: float = 0.0,
+                 concurrency: int = main.CONCURRENCY, poll_interval: float = 0.2) -> dict:
+    """Прогоняет один сценарий на свежей локальной цепочке и возвращает метрики"""
+    chain = MockChain(token_collector.NFT_ADDRESS, token_collector.load_nft_abi())
+    server = MockRPCServer(chain, latency=latency, error_rate=error_rate)
+    url = server.start()
+
+    with tempfile.TemporaryDirectory() as folder:
+        csv_path = os.path.join(folder, 'wallets.csv')
+        wallets = generate_wallets_csv(csv_path, rows)
+
+        if workflow == 'distribute':
+            module = main
+            for from_private_key in {row[0] for row in wallets}:
+                chain.fund(Account.from_key(from_private_key).address, FUNDING)
+        else:
+            module = collector if workflow == 'collect-eth' else token_collector
+            next_token = 1
+            for private_key in {key for row in wallets for key in row}:
+                address = Account.from_key(private_key).address
+                chain.fund(address, Web3.to_wei(0.01, 'ether'))
+                if workflow == 'collect-nft':
+                    chain.mint(address, range(next_token, next_token + TOKENS_PER_HOLDER))
+                    next_token += TOKENS_PER_HOLDER
+
+        recorder = configure(module, url, poll_interval)
+        # Подготовка цепочки в метрики не входит
+        calls_before, requests_before = server.rpc_calls(), server.requests
+
+        started = time.monotonic()
+        if workflow == 'distribute':
+            if concurrency > 1:
+                asyncio.run(main.process_csv_async(csv_path, AMOUNT, concurrency=concurrency))
+            else:
+                main.process_csv(csv_path, AMOUNT)
+        elif workflow == 'collect-eth':
+            collector.collect_from_csv(csv_path, DESTINATION)
+        else:
+            token_collector.collect_nfts_from_csv(csv_path, DESTINATION)
+        module.receipt_tracker.wait_all()
+        elapsed = time.monotonic() - started
+
+    module.receipt_tracker.stop()
+    server.stop()
+
+    transactions = len(recorder.latencies)
+    calls = server.rpc_calls() - calls_before
+    return {
+        'workflow': workflow,
+        'rows': rows,
+        'latency_ms': latency * 1000,
+        'error_rate': error_rate,
+        'transactions': transactions,
+        'confirmed': recorder.confirmed,
+        'seconds': round(elapsed, 3),
+        'tx_per_sec': round(transactions / elapsed, 1) if elapsed else 0.0,
+        'rpc_per_tx': round(calls / transactions, 2) if transactions else None,
+        'http_per_tx': round((server.requests - requests_before) / transactions, 2) if transactions else None,
+        'http_429': server.failures,
+        'p50_ms': round(recorder.percentile(0.50) * 1000, 1),
+        'p99_ms': round(recorder.percentile(0.99) * 1000, 1),
+    }
+
+def print_report(results: list):
+    columns = ['workflow', 'rows', 'transactions', 'confirmed', 'seconds', 'tx_per_sec', 'rpc_per_tx',
+               'http_per_tx', 'http_429', 'p50_ms', 'p99_ms']
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print('  '.join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+    sys.stdout.flush()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк рассылки и сбора на локальном mock RPC (chainId 2741)")
+    parser.add_argument('--workflows', default=','.join(WORKFLOWS), help="сценарии через запятую")
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help="размеры wallets.csv через запятую")
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка RPC в миллисекундах")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов HTTP 429")
+    parser.add_argument('--concurrency', type=int, default=main.CONCURRENCY, help="потоков рассылки (1 - последовательно)")
+    parser.add_argument('--poll-interval', type=float, default=0.2, help="период опроса квитанций, секунд")
+    parser.add_argument('--json', help="дописать результаты в JSONL-файл")
+    args = parser.parse_args()
+
+    results = []
+    for workflow in args.workflows.split(','):
+        for rows in map(int, args.sizes.split(',')):
+            result = run_workflow(workflow, rows, args.latency / 1000, args.error_rate, args.concurrency,
+                                  args.poll_interval)
+            results.append(result)
+            print_report([result])
+
+    print()
+    print_report(results)
+    if args.json:
+        with open(args.json, 'a') as file:
+            for result in results:
+                file.write(json.dumps(result) + '\n')
@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import io
+import os
+import sys
+
+# Единая точка входа: python cli.py <команда> [параметры].
+# Скрипты импортируются только для выбранной команды и после core.configure(),
+# поэтому все команды одного процесса используют общий пул RPC и кэши
+
+def run_distribute(args):
+    import main
+    journal = open_journal(args, "main.journal.jsonl")
+    only_rows = load_plan(args, 'distribute')
+    if args.disperse_address:
+        main.process_csv_disperse(args.csv, args.amount, args.disperse_address, start_from=args.start_from,
+                                  journal=journal, only_rows=only_rows)
+    elif args.schedule_fees:
+        # Параллелизм не нужен: планировщик сам выпускает переводы пачками
+        main.process_csv(args.csv, args.amount, start_from=args.start_from, journal=journal, only_rows=only_rows,
+                         scheduler=open_scheduler(args))
+    elif args.concurrency > 1:
+        asyncio.run(main.process_csv_async(args.csv, args.amount, concurrency=args.concurrency,
+                                           start_from=args.start_from, journal=journal, only_rows=only_rows))
+    else:
+        main.process_csv(args.csv, args.amount, start_from=args.start_from, journal=journal, only_rows=only_rows)
+
+def run_collect_eth(args):
+    import collector
+    collector.collect_from_csv(args.csv, args.to, open_journal(args, "collector.journal.jsonl"),
+                               concurrency=args.concurrency, only_addresses=load_plan(args, 'collect-eth'),
+                               scheduler=open_scheduler(args) if args.schedule_fees else None)
+
+def run_collect_nft(args):
+    import token_collector
+    operator_private_key = args.operator_key or os.environ.get('OPERATOR_PRIVATE_KEY')
+    index = token_collector.open_nft_index(args.nft_index) if args.nft_index else None
+    token_collector.collect_nfts_from_csv(args.csv, args.to, operator_private_key=operator_private_key,
+                                          journal=open_journal(args, "token_collector.journal.jsonl"),
+                                          inventory=load_plan(args, 'collect-nft'), index=index)
+
+def run_collect_tokens(args):
+    import multi_collector
+    if args.asset:
+        assets = [multi_collector.parse_asset(spec) for spec in args.asset]
+    else:
+        from token_collector import NFT_ADDRESS
+        assets = [multi_collector.Asset(multi_collector.ERC721, NFT_ADDRESS)]
+    # Ключи токенов совпадают с collect-nft, журнал общий
+    multi_collector.collect_assets_from_csv(args.csv, args.to, assets,
+                                            journal=open_journal(args, "token_collector.journal.jsonl"),
+                                            concurrency=args.concurrency)
+
+def run_index_nft(args):
+    import core
+    import token_collector
+    token_collector.open_nft_index(args.db, args.from_block).sync(core.rpc_pool, chunk_blocks=args.chunk_blocks)
+
+def run_plan(args):
+    import simulate
+    operator_private_key = args.operator_key or os.environ.get('OPERATOR_PRIVATE_KEY')
+    simulate.plan_from_csv(args.csv, args.out, amount=args.amount, destination_address=args.to,
+                           workflows=tuple(args.workflows.split(',')), operator_private_key=operator_private_key,
+                           block_number=args.block)
+
+def run_balances(args):
+    import balance
+    if args.watch:
+        balance.watch_balances(args.csv, poll_interval=args.poll_interval, ws_url=args.ws_url, batch_size=args.batch_size,
+                               full_refresh_blocks=args.full_refresh_blocks)
+        return
+    balance.check_balances_from_csv(args.csv, batch_size=args.batch_size, block_number=args.block,
+                                    min_balance=args.min_balance)
+
+def run_sign(args):
+    import offline
+    offline.sign_distribution(args.csv, args.amount, args.out, start_from=args.start_from,
+                              journal=open_journal(args, "main.journal.jsonl"), workers=args.workers)
+
+def run_broadcast(args):
+    import offline
+    offline.broadcast_signed(args.file, journal=open_journal(args, "main.journal.jsonl"), batch_size=args.batch_size)
+
+def load_plan(args, workflow: str):
+    """Шаги режима из плана пробного прогона (--plan) или None"""
+    if not args.plan:
+        return None
+    import simulate
+    return simulate.load_plan(args.plan)[workflow]
+
+def open_scheduler(args):
+    """Планировщик комиссий EIP-1559 (fee_engine) по флагам --max-fee-gwei и --fee-wait"""
+    import fee_engine
+    return fee_engine.make_scheduler(target_gwei=args.max_fee_gwei, max_wait=args.fee_wait)
+
+def add_fee_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--schedule-fees', action='store_true',
+                        help="EIP-1559: ждать дешевого окна и заменять застрявшие транзакции")
+    parser.add_argument('--max-fee-gwei', type=float,
+                        help="потолок maxFeePerGas в gwei (по умолчанию медианная цена за последние блоки)")
+    parser.add_argument('--fee-wait', type=float, help="сколько секунд ждать дешевого окна (по умолчанию 900)")
+
+def open_journal(args, default_path: str):
+    """Журнал только по явному запросу: --resume (файл команды по умолчанию) или --journal ФАЙЛ.
+    Без них запуск обрабатывает все строки, даже если прошлый запуск их уже отправил"""
+    from journal import RunJournal
+    if args.journal:
+        return RunJournal(args.journal)
+    return RunJournal(default_path) if args.resume else None
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Рассылка и сбор ETH/NFT в сети Abstract")
+    parser.add_argument('--rpc', action='append', help="адрес RPC (можно указать несколько раз)")
+    parser.add_argument('--chain-id', type=int, help="chainId сети (по умолчанию 2741)")
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help="подробность логов")
+    parser.add_argument('--csv', default="wallets.csv", help="файл с приватными ключами")
+    parser.add_argument('--journal', help="файл журнала запуска: продолжить с места остановки")
+    parser.add_argument('--resume', action='store_true',
+                        help="продолжить прерванный запуск по журналу команды по умолчанию")
+    parser.add_argument('--plan', help="план пробного прогона: выполняются только шаги из него")
+    parser.add_argument('--address-index',
+                        help="зашифрованный индекс адресов ключей (пароль в ADDRESS_INDEX_PASSWORD)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    distribute = commands.add_parser('distribute', help="раскидать ETH по строкам CSV")
+    distribute.add_argument('--amount', type=float, required=True, help="сумма в ETH на каждую строку")
+    distribute.add_argument('--concurrency', type=int, default=10, help="параллельных отправок (1 - по очереди)")
+    distribute.add_argument('--start-from', type=int, default=1, help="с какой строки начать")
+    distribute.add_argument('--disperse-address', help="контракт Disperse: одна транзакция на отправителя")
+    add_fee_arguments(distribute)
+    distribute.set_defaults(handler=run_distribute)
+
+    collect_eth = commands.add_parser('collect-eth', help="собрать ETH со всех ключей")
+    collect_eth.add_argument('--to', required=True, help="адрес для сбора")
+    collect_eth.add_argument('--concurrency', type=int, default=20, help="параллельных отправок")
+    add_fee_arguments(collect_eth)
+    collect_eth.set_defaults(handler=run_collect_eth)
+
+    collect_nft = commands.add_parser('collect-nft', help="собрать NFT со всех ключей")
+    collect_nft.add_argument('--to', required=True, help="адрес для сбора")
+    collect_nft.add_argument('--operator-key', help="ключ оператора (или OPERATOR_PRIVATE_KEY)")
+    collect_nft.add_argument('--nft-index', help="файл индекса владельцев (index-nft) вместо tokensOfOwner")
+    collect_nft.set_defaults(handler=run_collect_nft)
+
+    collect_tokens = commands.add_parser('collect-tokens', help="собрать токены нескольких контрактов за один проход")
+    collect_tokens.add_argument('--to', required=True, help="адрес для сбора")
+    collect_tokens.add_argument('--asset', action='append',
+                                help="контракт erc721:0x... или erc20:0x... (можно несколько; по умолчанию NFT коллекции)")
+    collect_tokens.add_argument('--concurrency', type=int, default=20, help="кошельков параллельно")
+    collect_tokens.set_defaults(handler=run_collect_tokens)
+
+    index_nft = commands.add_parser('index-nft', help="обновить локальный индекс владельцев NFT по событиям")
+    index_nft.add_argument('--db', default="nft_index.sqlite", help="файл индекса SQLite")
+    index_nft.add_argument('--from-block', type=int, default=0, help="блок создания контракта (для первого запуска)")
+    index_nft.add_argument('--chunk-blocks', type=int, default=5000, help="блоков в одном eth_getLogs")
+    index_nft.set_defaults(handler=run_index_nft)
+
+    sign = commands.add_parser('sign', help="подписать рассылку заранее, без отправки")
+    sign.add_argument('--amount', type=float, required=True, help="сумма в ETH на каждую строку")
+    sign.add_argument('--out', default="signed.jsonl", help="файл подписанных транзакций")
+    sign.add_argument('--workers', type=int, help="процессов подписи (по умолчанию по числу ядер)")
+    sign.add_argument('--start-from', type=int, default=1, help="с какой строки начать")
+    sign.set_defaults(handler=run_sign)
+
+    broadcast = commands.add_parser('broadcast', help="отправить заранее подписанные транзакции")
+    broadcast.add_argument('--file', default="signed.jsonl", help="файл подписанных транзакций")
+    broadcast.add_argument('--batch-size', type=int, default=50, help="транзакций в одном батче")
+    broadcast.set_defaults(handler=run_broadcast)
+
+    plan = commands.add_parser('plan', help="пробный прогон на одном блоке без отправки, пишет план")
+    plan.add_argument('--workflows', default="distribute,collect-nft,collect-eth",
+                      help="режимы по порядку через запятую")
+    plan.add_argument('--amount', type=float, help="сумма рассылки в ETH на каждую строку")
+    plan.add_argument('--to', help="адрес для сбора")
+    plan.add_argument('--operator-key', help="ключ оператора для сбора NFT (или OPERATOR_PRIVATE_KEY)")
+    plan.add_argument('--block', type=int, help="номер блока для среза")
+    plan.add_argument('--out', default="plan.jsonl", help="файл плана")
+    plan.set_defaults(handler=run_plan)
+
+    balances = commands.add_parser('balances', help="балансы всех адресов из CSV")
+    balances.add_argument('--batch-size', type=int, default=100, help="адресов в одном батче")
+    balances.add_argument('--block', type=int, help="номер блока для среза")
+    balances.add_argument('--min-balance', type=float, default=0, help="показывать только адреса с балансом больше (ETH)")
+    balances.add_argument('--watch', action='store_true', help="следить за изменениями по новым блокам")
+    balances.add_argument('--ws-url', help="websocket RPC для подписки newHeads (без него - опрос)")
+    balances.add_argument('--poll-interval', type=float, default=2.0, help="секунд между опросами номера блока")
+    balances.add_argument('--full-refresh-blocks', type=int, default=0,
+                          help="полный срез раз в N блоков (переводы изнутри контрактов), 0 - никогда")
+    balances.set_defaults(handler=run_balances)
+
+    return parser
+
+def main(argv: list = None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.log_level:
+        from logger import logger, LEVELS
+        logger.level = LEVELS[args.log_level]
+
+    if args.rpc or args.chain_id:
+        import core
+        core.configure(args.rpc, args.chain_id)
+
+    if args.address_index:
+        if not os.environ.get('ADDRESS_INDEX_PASSWORD'):
+            parser.error("для --address-index нужен пароль в переменной ADDRESS_INDEX_PASSWORD")
+        from wallets import use_address_index
+        use_address_index(args.address_index, os.environ['ADDRESS_INDEX_PASSWORD'])
+
+    args.handler(args)
+
+if __name__ == "__main__":
+    # Вывод буферизуется логгером, write_through не нужен
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    main()
@@ -1,172 +1,269 @@
 from web3 import Web3
-import time
-from eth_account import Account
-import json
-import csv
 import os
 import sys
 import io
-from datetime import datetime
+from logger import log_message, ERROR
+from concurrent.futures import ThreadPoolExecutor
+from receipt_tracker import CONFIRMED
+from wallets import load_account, iter_unique_keys
+from journal import RunJournal, PENDING, BROADCAST, FAILED
+from rpc import batch_request, chunked, RPCError
+from nonce_manager import send_raw_transaction
 
-# RPC
-RPC_URL = "https://api.mainnet.abs.xyz"
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+# RPC, трекер подтверждений и кэш газа общие для всех скриптов (core.py)
+from core import CHAIN_ID, rpc_pool, w3, receipt_tracker, gas_cache
 
-def log_message(message: str):
-    """Функция для логирования с принудительным выводом"""
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
-    sys.stdout.flush()
+# Кошельки, где после оплаты газа остается не больше этого (в wei), не собираются
+DUST_THRESHOLD_WEI = Web3.to_wei(0.000001, 'ether')
+# Сколько кошельков отправляется одновременно и сколько ключей в одной пачке
+SWEEP_CONCURRENCY = 20
+SWEEP_BATCH_SIZE = 1000
 
-def get_address_from_private_key(private_key: str) -> str:
-    if private_key.startswith('0x'):
-        private_key = private_key[2:]
-    account = Account.from_key(private_key)
-    return account.address
+def log_confirmation(tx_hash: str, status: str, receipt):
+    """Колбэк трекера подтверждений"""
+    if status == CONFIRMED:
+        log_message(f"✅ Сбор подтвержден: {tx_hash}")
+    else:
+        log_message(f"❌ Транзакция {tx_hash}: {status}", ERROR)
 
-def collect_eth(from_private_key: str, to_address: str):
-    """Собирает все ETH с адреса"""
-    try:
-        # Создаем аккаунт отправителя
-        if from_private_key.startswith('0x'):
-            from_private_key = from_private_key[2:]
-        account = Account.from_key(from_private_key)
-        sender_address = account.address
-        
-        log_message(f"👤 Проверка баланса: {sender_address}")
-        
-        # Проверяем баланс
-        balance = w3.eth.get_balance(sender_address)
-        balance_eth = w3.from_wei(balance, 'ether')
-        
-        if balance_eth <= 0:
-            log_message(f"⚠️ Пропуск: нулевой баланс")
-            return False
-            
-        log_message(f"💰 Найдено: {balance_eth} ETH")
-        
+def log_invalid_row(index: int, error: Exception):
+    """Колбэк потокового чтения CSV для битых строк"""
+    log_message(f"❌ Ошибка ключа в строке {index}: {str(error)}", ERROR)
+
+def collection_key(address: str) -> str:
+    """Ключ кошелька в журнале сбора"""
+    return f"collect-eth:{address}"
+
+def sweepable_amount(balance: int, gas: int, gas_price: int) -> int:
+    """Сколько wei можно вывести: баланс минус максимальная плата за газ"""
+    return balance - gas * gas_price
+
+def plan_sweeps(private_keys: list, destination_address: str, journal: RunJournal = None,
+                dust_threshold: int = DUST_THRESHOLD_WEI, batch_size: int = 100, only_addresses: set = None) -> list:
+    """
+    Готовит сбор для пачки кошельков: балансы и pending nonce всех
+    кошельков одним срезом батчей JSON-RPC, одна цена газа и одна оценка
+    газа на всю пачку, суммы считаются в wei. Кошельки, где после оплаты
+    газа остается не больше dust_threshold, отбрасываются сразу.
+    only_addresses - адреса из плана пробного прогона (simulate.py)
+
+    :return: список (account, nonce, value, gas, gas_price)
+    """
+    accounts = []
+    for private_key in private_keys:
+        try:
+            account = load_account(private_key)
+        except Exception as e:
+            log_message(f"❌ Ошибка ключа: {str(e)}", ERROR)
+            continue
+        if only_addresses is not None and account.address not in only_addresses:
+            continue
+        if journal is not None and journal.should_skip(collection_key(account.address)):
+            continue
+        accounts.append(account)
+    if not accounts:
+        return []
+
+    # Срез балансов и nonce по одному блоку
+    block = hex(w3.eth.block_number)
+    snapshot = {}
+    for chunk in chunked(accounts, batch_size // 2):
+        calls = []
+        for account in chunk:
+            calls.append(('eth_getBalance', [account.address, block]))
+            calls.append(('eth_getTransactionCount', [account.address, 'pending']))
+        results = batch_request(rpc_pool, calls)
+        for index, account in enumerate(chunk):
+            balance, nonce = results[2 * index], results[2 * index + 1]
+            if isinstance(balance, RPCError) or isinstance(nonce, RPCError):
+                log_message(f"❌ Ошибка среза {account.address}: {str(balance if isinstance(balance, RPCError) else nonce)}", ERROR)
+                continue
+            snapshot[account.address] = (int(balance, 16), int(nonce, 16))
+
+    # Одна котировка газа на всю пачку
+    gas_estimate = gas_cache.estimate_gas(('transfer',), {
+        'from': accounts[0].address,
+        'to': Web3.to_checksum_address(destination_address),
+        'value': 0
+    })
+    gas_price = gas_cache.gas_price()
+
+    plans = []
+    for account in accounts:
+        if account.address not in snapshot:
+            continue
+        balance, nonce = snapshot[account.address]
+        value = sweepable_amount(balance, gas_estimate, gas_price)
+        if value <= dust_threshold:
+            continue
+        plans.append((account, nonce, value, gas_estimate, gas_price))
+    return plans
+
+def sweep(plans: list, destination_address: str, journal: RunJournal = None,
+          concurrency: int = SWEEP_CONCURRENCY) -> int:
+    """
+    Отправляет подготовленные plan_sweeps переводы параллельно по кошелькам,
+    подтверждения отслеживает общий трекер
+
+    :return: число отправленных транзакций
+    """
+    to_address = Web3.to_checksum_address(destination_address)
+
+    def send(plan):
+        account, nonce, value, gas, gas_price = plan
+        journal_key = collection_key(account.address)
         try:
-            nonce = w3.eth.get_transaction_count(sender_address)
-            
-            # Создаем транзакцию без газа
-            transaction = {
+            signed = account.sign_transaction({
                 'nonce': nonce,
-                'to': Web3.to_checksum_address(to_address),
-                'value': w3.to_wei(balance_eth, 'ether'),  # Пока отправляем весь баланс
-                'chainId': 2741
-            }
-            
-            # Оцениваем газ
-            gas_estimate = w3.eth.estimate_gas({
-                'from': sender_address,
-                'to': Web3.to_checksum_address(to_address),
-                'value': w3.to_wei(balance_eth, 'ether')
-            })
-            
-            # Получаем цену газа
-            gas_price = w3.eth.gas_price
-            
-            # Вычисляем стоимость газа
-            gas_cost = w3.from_wei(gas_price * gas_estimate, 'ether')
-            
-            # Корректируем сумму для отправки
-            amount_to_send = balance_eth - gas_cost
-            
-            if amount_to_send <= 0:
-                log_message(f"⚠️ Пропуск: недостаточно средств для оплаты газа")
-                return False
-                
-            # Обновляем сумму в транзакции
-            transaction['value'] = w3.to_wei(amount_to_send, 'ether')
-            
-            # Добавляем параметры газа
-            transaction.update({
-                'gas': gas_estimate,
+                'to': to_address,
+                'value': value,
+                'chainId': CHAIN_ID,
+                'gas': gas,
                 'gasPrice': gas_price
             })
-            
-            log_message("✍️ Подписание транзакции...")
-            signed = Account.sign_transaction(transaction, from_private_key)
-            
-            log_message("📤 Отправка транзакции...")
-            tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
-            
-            log_message("⏳ Ожидание подтверждения...")
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-            
-            log_message(f"✅ Успешно собрано {amount_to_send} ETH")
-            log_message(f"🔗 Хэш транзакции: {receipt['transactionHash'].hex()}")
-            
-            return True
-            
+            if journal is not None:
+                journal.record(journal_key, PENDING, signed.hash)
+            tx_hash = send_raw_transaction(w3, signed.raw_transaction)
         except Exception as e:
-            log_message(f"❌ Ошибка при отправке: {str(e)}")
+            log_message(f"❌ Ошибка при отправке с {account.address}: {str(e)}", ERROR)
+            if journal is not None:
+                journal.record(journal_key, FAILED, error=str(e))
             return False
-                
-    except Exception as e:
-        log_message(f"❌ Ошибка: {str(e)}")
-        return False
 
-def collect_from_csv(filename: str, destination_address: str):
-    """Собирает ETH со всех приватных ключей из CSV"""
+        amount = w3.from_wei(value, 'ether')
+        if journal is not None:
+            journal.record(journal_key, BROADCAST, tx_hash, amount=str(amount))
+        callback = journal.tracker_callback(journal_key, log_confirmation) if journal else log_confirmation
+        receipt_tracker.track(tx_hash, callback)
+        log_message(f"📨 {account.address}: отправлено {amount} ETH, {tx_hash.hex()}")
+        return True
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='sweep') as executor:
+        return sum(executor.map(send, plans))
+
+def schedule_sweeps(plans: list, destination_address: str, scheduler, journal: RunJournal = None,
+                    dust_threshold: int = DUST_THRESHOLD_WEI) -> int:
+    """
+    Ставит подготовленные plan_sweeps переводы в очередь планировщика
+    комиссий (fee_engine). Сумма пересчитывается при выпуске и каждой
+    замене: баланс минус gas * maxFeePerGas, в пыль не отправляем
+
+    :return: число поставленных в очередь переводов
+    """
+    to_address = Web3.to_checksum_address(destination_address)
+    # nonce из среза: планировщику не нужен отдельный запрос на кошелек
+    scheduler.nonce_manager.prime({account.address: nonce for account, nonce, _, _, _ in plans})
+
+    for account, _, value, gas, gas_price in plans:
+        journal_key = collection_key(account.address)
+        balance = value + gas * gas_price
+
+        def build(fees: dict, balance=balance, gas=gas) -> dict:
+            amount = sweepable_amount(balance, gas, fees['maxFeePerGas'])
+            if amount <= dust_threshold:
+                return None
+            return {'to': to_address, 'value': amount, 'gas': gas}
+
+        def on_broadcast(tx_hash, journal_key=journal_key):
+            if journal is not None:
+                journal.record(journal_key, BROADCAST, tx_hash)
+            log_message(f"📨 {journal_key}: {tx_hash}")
+
+        def on_pending(tx_hash, journal_key=journal_key):
+            if journal is not None:
+                journal.record(journal_key, PENDING, tx_hash)
+
+        callback = journal.tracker_callback(journal_key, log_confirmation) if journal else log_confirmation
+        scheduler.submit(account, build, callback=callback, on_broadcast=on_broadcast, on_pending=on_pending,
+                         label=account.address)
+    return len(plans)
+
+def collect_from_csv(filename: str, destination_address: str, journal: RunJournal = None,
+                     concurrency: int = SWEEP_CONCURRENCY, only_addresses: set = None, scheduler=None):
+    """
+    Собирает ETH со всех приватных ключей из CSV: ключи пачками по
+    SWEEP_BATCH_SIZE, по каждой пачке срез балансов и параллельная отправка.
+    С журналом кошельки, с которых сбор уже прошел или транзакция
+    еще в пути, пропускаются без запросов к RPC. only_addresses - адреса
+    из плана пробного прогона, остальные кошельки не запрашиваются.
+    scheduler - планировщик комиссий (fee_engine.FeeScheduler): переводы
+    ждут в очереди, пока комиссия не опустится до потолка
+    """
     log_message("🔄 Начало сбора средств")
     
     if not os.path.exists(filename):
-        log_message(f"❌ Файл {filename} не найден")
+        log_message(f"❌ Файл {filename} не найден", ERROR)
         return
     
-    total_collected = 0
     successful_transactions = 0
+    checked = 0
+    planned = 0
     
     try:
-        with open(filename, 'r') as file:
-            reader = csv.reader(file)
-            next(reader, None)  # Пропускаем заголовок
-            rows = list(reader)
-            
-            log_message(f"📋 Найдено кошельков для проверки: {len(rows) * 2}")  # *2 так как проверяем оба столбца
-            
-            # Создаем множество для хранения уникальных ключей
-            processed_keys = set()
-            
-            # Обрабатываем оба столбца
-            for row in rows:
-                for private_key in row[:2]:  # Берем первые два столбца
-                    private_key = private_key.strip()
-                    
-                    # Пропускаем уже обработанные ключи
-                    if private_key in processed_keys:
-                        continue
-                    
-                    processed_keys.add(private_key)
-                    
-                    log_message(f"\n{'='*50}")
-                    success = collect_eth(private_key, destination_address)
-                    
-                    if success:
-                        successful_transactions += 1
-                    
-                    time.sleep(5)  # Задержка между транзакциями
-            
-            log_message(f"\n{'='*50}")
-            log_message(f"✨ Сбор средств завершен")
-            log_message(f"📊 Успешных транзакций: {successful_transactions}")
-            
+        if journal is not None:
+            counts = journal.reconcile(rpc_pool)
+            log_message(f"📒 Журнал {journal.path}: подтверждено {counts[CONFIRMED]}, отклонено {counts[FAILED]}, в пути {counts[BROADCAST]}")
+        
+        # Уникальные ключи из обоих столбцов читаются потоково и
+        # собираются пачками: срез балансов, затем параллельная отправка
+        def process_batch(batch: list):
+            plans = plan_sweeps(batch, destination_address, journal, only_addresses=only_addresses)
+            log_message(f"📋 Пачка из {len(batch)} кошельков: к сбору {len(plans)}")
+            if scheduler is not None:
+                return len(plans), schedule_sweeps(plans, destination_address, scheduler, journal)
+            return len(plans), sweep(plans, destination_address, journal, concurrency)
+        
+        batch = []
+        for private_key in iter_unique_keys(filename, log_invalid_row):
+            batch.append(private_key)
+            if len(batch) >= SWEEP_BATCH_SIZE:
+                found, sent = process_batch(batch)
+                checked += len(batch)
+                planned += found
+                successful_transactions += sent
+                batch = []
+        if batch:
+            found, sent = process_batch(batch)
+            checked += len(batch)
+            planned += found
+            successful_transactions += sent
+        
+        if scheduler is not None:
+            from fee_engine import log_scheduler_summary
+            log_message("⏳ Ожидание дешевого окна и подтверждения транзакций из очереди...")
+            log_scheduler_summary(scheduler, scheduler.wait())
+        log_message("⏳ Ожидание подтверждения отправленных транзакций...")
+        receipt_tracker.wait_all()
+        summary = receipt_tracker.summary()
+        
+        log_message(f"\n{'='*50}")
+        log_message(f"✨ Сбор средств завершен")
+        log_message(f"📋 Проверено кошельков: {checked}, с балансом выше пыли: {planned}")
+        log_message(f"📊 Отправлено транзакций: {successful_transactions}")
+        log_message(f"📊 Подтверждено: {summary['confirmed']}, отклонено: {summary['failed']}, без ответа: {summary['timeout']}")
+        
     except Exception as e:
-        log_message(f"❌ Ошибка при чтении файла: {str(e)}")
+        log_message(f"❌ Ошибка при чтении файла: {str(e)}", ERROR)
 
 if __name__ == "__main__":
     # Настройка вывода
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', write_through=True)
+    # Вывод буферизуется логгером, write_through не нужен
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     
     # Проверка подключения
     log_message("🌐 Проверка подключения к RPC...")
     if not w3.is_connected():
-        log_message("❌ Не удалось подключиться к RPC")
+        log_message("❌ Не удалось подключиться к RPC", ERROR)
         sys.exit(1)
     log_message("✅ Подключение успешно")
     
     # Адрес для сбора средств (замените на нужный)
     destination_address = "ВАШ АДРЕС"
     
+    # Журнал запуска: True - продолжить прерванный запуск с места остановки.
+    # Ключи журнала не устаревают, поэтому для нового запуска оставьте False
+    resume = False
+    journal = RunJournal("collector.journal.jsonl") if resume else None
+    
     # Запуск сбора средств
-    collect_from_csv("wallets.csv", destination_address) 
\ No newline at end of file
+    collect_from_csv("wallets.csv", destination_address, journal) 
\ No newline at end of file
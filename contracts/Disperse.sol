@@ -0,0 +1,25 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.20;
+
+/// Рассылка ETH на много адресов одной транзакцией.
+/// ABI совместим с disperseEther из Disperse.app
+contract Disperse {
+    error LengthMismatch();
+    error TransferFailed(address recipient);
+
+    function disperseEther(address[] calldata recipients, uint256[] calldata values) external payable {
+        if (recipients.length != values.length) revert LengthMismatch();
+
+        for (uint256 i = 0; i < recipients.length; i++) {
+            (bool ok, ) = recipients[i].call{value: values[i]}("");
+            if (!ok) revert TransferFailed(recipients[i]);
+        }
+
+        // Остаток возвращается отправителю
+        uint256 balance = address(this).balance;
+        if (balance > 0) {
+            (bool ok, ) = msg.sender.call{value: balance}("");
+            if (!ok) revert TransferFailed(msg.sender);
+        }
+    }
+}
@@ -0,0 +1,53 @@
+import os
+from web3 import Web3, AsyncWeb3
+from nonce_manager import NonceManager, AsyncNonceManager
+from receipt_tracker import ReceiptTracker
+from gas_cache import GasCache
+from rpc_pool import RPCPool, PooledHTTPProvider, AsyncPooledHTTPProvider
+
+# Общее ядро для всех скриптов: один пул RPC, nonce, трекер подтверждений
+# и кэш газа на процесс. Скрипты берут объекты отсюда при импорте, поэтому
+# configure() нужно вызвать до импорта main/collector/token_collector/balance
+
+# RPC: можно указать несколько через запятую в RPC_URLS - чтения идут
+# на самый здоровый узел, транзакции рассылаются на все сразу
+RPC_URLS = [url.strip() for url in os.environ.get('RPC_URLS', "https://api.mainnet.abs.xyz").split(',') if url.strip()]
+RPC_URL = RPC_URLS[0]
+CHAIN_ID = int(os.environ.get('CHAIN_ID', 2741))
+
+rpc_pool = None
+w3 = None
+aw3 = None
+nonce_manager = None
+async_nonce_manager = None
+receipt_tracker = None
+gas_cache = None
+
+def configure(rpc_urls: list = None, chain_id: int = None):
+    """Создает общие объекты заново (например, с RPC из командной строки)"""
+    global RPC_URLS, RPC_URL, CHAIN_ID
+    global rpc_pool, w3, aw3, nonce_manager, async_nonce_manager, receipt_tracker, gas_cache
+
+    if rpc_urls:
+        RPC_URLS = list(rpc_urls)
+        RPC_URL = RPC_URLS[0]
+    if chain_id is not None:
+        CHAIN_ID = chain_id
+
+    rpc_pool = RPCPool(RPC_URLS)
+    # Синхронный и асинхронный web3 ходят через одни узлы и ограничители пула
+    w3 = Web3(PooledHTTPProvider(rpc_pool))
+    aw3 = AsyncWeb3(AsyncPooledHTTPProvider(rpc_pool))
+
+    # Nonce выдаются локально, RPC запрашивается один раз на адрес
+    nonce_manager = NonceManager(w3)
+    async_nonce_manager = AsyncNonceManager(aw3)
+
+    # Подтверждения проверяются отдельным потоком батчами
+    receipt_tracker = ReceiptTracker(rpc_pool)
+
+    # Цена газа и оценки газа общие на весь запуск, цена обновляется с новым блоком
+    gas_cache = GasCache(w3)
+    receipt_tracker.add_block_listener(gas_cache.on_block)
+
+configure()
@@ -0,0 +1,78 @@
+from web3 import Web3
+
+# Контракт рассылки: исходник в contracts/Disperse.sol.
+# На Abstract (ZK Stack) обычная транзакция с to=None контракт не создает:
+# развертывание идет через системный ContractDeployer транзакцией EIP-712
+# (тип 0x71) с байткодом zksolc, поэтому контракт разворачивается
+# инструментами ZK Stack (см. README), а скрипты берут его адрес
+
+DISPERSE_ABI = [
+    {
+        "inputs": [
+            {"internalType": "address[]", "name": "recipients", "type": "address[]"},
+            {"internalType": "uint256[]", "name": "values", "type": "uint256[]"}
+        ],
+        "name": "disperseEther",
+        "outputs": [],
+        "stateMutability": "payable",
+        "type": "function"
+    },
+    {"inputs": [], "name": "LengthMismatch", "type": "error"},
+    {
+        "inputs": [{"internalType": "address", "name": "recipient", "type": "address"}],
+        "name": "TransferFailed",
+        "type": "error"
+    }
+]
+
+# Какую долю лимита газа блока может занять одна транзакция рассылки
+BLOCK_GAS_FRACTION = 0.5
+MAX_CHUNK_SIZE = 500
+PROBE_SIZE = 10
+
+def get_disperse_contract(w3, address: str):
+    """Контракт рассылки по адресу; по адресу должен быть уже развернутый код"""
+    address = Web3.to_checksum_address(address)
+    if not w3.eth.get_code(address):
+        raise ValueError(f"По адресу {address} нет контракта рассылки: разверните contracts/Disperse.sol (см. README)")
+    return w3.eth.contract(address=address, abi=DISPERSE_ABI)
+
+def estimate_disperse_gas(contract, sender: str, recipients: list, amount_wei: int) -> int:
+    return contract.functions.disperseEther(recipients, [amount_wei] * len(recipients)).estimate_gas({
+        'from': sender,
+        'value': amount_wei * len(recipients),
+    })
+
+def plan_chunk_size(w3, contract, sender: str, recipients: list, amount_wei: int,
+                    gas_fraction: float = BLOCK_GAS_FRACTION) -> tuple:
+    """
+    Подбирает размер пачки под лимит газа блока: газ оценивается для
+    одного получателя и для PROBE_SIZE получателей, по разнице
+    вычисляется стоимость одного получателя
+
+    :return: (размер пачки, газ на получателя, базовый газ)
+    """
+    probe = recipients[:PROBE_SIZE]
+    single_gas = estimate_disperse_gas(contract, sender, probe[:1], amount_wei)
+    if len(probe) > 1:
+        probe_gas = estimate_disperse_gas(contract, sender, probe, amount_wei)
+        per_recipient = max(1, (probe_gas - single_gas) // (len(probe) - 1))
+    else:
+        per_recipient = single_gas
+    base_gas = max(0, single_gas - per_recipient)
+
+    block_gas_limit = w3.eth.get_block('latest')['gasLimit']
+    budget = int(block_gas_limit * gas_fraction)
+    chunk_size = max(1, min(MAX_CHUNK_SIZE, (budget - base_gas) // per_recipient))
+    return chunk_size, per_recipient, base_gas
+
+def build_disperse_transaction(contract, recipients: list, amount_wei: int, nonce: int, gas: int, gas_price: int,
+                               chain_id: int = 2741) -> dict:
+    """Транзакция рассылки amount_wei каждому получателю пачки"""
+    return contract.functions.disperseEther(recipients, [amount_wei] * len(recipients)).build_transaction({
+        'chainId': chain_id,
+        'nonce': nonce,
+        'gas': gas,
+        'gasPrice': gas_price,
+        'value': amount_wei * len(recipients),
+    })
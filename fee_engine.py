@@ -0,0 +1,382 @@
+import heapq
+import itertools
+import statistics
+import threading
+import time
+from logger import log_message, DEBUG, WARNING, ERROR
+from rpc import send_raw_batch, chunked, RPCError
+from receipt_tracker import FAILED, TIMEOUT
+from metrics import tracer
+
+# EIP-1559 планировщик отправки: базовая комиссия отслеживается по
+# eth_feeHistory, работа ждет в очереди с приоритетом по потолку комиссии
+# и уходит пачкой, как только комиссия опускается до потолка. Транзакции,
+# которые застряли ниже базовой комиссии, заменяются (тот же nonce,
+# комиссия выше) без участия пользователя
+
+# Окно истории комиссий и перцентиль чаевых
+FEE_HISTORY_BLOCKS = 20
+REWARD_PERCENTILE = 50
+# Во сколько раз maxFeePerGas выше базовой комиссии (запас на рост за несколько блоков)
+BASE_FEE_HEADROOM = 2
+# Замена должна поднять обе комиссии минимум на 10% (правило мемпула geth), берем с запасом
+REPLACEMENT_BUMP = 1.125
+# Через сколько секунд без квитанции транзакция считается застрявшей
+STUCK_AFTER = 30
+# Сколько eth_sendRawTransaction уходит одним батчем при выпуске пачки
+RELEASE_BATCH_SIZE = 50
+# Сколько секунд wait() ждет дешевого окна, если max_wait не задан
+DEFAULT_MAX_WAIT = 900
+
+class FeeHistory:
+    """
+    Базовая комиссия и чаевые по последним блокам (eth_feeHistory).
+    Обновляется не чаще раза в ttl секунд
+    """
+
+    def __init__(self, w3, blocks: int = FEE_HISTORY_BLOCKS, percentile: int = REWARD_PERCENTILE, ttl: float = 2.0):
+        self.w3 = w3
+        self.blocks = blocks
+        self.percentile = percentile
+        self.ttl = ttl
+        self.base_fees = []
+        self.priority_fee = 0
+        self._updated = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            if not force and time.monotonic() - self._updated < self.ttl:
+                return
+            history = self.w3.eth.fee_history(self.blocks, 'latest', [self.percentile])
+            # Последний элемент baseFeePerGas - базовая комиссия следующего блока
+            self.base_fees = list(history['baseFeePerGas'])
+            rewards = [reward[0] for reward in history.get('reward') or [] if reward]
+            self.priority_fee = int(statistics.median(rewards)) if rewards else 0
+            self._updated = time.monotonic()
+
+    @property
+    def base_fee(self) -> int:
+        """Базовая комиссия следующего блока"""
+        self.refresh()
+        return self.base_fees[-1] if self.base_fees else 0
+
+    def price(self) -> int:
+        """Сколько за газ нужно предложить сейчас, чтобы попасть в блок"""
+        return self.base_fee + self.priority_fee
+
+    def typical_price(self) -> int:
+        """Медианная цена по окну: цель по умолчанию - не платить больше обычного"""
+        self.refresh()
+        if not self.base_fees:
+            return 0
+        return int(statistics.median(self.base_fees)) + self.priority_fee
+
+    def quote(self, ceiling: int = None) -> dict:
+        """
+        EIP-1559 комиссии для новой транзакции: maxFeePerGas с запасом на
+        рост базовой комиссии, но не выше потолка работы
+        """
+        priority_fee = self.priority_fee
+        max_fee = self.base_fee * BASE_FEE_HEADROOM + priority_fee
+        if ceiling is not None:
+            max_fee = min(max_fee, ceiling)
+            priority_fee = min(priority_fee, max_fee)
+        return {'maxFeePerGas': max_fee, 'maxPriorityFeePerGas': priority_fee}
+
+class FeeJob:
+    """Одна транзакция в очереди: отправитель, сборщик полей, потолок комиссии"""
+
+    def __init__(self, account, build, ceiling: int, callback=None, on_broadcast=None, on_pending=None,
+                 label: str = ''):
+        self.account = account
+        self.build = build
+        self.ceiling = ceiling
+        self.callback = callback
+        self.on_broadcast = on_broadcast
+        self.on_pending = on_pending
+        self.label = label
+        self.nonce = None
+        self.fees = None
+        self.hashes = []
+        self.sent_at = None
+        self.done = False
+
+class FeeScheduler:
+    """
+    Очередь отправки с потолками комиссий. build(fees) возвращает поля
+    транзакции ('to', 'value', 'data', 'gas') для данных комиссий или None,
+    если при таких комиссиях отправлять нечего (например, сбор ушел в пыль).
+    nonce выдается при выпуске, поэтому порядок отправки одного кошелька
+    совпадает с порядком nonce. Работы с самым высоким потолком выходят первыми
+    """
+
+    def __init__(self, w3, rpc, tracker, nonce_manager, chain_id: int, history: FeeHistory = None,
+                 target: int = None, poll_interval: float = 1.0, stuck_after: float = STUCK_AFTER,
+                 max_wait: float = None):
+        self.w3 = w3
+        self.rpc = rpc
+        self.tracker = tracker
+        self.nonce_manager = nonce_manager
+        self.chain_id = chain_id
+        self.history = history or FeeHistory(w3)
+        self.target = target
+        self.poll_interval = poll_interval
+        self.stuck_after = stuck_after
+        self.max_wait = max_wait if max_wait is not None else DEFAULT_MAX_WAIT
+        # Счетчики меняют поток планировщика и потоки квитанций
+        self.stats = {'released': 0, 'replaced': 0, 'failed': 0, 'skipped': 0}
+        self._stats_lock = threading.Lock()
+
+        self._queue = []
+        self._order = itertools.count()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def default_ceiling(self) -> int:
+        """Потолок для работ без своего: target или обычная цена за окно"""
+        return self.target if self.target is not None else self.history.typical_price()
+
+    def submit(self, account, build, ceiling: int = None, callback=None, on_broadcast=None, on_pending=None,
+               label: str = '') -> FeeJob:
+        """
+        Ставит транзакцию в очередь. callback(tx_hash, status, receipt) -
+        как у ReceiptTracker, вызывается один раз на работу (с хэшем той
+        замены, которая попала в блок). on_broadcast(tx_hash) - после
+        каждой принятой отправки, включая замены. on_pending(tx_hash) -
+        после подписи, до первой отправки (для записи pending в журнал)
+        """
+        ceiling = ceiling if ceiling is not None else self.default_ceiling()
+        job = FeeJob(account, build, ceiling, callback, on_broadcast, on_pending, label)
+        with self._changed:
+            # heapq - минимальная куча, поэтому потолок со знаком минус
+            heapq.heappush(self._queue, (-job.ceiling, next(self._order), job))
+            self._changed.notify_all()
+        self.start()
+        return job
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._queue) + len(self._in_flight)
+
+    def wait(self, timeout: float = None) -> int:
+        """
+        Блокирует, пока очередь не опустеет и все отправленное не завершится
+        (не дольше timeout, по умолчанию max_wait). Работы, которые к сроку
+        так и не вышли из очереди, завершаются с FAILED (повторный запуск
+        с журналом отправит их)
+        :return: сколько работ осталось (не вышли из очереди или еще в пути)
+        """
+        if timeout is None:
+            timeout = self.max_wait
+        with self._changed:
+            self._changed.wait_for(lambda: not self._queue and not self._in_flight, timeout)
+            expired = [job for _, _, job in self._queue]
+            self._queue = []
+            in_flight = len(self._in_flight)
+        for job in expired:
+            self._fail(job, None, f"не дождались дешевого окна за {timeout:.0f} с")
+        return len(expired) + in_flight
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='fee-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.history.refresh()
+                price = self.history.price()
+                self._release(price)
+                self._replace_stuck(price)
+            except Exception as e:
+                log_message(f"❌ Планировщик комиссий: {str(e)}", ERROR)
+            self._stop.wait(self.poll_interval)
+
+    def _release(self, price: int):
+        """Выпускает пачкой все работы, чей потолок не ниже текущей цены"""
+        released = []
+        with self._lock:
+            while self._queue and -self._queue[0][0] >= price:
+                released.append(heapq.heappop(self._queue)[2])
+                # Работа считается в пути с момента выпуска, чтобы wait() ее дождался
+                self._in_flight[id(released[-1])] = released[-1]
+        if not released:
+            return
+
+        log_message(f"⛽ Цена {price} wei/газ: выпуск {len(released)} транзакций, в очереди {len(self._queue)}", DEBUG)
+        started = time.time()
+        signed = []
+        for job in released:
+            # Ошибка одной работы не должна оставить остальные в _in_flight навсегда
+            try:
+                fees = self.history.quote(job.ceiling)
+                fields = job.build(fees)
+                if fields is None:
+                    self._count('skipped')
+                    self._finish(job)
+                    continue
+                # nonce выдается по порядку выпуска: внутри пачки кошелек идет подряд
+                job.nonce = self.nonce_manager.next_nonce(job.account.address)
+                job.fees = fees
+                transaction = self._sign(job, fields, fees)
+                if job.on_pending is not None:
+                    job.on_pending('0x' + bytes(transaction.hash).hex())
+            except Exception as e:
+                self._fail(job, None, str(e))
+                continue
+            signed.append((job, transaction))
+
+        for chunk in chunked(signed, RELEASE_BATCH_SIZE):
+            self._broadcast(chunk)
+        tracer.record('fee_release', started, time.time(), count=len(released), price=price)
+
+    def _sign(self, job: FeeJob, fields: dict, fees: dict):
+        transaction = dict(fields)
+        transaction.update({
+            'type': 2,
+            'nonce': job.nonce,
+            'chainId': self.chain_id,
+            'maxFeePerGas': fees['maxFeePerGas'],
+            'maxPriorityFeePerGas': fees['maxPriorityFeePerGas'],
+        })
+        return job.account.sign_transaction(transaction)
+
+    def _broadcast(self, chunk: list, replacement: bool = False):
+        try:
+            results = send_raw_batch(self.rpc, ['0x' + bytes(signed.raw_transaction).hex() for _, signed in chunk])
+        except Exception as e:
+            results = [RPCError({'message': str(e)})] * len(chunk)
+
+        for (job, signed), result in zip(chunk, results):
+            tx_hash = '0x' + bytes(signed.hash).hex()
+            if isinstance(result, RPCError) and 'already known' not in result.message.lower():
+                if replacement:
+                    # Старая транзакция остается в пути
+                    log_message(f"⚠️ Замена {job.label} (nonce {job.nonce}) не принята: {result.message}", WARNING)
+                    continue
+                self._fail(job, tx_hash, result.message)
+                continue
+            job.hashes.append(tx_hash)
+            job.sent_at = time.monotonic()
+            if job.on_broadcast is not None:
+                job.on_broadcast(tx_hash)
+            self._count('replaced' if replacement else 'released')
+            self.tracker.track(tx_hash, self._on_receipt(job))
+
+    def _replace_stuck(self, price: int):
+        """
+        Транзакции без квитанции дольше stuck_after, чья maxFeePerGas ниже
+        текущей цены, отправляются заново с тем же nonce и комиссией выше
+        минимум на REPLACEMENT_BUMP, но не выше потолка работы
+        """
+        now = time.monotonic()
+        with self._lock:
+            stuck = [
+                job for job in self._in_flight.values()
+                if job.sent_at is not None and not job.done and now - job.sent_at >= self.stuck_after
+                and job.fees['maxFeePerGas'] < price
+            ]
+
+        replacements = []
+        for job in stuck:
+            fees = self.history.quote()
+            fees = {
+                'maxFeePerGas': max(fees['maxFeePerGas'], int(job.fees['maxFeePerGas'] * REPLACEMENT_BUMP) + 1),
+                'maxPriorityFeePerGas': max(fees['maxPriorityFeePerGas'],
+                                            int(job.fees['maxPriorityFeePerGas'] * REPLACEMENT_BUMP) + 1),
+            }
+            if fees['maxFeePerGas'] > job.ceiling:
+                # Выше потолка не поднимаем: ждем, пока комиссия упадет сама
+                job.sent_at = now
+                log_message(f"⏳ {job.label} (nonce {job.nonce}) ждет: замена выше потолка {job.ceiling}", DEBUG)
+                continue
+            try:
+                fields = job.build(fees)
+                if fields is None:
+                    job.sent_at = now
+                    continue
+                transaction = self._sign(job, fields, fees)
+                # Хэш замены в журнал до отправки: после падения сверяются все хэши работы
+                if job.on_pending is not None:
+                    job.on_pending('0x' + bytes(transaction.hash).hex())
+            except Exception as e:
+                # Старая транзакция остается в пути, замена - на следующем шаге
+                log_message(f"⚠️ Замена {job.label} (nonce {job.nonce}) не собрана: {str(e)}", WARNING)
+                job.sent_at = now
+                continue
+            job.fees = fees
+            log_message(f"🔁 Замена {job.label} (nonce {job.nonce}): maxFeePerGas {fees['maxFeePerGas']}", DEBUG)
+            replacements.append((job, transaction))
+
+        for chunk in chunked(replacements, RELEASE_BATCH_SIZE):
+            self._broadcast(chunk, replacement=True)
+
+    def _on_receipt(self, job: FeeJob):
+        def callback(tx_hash, status, receipt):
+            with self._lock:
+                # Таймаут одного из хэшей не конец работы, пока в пути есть замена
+                if job.done or (status == TIMEOUT and job.hashes[-1] != tx_hash):
+                    return
+                job.done = True
+            for other in job.hashes:
+                if other != tx_hash:
+                    self.tracker.drop(other)
+            # Колбэк до снятия из очереди: wait() возвращается после записи в журнал
+            try:
+                if job.callback is not None:
+                    job.callback(tx_hash, status, receipt)
+            finally:
+                self._finish(job)
+        return callback
+
+    def _fail(self, job: FeeJob, tx_hash: str, message: str):
+        """Работа не ушла в сеть: nonce возвращается, колбэк получает FAILED"""
+        log_message(f"❌ {job.label}: {message}", ERROR)
+        if job.nonce is not None:
+            self.nonce_manager.release(job.account.address, job.nonce)
+        self._count('failed')
+        self._finish(job)
+        if job.callback is not None:
+            job.callback(tx_hash, FAILED, None)
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _finish(self, job: FeeJob):
+        with self._changed:
+            job.done = True
+            self._in_flight.pop(id(job), None)
+            self._changed.notify_all()
+
+def make_scheduler(target_gwei: float = None, max_wait: float = None, poll_interval: float = 1.0) -> FeeScheduler:
+    """
+    Планировщик поверх общих объектов core.py.
+    target_gwei - потолок по умолчанию (None - медианная цена за окно),
+    max_wait - сколько секунд ждать дешевого окна в конце запуска
+    (None - DEFAULT_MAX_WAIT)
+    """
+    import core
+    target = core.w3.to_wei(target_gwei, 'gwei') if target_gwei is not None else None
+    return FeeScheduler(core.w3, core.rpc_pool, core.receipt_tracker, core.nonce_manager, core.CHAIN_ID,
+                        target=target, poll_interval=poll_interval, max_wait=max_wait)
+
+def log_scheduler_summary(scheduler: FeeScheduler, left: int):
+    """Итог планировщика в лог после wait()"""
+    stats = scheduler.stats
+    log_message(f"⛽ Выпущено: {stats['released']}, замен: {stats['replaced']}, с ошибкой: {stats['failed']}, "
+                f"пропущено: {stats['skipped']}")
+    if left:
+        log_message(f"⚠️ Не дождались дешевого окна или квитанций: {left} транзакций не завершены, "
+                    f"повторный запуск с журналом сверит и отправит их", WARNING)
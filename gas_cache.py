@@ -0,0 +1,80 @@
+import threading
+import time
+
+# Запас к мемоизированной оценке газа: одинаковые по форме вызовы
+# могут немного отличаться по стоимости
+GAS_ESTIMATE_MARGIN = 1.2
+
+class GasCache:
+    """
+    Общий на весь запуск кэш цены газа и оценок газа.
+
+    Цена газа обновляется по истечении ttl или при появлении
+    нового блока (on_block). Оценки газа запоминаются по форме вызова:
+    ('transfer',), ('approve', контракт), ('transferFrom', контракт) и т.п.
+    """
+
+    def __init__(self, w3, ttl: float = 10.0, margin: float = GAS_ESTIMATE_MARGIN):
+        self.w3 = w3
+        self.ttl = ttl
+        self.margin = margin
+        self._values = {}
+        self._estimates = {}
+        self._block_number = None
+        self._lock = threading.Lock()
+
+    def _fresh(self, name: str):
+        item = self._values.get(name)
+        if item is not None and time.monotonic() - item[1] < self.ttl:
+            return item[0]
+        return None
+
+    def _store(self, name: str, value):
+        with self._lock:
+            self._values[name] = (value, time.monotonic())
+        return value
+
+    def on_block(self, block_number: int):
+        """Сбрасывает цены, если появился новый блок"""
+        with self._lock:
+            if self._block_number is None or block_number > self._block_number:
+                self._block_number = block_number
+                self._values.clear()
+
+    def invalidate(self):
+        """Сбрасывает цены и оценки газа"""
+        with self._lock:
+            self._values.clear()
+            self._estimates.clear()
+
+    def gas_price(self) -> int:
+        """Цена газа (legacy gasPrice)"""
+        value = self._fresh('gas_price')
+        if value is None:
+            value = self._store('gas_price', self.w3.eth.gas_price)
+        return value
+
+    async def gas_price_async(self, aw3) -> int:
+        """Цена газа через AsyncWeb3"""
+        value = self._fresh('gas_price')
+        if value is None:
+            value = self._store('gas_price', await aw3.eth.gas_price)
+        return value
+
+    def estimate_gas(self, key: tuple, transaction: dict) -> int:
+        """Оценка газа, запомненная по форме вызова key"""
+        value = self._estimates.get(key)
+        if value is None:
+            value = int(self.w3.eth.estimate_gas(transaction) * self.margin)
+            with self._lock:
+                self._estimates[key] = value
+        return value
+
+    async def estimate_gas_async(self, aw3, key: tuple, transaction: dict) -> int:
+        """Оценка газа через AsyncWeb3, запомненная по форме вызова key"""
+        value = self._estimates.get(key)
+        if value is None:
+            value = int(await aw3.eth.estimate_gas(transaction) * self.margin)
+            with self._lock:
+                self._estimates[key] = value
+        return value
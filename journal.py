@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+from rpc import batch_request, chunked, RPCError
+
+PENDING = 'pending'
+BROADCAST = 'broadcast'
+CONFIRMED = 'confirmed'
+FAILED = 'failed'
+
+class RunJournal:
+    """
+    Журнал запуска: JSONL-файл только на дозапись, каждая запись
+    сбрасывается на диск (fsync). При повторном запуске последнее
+    состояние каждого ключа восстанавливается из файла.
+
+    Ключ - единица работы: строка рассылки, кошелек при сборе ETH,
+    токен при сборе NFT. Состояния: pending (подписана, хэш записан до
+    отправки), broadcast (узел принял), confirmed, failed. Если ключ
+    переподписан с новым хэшем, пока прежний еще в пути (замена с той же
+    nonce), прежние хэши хранятся в replaces и тоже сверяются с сетью.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # RPC для сверки pending-записей, запоминается в reconcile()
+        self.rpc = None
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Оборванная последняя строка после падения
+                        continue
+                    self._entries[entry['key']] = entry
+
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, key: str, state: str, tx_hash=None, **details):
+        """Дописывает новое состояние ключа и сбрасывает файл на диск"""
+        if tx_hash is not None and not isinstance(tx_hash, str):
+            tx_hash = '0x' + bytes(tx_hash).hex()
+
+        entry = {'key': key, 'state': state, 'time': time.time()}
+        previous = self._entries.get(key)
+        if tx_hash is None and previous is not None:
+            tx_hash = previous.get('tx_hash')
+        if tx_hash is not None:
+            entry['tx_hash'] = tx_hash
+        if previous is not None and state in (PENDING, BROADCAST) and previous['state'] in (PENDING, BROADCAST):
+            # Замена: в блок может попасть любая из отправленных транзакций
+            replaces = list(previous.get('replaces', []))
+            if previous.get('tx_hash') not in (None, tx_hash):
+                replaces.append(previous['tx_hash'])
+            if replaces:
+                entry['replaces'] = replaces
+        entry.update(details)
+
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._entries[key] = entry
+        return entry
+
+    def get(self, key: str) -> dict:
+        return self._entries.get(key)
+
+    def state(self, key: str) -> str:
+        entry = self._entries.get(key)
+        return entry['state'] if entry else None
+
+    def is_done(self, key: str) -> bool:
+        return self.state(key) == CONFIRMED
+
+    def should_skip(self, key: str) -> bool:
+        """
+        Работа уже сделана или транзакция еще в пути - повторять нельзя.
+        Запись pending (падение между подписью и отправкой) сверяется с
+        сетью; без RPC (reconcile не вызывался) она считается отправленной
+        """
+        if self.state(key) == PENDING and self.rpc is not None and self.get(key).get('tx_hash'):
+            self._resolve([(key, PENDING, self._hashes(key))], self.rpc)
+        return self.state(key) in (CONFIRMED, BROADCAST, PENDING)
+
+    def in_flight(self) -> dict:
+        """Ключи в состоянии pending или broadcast: {ключ: (состояние, хэш)}"""
+        return {
+            key: (entry['state'], entry['tx_hash']) for key, entry in self._entries.items()
+            if entry['state'] in (PENDING, BROADCAST) and entry.get('tx_hash')
+        }
+
+    def reconcile(self, rpc_url, batch_size: int = 100) -> dict:
+        """
+        Сверяет неподтвержденные транзакции с сетью батчами
+        eth_getTransactionReceipt и eth_getTransactionByHash.
+        Транзакции без квитанции остаются в состоянии broadcast; pending,
+        которую сеть не знает, так и не ушла - она помечается failed и
+        будет выполнена заново
+
+        :return: количество ключей по итоговым состояниям
+        """
+        self.rpc = rpc_url
+        items = [(key, state, self._hashes(key)) for key, (state, _) in self.in_flight().items()]
+        return self._resolve(items, rpc_url, batch_size)
+
+    def _hashes(self, key: str) -> list:
+        """Все хэши ключа, которые могут попасть в блок: замененные и текущий"""
+        entry = self._entries[key]
+        return entry.get('replaces', []) + [entry['tx_hash']]
+
+    def _resolve(self, items: list, rpc_url, batch_size: int = 100) -> dict:
+        counts = {CONFIRMED: 0, FAILED: 0, BROADCAST: 0}
+        lookups = [(key, state, hashes, tx_hash) for key, state, hashes in items for tx_hash in hashes]
+        found = {}
+        for chunk in chunked(lookups, batch_size // 2):
+            calls = []
+            for _, _, _, tx_hash in chunk:
+                calls.append(('eth_getTransactionReceipt', [tx_hash]))
+                calls.append(('eth_getTransactionByHash', [tx_hash]))
+            results = batch_request(rpc_url, calls)
+            for position, (key, _, _, tx_hash) in enumerate(chunk):
+                found.setdefault(key, []).append((tx_hash, results[2 * position], results[2 * position + 1]))
+
+        for key, state, hashes in items:
+            answers = found.get(key, [])
+            receipts = [(tx_hash, receipt) for tx_hash, receipt, _ in answers
+                        if receipt is not None and not isinstance(receipt, RPCError)]
+            if receipts:
+                # Одна nonce - в блок попадает ровно одна из замен
+                tx_hash, receipt = receipts[0]
+                state = CONFIRMED if int(receipt.get('status', '0x0'), 16) == 1 else FAILED
+                self.record(key, state, tx_hash)
+            elif any(isinstance(receipt, RPCError) or isinstance(transaction, RPCError)
+                     for _, receipt, transaction in answers):
+                # Ответа нет - оставляем как есть и не повторяем
+                counts[BROADCAST] += 1
+                continue
+            elif state == PENDING:
+                known = any(transaction is not None for _, _, transaction in answers)
+                state = BROADCAST if known else FAILED
+                self.record(key, state, hashes[-1], **({} if known else {'error': 'не отправлена'}))
+            counts[state] += 1
+        return counts
+
+    def tracker_callback(self, key: str, callback=None):
+        """Колбэк для ReceiptTracker: пишет итог в журнал и вызывает callback"""
+        def on_receipt(tx_hash, status, receipt):
+            if status == 'confirmed':
+                self.record(key, CONFIRMED, tx_hash)
+            elif status == 'failed':
+                self.record(key, FAILED, tx_hash, error='reverted')
+            # timeout: транзакция могла еще пройти, оставляем broadcast
+            if callback is not None:
+                callback(tx_hash, status, receipt)
+        return on_receipt
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,78 @@
+import atexit
+import os
+import sys
+import threading
+from datetime import datetime
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'ERROR': ERROR}
+
+class BufferedLogger:
+    """
+    Логгер с уровнями и буфером: строки копятся в памяти и выводятся
+    одним write не чаще раза в flush_interval секунд (или когда буфер
+    заполнен). Ошибки выводятся сразу
+    """
+
+    def __init__(self, level: int = INFO, flush_interval: float = 0.5, max_lines: int = 200, stream=None):
+        self.level = level
+        self.flush_interval = flush_interval
+        self.max_lines = max_lines
+        self.stream = stream
+        self._lines = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def log(self, message: str, level: int = INFO):
+        if level < self.level:
+            return
+        line = f"[{datetime.now().strftime('%H:%M:%S')}] {message}\n"
+        with self._lock:
+            self._lines.append(line)
+            full = len(self._lines) >= self.max_lines
+        if full or level >= ERROR:
+            self.flush()
+        else:
+            self._schedule()
+
+    def _schedule(self):
+        # Один отложенный вывод на интервал, поток таймера не держит процесс
+        if self._timer is None:
+            with self._lock:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_interval, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            lines, self._lines = self._lines, []
+            self._timer = None
+        if lines:
+            stream = self.stream or sys.stdout
+            stream.write(''.join(lines))
+            stream.flush()
+
+    def debug(self, message: str):
+        self.log(message, DEBUG)
+
+    def info(self, message: str):
+        self.log(message, INFO)
+
+    def warning(self, message: str):
+        self.log(message, WARNING)
+
+    def error(self, message: str):
+        self.log(message, ERROR)
+
+# Общий логгер процесса, уровень задается LOG_LEVEL (DEBUG, INFO, WARNING, ERROR)
+logger = BufferedLogger(LEVELS.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), INFO))
+atexit.register(logger.flush)
+
+def log_message(message: str, level: int = INFO):
+    """Функция для логирования через общий буферизованный логгер"""
+    logger.log(message, level)
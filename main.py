@@ -1,25 +1,28 @@
 from web3 import Web3
-import time
-from eth_account import Account
-import json
-import csv
+import asyncio
 import os
 import sys
 import io
-from datetime import datetime
+from logger import log_message, DEBUG, ERROR
+from receipt_tracker import ReceiptTracker, CONFIRMED, TIMEOUT
+from wallets import get_address_from_private_key, load_account, iter_wallets, stream_wallets
+from journal import RunJournal, PENDING, BROADCAST, FAILED
+from nonce_manager import send_raw_transaction, send_raw_transaction_async
+from disperse import get_disperse_contract, plan_chunk_size, build_disperse_transaction
 
-# RPC
-RPC_URL = "https://api.mainnet.abs.xyz"
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+# RPC, nonce, трекер подтверждений и кэш газа общие для всех скриптов (core.py)
+from core import (CHAIN_ID, rpc_pool, w3, aw3, nonce_manager, async_nonce_manager,
+                  receipt_tracker, gas_cache)
 
-def get_address_from_private_key(private_key: str) -> str:
-    
-    if private_key.startswith('0x'):
-        private_key = private_key[2:]
-    account = Account.from_key(private_key)
-    return account.address
+# Сколько строк обрабатывается одновременно в асинхронном режиме
+CONCURRENCY = 10
+# Размер очереди потокового чтения CSV и число неподтвержденных
+# транзакций на обработчик
+QUEUE_PER_WORKER = 4
+PENDING_PER_WORKER = 100
 
-def send_eth(from_private_key: str, to_private_key: str, amount: float):
+def send_eth(from_private_key: str, to_private_key: str, amount: float, tracker: ReceiptTracker = None,
+             journal: RunJournal = None, journal_key: str = None):
     try:
         # Получаем адрес получателя из приватного ключа
         to_address = get_address_from_private_key(to_private_key)
@@ -28,9 +31,7 @@ def send_eth(from_private_key: str, to_private_key: str, amount: float):
             raise Exception("Не удалось подключиться к RPC")
 
         # Создаем аккаунт отправителя
-        if from_private_key.startswith('0x'):
-            from_private_key = from_private_key[2:]
-        account = Account.from_key(from_private_key)
+        account = load_account(from_private_key)
         sender_address = account.address
         
         log_message(f"👤 Отправитель: {sender_address}")
@@ -46,111 +47,471 @@ def send_eth(from_private_key: str, to_private_key: str, amount: float):
             raise Exception(f"Недостаточно средств. Нужно {amount} ETH, доступно {balance_eth} ETH")
         
         try:
-            nonce = w3.eth.get_transaction_count(sender_address)
-            log_message("📝 Подготовка транзакции...")
-            
-            # Создаем транзакцию без газа
-            transaction = {
-                'nonce': nonce,
-                'to': Web3.to_checksum_address(to_address),
-                'value': w3.to_wei(amount, 'ether'),
-                'chainId': 2741
-            }
+            log_message("📝 Подготовка транзакции...", DEBUG)
             
-            # Оцениваем газ
-            gas_estimate = w3.eth.estimate_gas({
+            # Оценка газа простого перевода одна на весь запуск
+            gas_estimate = gas_cache.estimate_gas(('transfer',), {
                 'from': sender_address,
                 'to': Web3.to_checksum_address(to_address),
                 'value': w3.to_wei(amount, 'ether')
             })
+            gas_price = gas_cache.gas_price()
             
-            # Добавляем параметры газа
-            transaction.update({
-                'gas': gas_estimate,
-                'gasPrice': w3.eth.gas_price
-            })
+            def sign_and_send(nonce: int):
+                transaction = {
+                    'nonce': nonce,
+                    'to': Web3.to_checksum_address(to_address),
+                    'value': w3.to_wei(amount, 'ether'),
+                    'chainId': CHAIN_ID,
+                    'gas': gas_estimate,
+                    'gasPrice': gas_price
+                }
+                
+                log_message("✍️ Подписание транзакции...", DEBUG)
+                signed = account.sign_transaction(transaction)
+                # Хэш известен до отправки: после падения на отправке запись сверяется с сетью
+                if journal is not None:
+                    journal.record(journal_key, PENDING, signed.hash)
+                
+                log_message("📤 Отправка транзакции...", DEBUG)
+                return send_raw_transaction(w3, signed.raw_transaction)
             
-            log_message("✍️ Подписание транзакции...")
-            # Подписываем и отправляем транзакцию
-            signed = Account.sign_transaction(transaction, from_private_key)
+            # Nonce берется из локального менеджера
+            tx_hash = nonce_manager.send(sender_address, sign_and_send)
+            if journal is not None:
+                journal.record(journal_key, BROADCAST, tx_hash)
             
-            log_message("📤 Отправка транзакции...")
-            tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
+            # Подтверждение отслеживает трекер, отправка не блокируется
+            if tracker is not None:
+                callback = journal.tracker_callback(journal_key, log_confirmation) if journal else log_confirmation
+                tracker.track(tx_hash, callback)
+                log_message(f"📨 Транзакция отправлена: {tx_hash.hex()}")
+                return True
             
             log_message("⏳ Ожидание подтверждения транзакции...")
             # Ждем подтверждения
             receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+            if journal is not None:
+                journal.record(journal_key, CONFIRMED if receipt['status'] == 1 else FAILED, tx_hash)
             log_message(f"✅ Успешно отправлено {amount} ETH")
             log_message(f"🔗 Хэш транзакции: {receipt['transactionHash'].hex()}")
             
             return True
             
         except Exception as e:
-            log_message(f"❌ Ошибка при отправке: {str(e)}")
+            log_message(f"❌ Ошибка при отправке: {str(e)}", ERROR)
+            if journal is not None:
+                journal.record(journal_key, FAILED, error=str(e))
             return False
                 
     except Exception as e:
-        log_message(f"❌ Произошла ошибка: {str(e)}")
+        log_message(f"❌ Произошла ошибка: {str(e)}", ERROR)
+        if journal is not None:
+            journal.record(journal_key, FAILED, error=str(e))
         return False
 
-def log_message(message: str):
-    """Функция для логирования с принудительным выводом"""
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
-    sys.stdout.flush()  # Принудительный вывод
+def schedule_eth(scheduler, from_private_key: str, to_private_key: str, amount: float,
+                 journal: RunJournal = None, journal_key: str = None):
+    """
+    Ставит перевод в очередь планировщика комиссий (fee_engine) вместо
+    немедленной отправки: nonce и EIP-1559 комиссии выдаются при выпуске
+    """
+    account = load_account(from_private_key)
+    to_address = Web3.to_checksum_address(get_address_from_private_key(to_private_key))
+    amount_wei = w3.to_wei(amount, 'ether')
+    gas_estimate = gas_cache.estimate_gas(('transfer',), {
+        'from': account.address,
+        'to': to_address,
+        'value': amount_wei
+    })
+
+    def build(fees: dict) -> dict:
+        return {'to': to_address, 'value': amount_wei, 'gas': gas_estimate}
+
+    callback = journal.tracker_callback(journal_key, log_confirmation) if journal else log_confirmation
+    on_broadcast = (lambda tx_hash: journal.record(journal_key, BROADCAST, tx_hash)) if journal else None
+    on_pending = (lambda tx_hash: journal.record(journal_key, PENDING, tx_hash)) if journal else None
+    scheduler.submit(account, build, callback=callback, on_broadcast=on_broadcast, on_pending=on_pending,
+                     label=f"{account.address} -> {to_address}")
+    log_message(f"🗓️ {account.address} -> {to_address}: в очереди планировщика комиссий")
+
+async def broadcast_eth_async(from_private_key: str, to_private_key: str, amount: float,
+                              journal: RunJournal = None, journal_key: str = None):
+    """Подписывает и отправляет перевод, не дожидаясь подтверждения. Возвращает хэш"""
+    to_address = get_address_from_private_key(to_private_key)
+
+    account = load_account(from_private_key)
+    sender_address = account.address
+
+    log_message(f"👤 {sender_address} -> 👥 {to_address}")
+
+    # Баланс и цену газа запрашиваем одновременно (цена берется из кэша)
+    balance, gas_price = await asyncio.gather(
+        aw3.eth.get_balance(sender_address),
+        gas_cache.gas_price_async(aw3),
+    )
+    balance_eth = Web3.from_wei(balance, 'ether')
+
+    if balance_eth < amount:
+        raise Exception(f"Недостаточно средств. Нужно {amount} ETH, доступно {balance_eth} ETH")
+
+    gas_estimate = await gas_cache.estimate_gas_async(aw3, ('transfer',), {
+        'from': sender_address,
+        'to': Web3.to_checksum_address(to_address),
+        'value': Web3.to_wei(amount, 'ether')
+    })
+
+    async def sign_and_send(nonce: int):
+        transaction = {
+            'nonce': nonce,
+            'to': Web3.to_checksum_address(to_address),
+            'value': Web3.to_wei(amount, 'ether'),
+            'chainId': CHAIN_ID,
+            'gas': gas_estimate,
+            'gasPrice': gas_price
+        }
+        signed = account.sign_transaction(transaction)
+        if journal is not None:
+            journal.record(journal_key, PENDING, signed.hash)
+        return await send_raw_transaction_async(aw3, signed.raw_transaction)
+
+    return await async_nonce_manager.send(sender_address, sign_and_send)
+
+def log_confirmation(tx_hash: str, status: str, receipt):
+    """Колбэк трекера подтверждений"""
+    if status == CONFIRMED:
+        log_message(f"✅ Транзакция подтверждена: {tx_hash}")
+    else:
+        log_message(f"❌ Транзакция {tx_hash}: {status}", ERROR)
+
+def distribution_key(index: int, from_private_key: str, to_private_key: str) -> str:
+    """Ключ строки рассылки в журнале"""
+    return address_distribution_key(index, get_address_from_private_key(from_private_key),
+                                    get_address_from_private_key(to_private_key))
+
+def address_distribution_key(index: int, from_address: str, to_address: str) -> str:
+    """Ключ строки рассылки по уже известным адресам"""
+    return f"distribute:{index}:{from_address}:{to_address}"
 
-def process_csv(filename: str, amount: float, start_from: int = 1):
+def resume_from_journal(journal: RunJournal):
+    """Сверяет с сетью транзакции, которые были в пути при прошлом запуске"""
+    counts = journal.reconcile(rpc_pool)
+    log_message(f"📒 Журнал {journal.path}: подтверждено {counts[CONFIRMED]}, отклонено {counts[FAILED]}, в пути {counts[BROADCAST]}")
+
+def log_invalid_row(index: int, error: Exception):
+    """Колбэк потокового чтения CSV для битых строк"""
+    log_message(f"❌ Ошибка ключа в строке {index}: {str(error)}", ERROR)
+
+def process_csv(filename: str, amount: float, start_from: int = 1, journal: RunJournal = None, only_rows: set = None,
+                scheduler=None):
+    """
+    Последовательная рассылка. CSV читается потоково: отправка начинается
+    с первой строки, битые строки пропускаются с ошибкой в логе.
+    С журналом уже выполненные строки и строки с транзакцией в пути
+    пропускаются без запросов к RPC. only_rows - индексы строк из плана
+    пробного прогона (simulate.py), остальные строки пропускаются.
+    scheduler - планировщик комиссий (fee_engine.FeeScheduler): переводы
+    ждут в очереди, пока комиссия не опустится до потолка
+    """
     log_message("Начало обработки CSV файла")
     if not os.path.exists(filename):
         log_message(f"Файл {filename} не найден")
         return
     
-    with open(filename, 'r') as file:
-        reader = csv.reader(file)
-        next(reader, None)
-        rows = list(reader)
+    if journal is not None:
+        resume_from_journal(journal)
+    
+    processed = 0
+    for index, from_private_key, to_private_key in stream_wallets(filename, log_invalid_row):
+        if index < start_from or (only_rows is not None and index not in only_rows):
+            continue
+        
+        journal_key = None
+        if journal is not None:
+            try:
+                journal_key = distribution_key(index, from_private_key, to_private_key)
+            except Exception as e:
+                log_message(f"❌ Ошибка ключа в строке {index}: {str(e)}", ERROR)
+                continue
+            if journal.should_skip(journal_key):
+                log_message(f"⏭️ Строка {index} уже обработана ({journal.state(journal_key)})")
+                continue
         
-        log_message(f"Всего транзакций для обработки: {len(rows)}")
+        log_message(f"\n{'='*50}")
+        log_message(f"Обработка транзакции {index}...")
+        processed += 1
         
-        for index, row in enumerate(rows, 1):
-            if index < start_from:
+        try:
+            if scheduler is not None:
+                schedule_eth(scheduler, from_private_key, to_private_key, amount, journal=journal, journal_key=journal_key)
                 continue
-            if len(row) >= 2:
-                from_private_key = row[0].strip()
-                to_private_key = row[1].strip()
-                
-                log_message(f"\n{'='*50}")
-                log_message(f"Обработка транзакции {index}/{len(rows)}...")
-                
+            success = send_eth(from_private_key, to_private_key, amount, tracker=receipt_tracker,
+                               journal=journal, journal_key=journal_key)
+            
+            if success:
+                log_message("✅ Транзакция успешно отправлена")
+            else:
+                log_message("❌ Ошибка при выполнении транзакции", ERROR)
+            
+        except Exception as e:
+            log_message(f"❌ Критическая ошибка при обработке транзакции: {str(e)}", ERROR)
+            continue
+    
+    log_message(f"Всего обработано строк: {processed}")
+    if scheduler is not None:
+        from fee_engine import log_scheduler_summary
+        log_message("⏳ Ожидание дешевого окна и подтверждения транзакций из очереди...")
+        log_scheduler_summary(scheduler, scheduler.wait())
+    log_message("⏳ Ожидание подтверждения отправленных транзакций...")
+    receipt_tracker.wait_all()
+    summary = receipt_tracker.summary()
+    log_message(f"📊 Подтверждено: {summary['confirmed']}, отклонено: {summary['failed']}, без ответа: {summary['timeout']}")
+
+async def process_csv_async(filename: str, amount: float, concurrency: int = CONCURRENCY, start_from: int = 1,
+                            journal: RunJournal = None, only_rows: set = None):
+    """
+    Параллельная рассылка: CSV читается потоково в ограниченную очередь,
+    concurrency обработчиков разбирают строки по мере чтения.
+    Строки одного отправителя отправляются по порядку.
+    only_rows - индексы строк из плана пробного прогона
+    """
+    log_message("Начало асинхронной обработки CSV файла")
+    if not os.path.exists(filename):
+        log_message(f"Файл {filename} не найден")
+        return
+
+    if journal is not None:
+        resume_from_journal(journal)
+
+    workers = max(1, concurrency)
+    log_message(f"Потоков: {workers}")
+
+    # Читатель не уходит вперед обработчиков больше чем на размер очереди
+    queue = asyncio.Queue(maxsize=workers * QUEUE_PER_WORKER)
+    # Блокировка на адрес отправителя: строки одного отправителя идут по порядку,
+    # разные отправители друг друга не ждут
+    sender_locks = {}
+    results = {'success': 0, 'failed': 0}
+
+    async def producer():
+        for index, from_private_key, to_private_key in iter_wallets(filename, log_invalid_row):
+            if index < start_from or (only_rows is not None and index not in only_rows):
+                continue
+            if journal is not None:
                 try:
-                    success = send_eth(from_private_key, to_private_key, amount)
-                    
-                    if success:
-                        log_message("✅ Транзакция успешно выполнена")
-                    else:
-                        log_message("❌ Ошибка при выполнении транзакции")
-                    
-                    delay = 5
-                    log_message(f"⏳ Ожидание {delay} секунд перед следующей транзакцией...")
-                    sys.stdout.flush()
-                    time.sleep(delay)
-                    
-                except Exception as e:
-                    log_message(f"❌ Критическая ошибка при обработке транзакции: {str(e)}")
-                    continue
+                    if journal.should_skip(distribution_key(index, from_private_key, to_private_key)):
+                        continue
+                except Exception:
+                    # Ошибка ключа будет залогирована при отправке
+                    pass
+            await queue.put((index, from_private_key, to_private_key))
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def settle(pending: list):
+        # Подтверждения проверяет общий трекер батчами
+        receipts = await asyncio.gather(
+            *(receipt_tracker.track_async(tx_hash) for _, tx_hash, _ in pending)
+        )
+        for (index, tx_hash, journal_key), (status, _) in zip(pending, receipts):
+            # timeout: транзакция могла еще пройти, в журнале остается broadcast
+            if journal is not None and status != TIMEOUT:
+                journal.record(journal_key, CONFIRMED if status == CONFIRMED else FAILED, tx_hash)
+            if status != CONFIRMED:
+                log_message(f"❌ Транзакция {index} не подтверждена: {tx_hash.hex()}", ERROR)
+                results['failed'] += 1
+            else:
+                log_message(f"✅ Транзакция {index} подтверждена: {tx_hash.hex()}")
+                results['success'] += 1
+
+    async def worker():
+        # Переводы уходят подряд с локальными nonce,
+        # подтверждения ждем пачками по PENDING_PER_WORKER
+        pending = []
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            index, from_private_key, to_private_key = item
+            log_message(f"Обработка транзакции {index}...")
+            journal_key = None
+            try:
+                journal_key = distribution_key(index, from_private_key, to_private_key)
+                lock = sender_locks.setdefault(get_address_from_private_key(from_private_key), asyncio.Lock())
+                async with lock:
+                    tx_hash = await broadcast_eth_async(from_private_key, to_private_key, amount,
+                                                        journal=journal, journal_key=journal_key)
+                pending.append((index, tx_hash, journal_key))
+                if journal is not None:
+                    journal.record(journal_key, BROADCAST, tx_hash)
+            except Exception as e:
+                log_message(f"❌ Ошибка при отправке транзакции {index}: {str(e)}", ERROR)
+                results['failed'] += 1
+                if journal is not None and journal_key is not None:
+                    journal.record(journal_key, FAILED, error=str(e))
+
+            if len(pending) >= PENDING_PER_WORKER:
+                await settle(pending)
+                pending = []
+        await settle(pending)
+
+    await asyncio.gather(producer(), *(worker() for _ in range(workers)))
+
+    log_message(f"\n{'='*50}")
+    log_message(f"📊 Успешно: {results['success']}, с ошибкой: {results['failed']}")
+    return results
+
+def process_csv_disperse(filename: str, amount: float, disperse_address: str, start_from: int = 1,
+                         journal: RunJournal = None, only_rows: set = None):
+    """
+    Рассылка через контракт Disperse: все получатели одного отправителя
+    уходят одной транзакцией disperseEther (пачками под лимит газа блока).
+    only_rows - индексы строк из плана пробного прогона
+    """
+    log_message("Начало обработки CSV файла (режим disperse)")
+    if not os.path.exists(filename):
+        log_message(f"Файл {filename} не найден")
+        return
+
+    if journal is not None:
+        resume_from_journal(journal)
+
+    try:
+        contract = get_disperse_contract(w3, disperse_address)
+    except Exception as e:
+        log_message(f"❌ {str(e)}", ERROR)
+        return
+    amount_wei = w3.to_wei(amount, 'ether')
+
+    # Группируем получателей по отправителю
+    groups = {}
+    for index, from_private_key, to_private_key in iter_wallets(filename, log_invalid_row):
+        if index < start_from or (only_rows is not None and index not in only_rows):
+            continue
+        try:
+            to_address = get_address_from_private_key(to_private_key)
+            journal_key = distribution_key(index, from_private_key, to_private_key) if journal is not None else None
+        except Exception as e:
+            log_message(f"❌ Ошибка ключа в строке {index}: {str(e)}", ERROR)
+            continue
+        if journal is not None and journal.should_skip(journal_key):
+            continue
+        groups.setdefault(from_private_key, []).append((index, to_address, journal_key))
+
+    total = sum(len(rows) for rows in groups.values())
+    log_message(f"Всего переводов: {total}, отправителей: {len(groups)}")
+
+    # Размер пачки подбирается один раз: стоимость получателя одинакова для всех отправителей
+    plan = None
+
+    def chunk_gas(size: int) -> int:
+        # Лимит газа пачки с запасом; по нему же считается нужный баланс
+        _, per_recipient_gas, base_gas = plan
+        return int((base_gas + per_recipient_gas * size) * gas_cache.margin)
+
+    def chunk_callback(keys: list):
+        def on_receipt(tx_hash, status, receipt):
+            if journal is not None:
+                for journal_key in keys:
+                    journal.tracker_callback(journal_key)(tx_hash, status, receipt)
+            log_confirmation(tx_hash, status, receipt)
+        return on_receipt
+
+    for from_private_key, rows in groups.items():
+        log_message(f"\n{'='*50}")
+        try:
+            account = load_account(from_private_key)
+            sender_address = account.address
+            recipients = [to_address for _, to_address, _ in rows]
+
+            if plan is None:
+                plan = plan_chunk_size(w3, contract, sender_address, recipients, amount_wei)
+                log_message(f"📐 Получателей в транзакции: до {plan[0]}, газ на получателя: {plan[1]}")
+            chunk_size = plan[0]
+            gas_price = gas_cache.gas_price()
+
+            # Баланс должен покрыть все переводы и газ
+            balance = w3.eth.get_balance(sender_address)
+            needed = amount_wei * len(rows) + sum(
+                chunk_gas(len(rows[start:start + chunk_size])) for start in range(0, len(rows), chunk_size)
+            ) * gas_price
+            log_message(f"👤 Отправитель: {sender_address}, получателей: {len(rows)}")
+            if balance < needed:
+                raise Exception(f"Недостаточно средств. Нужно {w3.from_wei(needed, 'ether')} ETH, "
+                                f"доступно {w3.from_wei(balance, 'ether')} ETH")
+        except Exception as e:
+            log_message(f"❌ Ошибка отправителя: {str(e)}", ERROR)
+            if journal is not None:
+                for _, _, journal_key in rows:
+                    journal.record(journal_key, FAILED, error=str(e))
+            continue
+
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            keys = [journal_key for _, _, journal_key in chunk]
+            gas = chunk_gas(len(chunk))
+
+            def sign_and_send(nonce: int):
+                transaction = build_disperse_transaction(
+                    contract, [to_address for _, to_address, _ in chunk], amount_wei, nonce, gas, gas_price, CHAIN_ID
+                )
+                signed = account.sign_transaction(transaction)
+                if journal is not None:
+                    for journal_key in keys:
+                        journal.record(journal_key, PENDING, signed.hash)
+                return send_raw_transaction(w3, signed.raw_transaction)
+
+            try:
+                tx_hash = nonce_manager.send(sender_address, sign_and_send)
+            except Exception as e:
+                log_message(f"❌ Ошибка при отправке строк {chunk[0][0]}-{chunk[-1][0]}: {str(e)}", ERROR)
+                if journal is not None:
+                    for journal_key in keys:
+                        journal.record(journal_key, FAILED, error=str(e))
+                break
+
+            if journal is not None:
+                for journal_key in keys:
+                    journal.record(journal_key, BROADCAST, tx_hash)
+            receipt_tracker.track(tx_hash, chunk_callback(keys))
+            log_message(f"📨 Строки {chunk[0][0]}-{chunk[-1][0]} ({len(chunk)} получателей): {tx_hash.hex()}")
+
+    log_message("⏳ Ожидание подтверждения отправленных транзакций...")
+    receipt_tracker.wait_all()
+    summary = receipt_tracker.summary()
+    log_message(f"📊 Подтверждено: {summary['confirmed']}, отклонено: {summary['failed']}, без ответа: {summary['timeout']}")
 
 if __name__ == "__main__":
     # Настройка вывода
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', write_through=True)
+    # Вывод буферизуется логгером, write_through не нужен
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     
     # Проверка подключения
     log_message("Проверка подключения к RPC...")
     if not w3.is_connected():
-        log_message("❌ Не удалось подключиться к RPC")
+        log_message("❌ Не удалось подключиться к RPC", ERROR)
         sys.exit(1)
     log_message("✅ Подключение к RPC успешно")
     
     csv_file = "wallets.csv"
     amount_to_send = 0.0031
     
+    # Асинхронный режим: несколько отправителей параллельно (1 - старый последовательный режим)
+    concurrency = CONCURRENCY
+
+    # Адрес развернутого контракта Disperse (contracts/Disperse.sol, развертывание - см. README):
+    # если указан, переводы отправителя уходят одной транзакцией
+    disperse_address = None
+
+    # Журнал запуска: True - продолжить прерванный запуск с места остановки.
+    # Ключи журнала не устаревают, поэтому для нового запуска оставьте False
+    resume = False
+    journal = RunJournal("main.journal.jsonl") if resume else None
+
     log_message(f"Запуск обработки CSV с суммой {amount_to_send} ETH на адрес")
-    process_csv(csv_file, amount_to_send, start_from=1)
+    if disperse_address:
+        process_csv_disperse(csv_file, amount_to_send, disperse_address, start_from=1, journal=journal)
+    elif concurrency > 1:
+        asyncio.run(process_csv_async(csv_file, amount_to_send, concurrency=concurrency, start_from=1, journal=journal))
+    else:
+        process_csv(csv_file, amount_to_send, start_from=1, journal=journal)
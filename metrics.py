@@ -0,0 +1,235 @@
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+
+# Границы гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONFIRM_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key: tuple, extra: dict = None) -> str:
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+class Counter:
+    """Счетчик, который только растет; значения по набору меток"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> list:
+        with self._lock:
+            return [(self.name, key, {}, value) for key, value in self._values.items()]
+
+class Gauge(Counter):
+    """Значение, которое может расти и уменьшаться"""
+
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                item = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            item['counts'][index] += 1
+            item['sum'] += value
+            item['count'] += 1
+
+    def count(self, **labels) -> int:
+        item = self._values.get(_label_key(labels))
+        return item['count'] if item else 0
+
+    def samples(self) -> list:
+        samples = []
+        with self._lock:
+            for key, item in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), item['counts']):
+                    cumulative += count
+                    samples.append((self.name + '_bucket', key, {'le': bound}, cumulative))
+                samples.append((self.name + '_sum', key, {}, item['sum']))
+                samples.append((self.name + '_count', key, {}, item['count']))
+        return samples
+
+class Registry:
+    """Набор метрик процесса с выгрузкой в Prometheus text format или JSONL"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def prometheus_text(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key, extra)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        """Текущие значения всех метрик одной JSON-записью"""
+        metrics = {}
+        for metric in list(self._metrics.values()):
+            for name, key, extra, value in metric.samples():
+                metrics[name + _format_labels(key, extra)] = value
+        return {'time': time.time(), 'metrics': metrics}
+
+    def export(self, path: str):
+        """
+        .prom - файл в Prometheus text format (для textfile collector),
+        иначе снимок дописывается строкой в JSONL
+        """
+        if path.endswith('.prom'):
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as file:
+                file.write(self.prometheus_text())
+            os.replace(tmp_path, path)
+        else:
+            with open(path, 'a') as file:
+                file.write(json.dumps(self.snapshot(), ensure_ascii=False) + '\n')
+
+class Tracer:
+    """
+    Необязательные спаны (например, путь транзакции от отправки до
+    подтверждения) в JSONL-файл. Без файла запись спанов ничего не стоит
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def record(self, name: str, start: float, end: float, **attributes):
+        """start и end - время time.time()"""
+        if self._file is None:
+            return
+        span = {'name': name, 'start': start, 'duration': end - start}
+        span.update(attributes)
+        with self._lock:
+            self._file.write(json.dumps(span, ensure_ascii=False) + '\n')
+
+    def span(self, name: str, **attributes):
+        return _Span(self, name, attributes)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class _Span:
+    def __init__(self, tracer: Tracer, name: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc is not None:
+            self.attributes['error'] = str(exc)
+        self.tracer.record(self.name, self.start, time.time(), **self.attributes)
+        return False
+
+# Общий реестр процесса. METRICS_FILE (.prom или .jsonl) и TRACE_FILE
+# задаются переменными окружения, выгрузка метрик - при выходе
+registry = Registry()
+tracer = Tracer(os.environ.get('TRACE_FILE'))
+
+rpc_calls = registry.counter('rpc_calls_total', 'JSON-RPC вызовы по методам')
+rpc_errors = registry.counter('rpc_errors_total', 'JSON-RPC вызовы, завершившиеся ошибкой')
+rpc_latency = registry.histogram('rpc_latency_seconds', 'Задержка JSON-RPC запроса (с повторами)')
+rpc_retries = registry.counter('rpc_retries_total', 'Повторы JSON-RPC запросов по причине')
+tx_broadcast = registry.counter('tx_broadcast_total', 'Отправленные транзакции')
+tx_finished = registry.counter('tx_finished_total', 'Завершенные транзакции по статусу')
+tx_in_flight = registry.gauge('tx_in_flight', 'Транзакции, ожидающие подтверждения')
+tx_confirm_seconds = registry.histogram('tx_confirm_seconds', 'Время от отправки до подтверждения', CONFIRM_BUCKETS)
+
+def observe_rpc(method: str, started: float, error: bool = False, calls: int = 1):
+    """Учитывает запрос (или батч из calls запросов одного метода) начатый в started (monotonic)"""
+    rpc_calls.inc(calls, method=method)
+    rpc_latency.observe(time.monotonic() - started, method=method)
+    if error:
+        rpc_errors.inc(method=method)
+    elif method == 'eth_sendRawTransaction':
+        tx_broadcast.inc()
+
+def observe_batch(calls: list, started: float, error: bool = False):
+    """Учитывает батч: вызовы по методам, задержка под методом batch"""
+    for method, _ in calls:
+        rpc_calls.inc(method=method)
+    rpc_latency.observe(time.monotonic() - started, method='batch')
+    if error:
+        rpc_errors.inc(method='batch')
+
+def observe_retry(throttled: bool):
+    rpc_retries.inc(reason='throttle' if throttled else 'transient')
+
+def export_on_exit():
+    path = os.environ.get('METRICS_FILE')
+    if path:
+        registry.export(path)
+    tracer.close()
+
+atexit.register(export_on_exit)
@@ -0,0 +1,491 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import rlp
+from eth_abi import encode
+from eth_account import Account
+from eth_account._utils.legacy_transactions import Transaction
+from eth_account._utils.typed_transactions import TypedTransaction
+from eth_utils import keccak
+from hexbytes import HexBytes
+from web3 import Web3
+from multicall import MULTICALL3_ADDRESS, MULTICALL3_ABI
+
+CHAIN_ID = 2741
+TRANSFER_GAS = 21000
+CONTRACT_GAS = 60000
+BLOCK_GAS_LIMIT = 30_000_000
+# Наибольший диапазон блоков одного eth_getLogs, как у публичных RPC
+LOG_RANGE_LIMIT = 10_000
+
+TRANSFER_TOPIC = '0x' + keccak(text='Transfer(address,address,uint256)').hex()
+CONSECUTIVE_TRANSFER_TOPIC = '0x' + keccak(text='ConsecutiveTransfer(uint256,uint256,address,address)').hex()
+ZERO_ADDRESS = '0x' + '00' * 20
+
+ERC20_ABI = [
+    {"inputs": [{"name": "account", "type": "address"}], "name": "balanceOf",
+     "outputs": [{"name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [{"name": "to", "type": "address"}, {"name": "value", "type": "uint256"}], "name": "transfer",
+     "outputs": [{"name": "", "type": "bool"}], "stateMutability": "nonpayable", "type": "function"},
+]
+
+# Пустой Web3 только для кодирования и декодирования ABI
+_codec = Web3()
+
+class MockChain:
+    """
+    Состояние локальной цепочки для бенчмарков: балансы, nonce,
+    квитанции, одна NFT-коллекция (ERC-721A: tokensOfOwner,
+    tokensOfOwnerIn, setApprovalForAll, transferFrom, события
+    Transfer/ConsecutiveTransfer для eth_getLogs) и токены ERC-20
+    (balanceOf, transfer).
+    Каждая транзакция сразу попадает в новый блок, квитанция становится
+    видна через confirm_delay секунд
+    """
+
+    def __init__(self, nft_address: str = None, nft_abi: list = None, gas_price: int = 25_000_000,
+                 confirm_delay: float = 0.0):
+        self.gas_price = gas_price
+        self.confirm_delay = confirm_delay
+        self.block = 1
+        self.balances = {}
+        self.nonces = {}
+        self.receipts = {}
+        self.calls = {}
+        self.owners = {}
+        self.approvals = set()
+        self.logs = []
+        self.erc20 = {}
+        self.mempool = {}
+        # Транзакции по блокам для eth_getBlockByNumber(..., True)
+        self.block_transactions = {}
+        self.erc20_codec = _codec.eth.contract(abi=ERC20_ABI)
+        self.nft_address = nft_address.lower() if nft_address else None
+        self.nft = _codec.eth.contract(abi=nft_abi) if nft_abi else None
+        self.multicall = _codec.eth.contract(abi=MULTICALL3_ABI)
+        self._lock = threading.Lock()
+
+    # Подготовка состояния
+
+    def fund(self, address: str, amount_wei: int):
+        self.balances[address.lower()] = self.balances.get(address.lower(), 0) + amount_wei
+
+    def mint(self, address: str, token_ids: list):
+        # Минт - отдельный блок; подряд идущие id одним ConsecutiveTransfer (ERC-2309)
+        self.block += 1
+        token_ids = sorted(token_ids)
+        for token_id in token_ids:
+            self.owners[token_id] = address.lower()
+        if len(token_ids) > 1 and token_ids[-1] - token_ids[0] == len(token_ids) - 1:
+            self._log([CONSECUTIVE_TRANSFER_TOPIC, _topic(token_ids[0]), _topic(ZERO_ADDRESS), _topic(address)],
+                      _topic(token_ids[-1]))
+        else:
+            for token_id in token_ids:
+                self._log([TRANSFER_TOPIC, _topic(ZERO_ADDRESS), _topic(address), _topic(token_id)])
+
+    def mint_erc20(self, token: str, address: str, amount: int):
+        balances = self.erc20.setdefault(token.lower(), {})
+        balances[address.lower()] = balances.get(address.lower(), 0) + amount
+
+    def tokens_of(self, address: str) -> list:
+        address = address.lower()
+        return sorted(token_id for token_id, owner in self.owners.items() if owner == address)
+
+    # JSON-RPC
+
+    def handle(self, request: dict) -> dict:
+        method = request.get('method')
+        params = request.get('params') or []
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            handler = getattr(self, method, None)
+            if handler is None:
+                return {'jsonrpc': '2.0', 'id': request.get('id'),
+                        'error': {'code': -32601, 'message': f'method {method} not found'}}
+            try:
+                return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': handler(*params)}
+            except Exception as e:
+                return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': -32000, 'message': str(e)}}
+
+    def eth_chainId(self):
+        return hex(CHAIN_ID)
+
+    def net_version(self):
+        return str(CHAIN_ID)
+
+    def web3_clientVersion(self):
+        return 'mock-rpc/1.0'
+
+    def eth_blockNumber(self):
+        return hex(self.block)
+
+    def eth_gasPrice(self):
+        return hex(self.gas_price)
+
+    def eth_maxPriorityFeePerGas(self):
+        return hex(0)
+
+    def eth_getBalance(self, address, block='latest'):
+        return hex(self.balances.get(address.lower(), 0))
+
+    def eth_getTransactionCount(self, address, block='latest'):
+        return hex(self.nonces.get(address.lower(), 0))
+
+    def eth_estimateGas(self, transaction, block=None):
+        return hex(CONTRACT_GAS if transaction.get('data') or transaction.get('input') else TRANSFER_GAS)
+
+    def eth_getBlockByNumber(self, number, full=False):
+        number = self.block if number in ('latest', 'pending', 'safe', 'finalized') else int(number, 16)
+        if number > self.block:
+            return None
+        transactions = self.block_transactions.get(number, [])
+        return {
+            'number': hex(number),
+            'hash': '0x' + keccak(number.to_bytes(32, 'big')).hex(),
+            'parentHash': '0x' + keccak((number - 1).to_bytes(32, 'big')).hex(),
+            'baseFeePerGas': hex(self.gas_price),
+            'gasLimit': hex(BLOCK_GAS_LIMIT),
+            'gasUsed': hex(0),
+            'timestamp': hex(int(time.time())),
+            'transactions': transactions if full else [item['hash'] for item in transactions],
+        }
+
+    def eth_feeHistory(self, count, newest='latest', percentiles=None):
+        count = int(count, 16) if isinstance(count, str) else count
+        return {
+            'oldestBlock': hex(max(0, self.block - count)),
+            'baseFeePerGas': [hex(self.gas_price)] * (count + 1),
+            'gasUsedRatio': [0.5] * count,
+            'reward': [[hex(0)] * len(percentiles or [])] * count,
+        }
+
+    def eth_getLogs(self, log_filter):
+        def block_number(value, default):
+            if value in (None, 'latest', 'pending', 'safe', 'finalized'):
+                return default
+            return 0 if value == 'earliest' else int(value, 16)
+
+        from_block = block_number(log_filter.get('fromBlock'), self.block)
+        to_block = block_number(log_filter.get('toBlock'), self.block)
+        if to_block - from_block + 1 > LOG_RANGE_LIMIT:
+            raise Exception(f'query exceeds max block range {LOG_RANGE_LIMIT}')
+        address = log_filter.get('address')
+        addresses = {item.lower() for item in ([address] if isinstance(address, str) else address or [])}
+        topics = (log_filter.get('topics') or [None])[0]
+        topics = {topics} if isinstance(topics, str) else set(topics or [])
+        return [
+            log for log in self.logs
+            if from_block <= int(log['blockNumber'], 16) <= to_block
+            and (not addresses or log['address'] in addresses)
+            and (not topics or log['topics'][0] in topics)
+        ]
+
+    def eth_getTransactionReceipt(self, tx_hash):
+        item = self.receipts.get(tx_hash)
+        if item is None or item[0] > time.monotonic():
+            return None
+        return item[1]
+
+    def eth_getTransactionByHash(self, tx_hash):
+        item = self.receipts.get(tx_hash)
+        if item is not None:
+            receipt = item[1]
+            return {'hash': tx_hash, 'blockNumber': receipt['blockNumber'], 'from': receipt['from'], 'to': receipt['to']}
+        for sender, (pooled_hash, transaction, _) in self.mempool.items():
+            if pooled_hash == tx_hash:
+                return {'hash': tx_hash, 'blockNumber': None, 'from': sender, 'nonce': hex(transaction['nonce'])}
+        return None
+
+    def eth_getCode(self, address, block='latest'):
+        # Код есть только у контрактов, которые цепочка исполняет; содержимое не важно
+        address = address.lower()
+        if address in (self.nft_address, MULTICALL3_ADDRESS.lower()) or address in self.erc20:
+            return '0x00'
+        return '0x'
+
+    def eth_call(self, transaction, block='latest'):
+        to = (transaction.get('to') or '').lower()
+        data = Web3.to_bytes(hexstr=transaction.get('data') or transaction.get('input'))
+        if to == MULTICALL3_ADDRESS.lower():
+            return '0x' + self._aggregate3(data).hex()
+        success, result = self._call(to, data)
+        if not success:
+            raise Exception('execution reverted')
+        return '0x' + result.hex()
+
+    def eth_sendRawTransaction(self, raw_transaction):
+        raw = Web3.to_bytes(hexstr=raw_transaction)
+        sender = Account.recover_transaction(raw).lower()
+        if raw[0] < 0x80:
+            transaction = TypedTransaction.from_bytes(HexBytes(raw)).as_dict()
+            price = transaction.get('maxFeePerGas') or transaction.get('gasPrice')
+        else:
+            transaction = rlp.decode(raw, Transaction).as_dict()
+            price = transaction['gasPrice']
+
+        tx_hash = '0x' + keccak(raw).hex()
+        # Как geth и узлы zkSync: "already known" только для транзакции из мемпула,
+        # повтор уже включенной в блок отклоняется проверкой nonce ниже
+        if any(item[0] == tx_hash for item in self.mempool.values()):
+            raise Exception('already known')
+        nonce = transaction['nonce']
+        expected = self.nonces.get(sender, 0)
+        if nonce < expected:
+            raise Exception('nonce too low')
+        if nonce > expected:
+            raise Exception('nonce too high')
+        if self.balances.get(sender, 0) < transaction['value'] + transaction['gas'] * price:
+            raise Exception('insufficient funds for gas * price + value')
+
+        # Замена транзакции в мемпуле - только с комиссией выше на 10%
+        queued = self.mempool.get(sender)
+        if queued is not None and price * 10 < queued[2] * 11:
+            raise Exception('replacement transaction underpriced')
+        if price < self.gas_price:
+            # Комиссия ниже базовой - транзакция ждет в мемпуле
+            self.mempool[sender] = (tx_hash, transaction, price)
+            return tx_hash
+        self.mempool.pop(sender, None)
+        return self._execute(sender, transaction, tx_hash, price)
+
+    def set_base_fee(self, base_fee: int):
+        """Меняет базовую комиссию; транзакции мемпула, которые теперь проходят, включаются в блоки"""
+        self.gas_price = base_fee
+        for sender, (tx_hash, transaction, price) in list(self.mempool.items()):
+            if price >= base_fee:
+                del self.mempool[sender]
+                self._execute(sender, transaction, tx_hash, price)
+
+    def _execute(self, sender: str, transaction: dict, tx_hash: str, price: int) -> str:
+        if transaction.get('maxFeePerGas'):
+            # EIP-1559: платится базовая комиссия плюс чаевые, но не больше maxFeePerGas
+            price = min(price, self.gas_price + transaction.get('maxPriorityFeePerGas', 0))
+        nonce = transaction['nonce']
+        to = transaction['to']
+        to = ('0x' + to.hex() if isinstance(to, bytes) else to).lower()
+        data = transaction.get('data') or b''
+
+        status = 1
+        used = TRANSFER_GAS
+        logs_before = len(self.logs)
+        self.block += 1
+        if data:
+            used = CONTRACT_GAS
+            status = 1 if (self._erc20_transaction(sender, to, data) if to in self.erc20
+                           else self._nft_transaction(sender, to, data)) else 0
+        self.nonces[sender] = nonce + 1
+        self.balances[sender] -= used * price
+        if status == 1 and transaction['value']:
+            self.balances[sender] -= transaction['value']
+            self.balances[to] = self.balances.get(to, 0) + transaction['value']
+
+        for log in self.logs[logs_before:]:
+            log['transactionHash'] = tx_hash
+        receipt = {
+            'transactionHash': tx_hash,
+            'transactionIndex': '0x0',
+            'blockNumber': hex(self.block),
+            'blockHash': '0x' + keccak(self.block.to_bytes(32, 'big')).hex(),
+            'from': sender,
+            'to': to,
+            'status': hex(status),
+            'gasUsed': hex(used),
+            'cumulativeGasUsed': hex(used),
+            'effectiveGasPrice': hex(price),
+            'contractAddress': None,
+            'logs': self.logs[logs_before:],
+            'logsBloom': '0x' + '00' * 256,
+            'type': '0x0',
+        }
+        self.receipts[tx_hash] = (time.monotonic() + self.confirm_delay, receipt)
+        self.block_transactions[self.block] = [{
+            'hash': tx_hash,
+            'blockNumber': hex(self.block),
+            'from': sender,
+            'to': to,
+            'nonce': hex(nonce),
+            'value': hex(transaction['value']),
+            'gas': hex(transaction['gas']),
+        }]
+        return tx_hash
+
+    # NFT-коллекция
+
+    def _nft_call(self, to: str, data: bytes) -> tuple:
+        if self.nft is None or to != self.nft_address:
+            return False, b''
+        try:
+            function, args = self.nft.decode_function_input(data)
+        except Exception:
+            return False, b''
+
+        name = function.fn_name
+        if name == 'balanceOf':
+            value = len(self.tokens_of(args['owner']))
+        elif name == 'tokensOfOwner':
+            value = self.tokens_of(args['owner'])
+        elif name == 'tokensOfOwnerIn':
+            value = [token_id for token_id in self.tokens_of(args['owner']) if args['start'] <= token_id < args['stop']]
+        elif name == 'totalSupply':
+            value = len(self.owners)
+        elif name == 'ownerOf':
+            if args['tokenId'] not in self.owners:
+                return False, b''
+            value = Web3.to_checksum_address(self.owners[args['tokenId']])
+        elif name == 'isApprovedForAll':
+            value = (args['owner'].lower(), args['operator'].lower()) in self.approvals
+        else:
+            return False, b''
+
+        types = [output['type'] for output in function.abi['outputs']]
+        return True, encode(types, [value])
+
+    def _call(self, to: str, data: bytes) -> tuple:
+        if to == MULTICALL3_ADDRESS.lower():
+            function, args = self.multicall.decode_function_input(data)
+            if function.fn_name != 'getEthBalance':
+                return False, b''
+            return True, encode(['uint256'], [self.balances.get(args['addr'].lower(), 0)])
+        if to in self.erc20:
+            try:
+                function, args = self.erc20_codec.decode_function_input(data)
+            except Exception:
+                return False, b''
+            if function.fn_name != 'balanceOf':
+                return False, b''
+            return True, encode(['uint256'], [self.erc20[to].get(args['account'].lower(), 0)])
+        return self._nft_call(to, data)
+
+    def _erc20_transaction(self, sender: str, to: str, data: bytes) -> bool:
+        function, args = self.erc20_codec.decode_function_input(data)
+        balances = self.erc20[to]
+        if function.fn_name != 'transfer' or balances.get(sender, 0) < args['value']:
+            return False
+        balances[sender] -= args['value']
+        balances[args['to'].lower()] = balances.get(args['to'].lower(), 0) + args['value']
+        return True
+
+    def _aggregate3(self, data: bytes) -> bytes:
+        _, args = self.multicall.decode_function_input(data)
+        results = [self._call(call['target'].lower(), call['callData']) for call in args['calls']]
+        return encode(['(bool,bytes)[]'], [results])
+
+    def _nft_transaction(self, sender: str, to: str, data: bytes) -> bool:
+        if self.nft is None or to != self.nft_address:
+            return False
+        function, args = self.nft.decode_function_input(data)
+        name = function.fn_name
+        if name == 'setApprovalForAll':
+            pair = (sender, args['operator'].lower())
+            if args['approved']:
+                self.approvals.add(pair)
+            else:
+                self.approvals.discard(pair)
+            return True
+        if name in ('transferFrom', 'safeTransferFrom'):
+            owner = self.owners.get(args['tokenId'])
+            source = args['from'].lower()
+            if owner != source or (sender != source and (source, sender) not in self.approvals):
+                return False
+            self.owners[args['tokenId']] = args['to'].lower()
+            self._log([TRANSFER_TOPIC, _topic(source), _topic(args['to']), _topic(args['tokenId'])])
+            return True
+        return False
+
+    def _log(self, topics: list, data: str = '0x'):
+        self.logs.append({
+            'address': self.nft_address,
+            'topics': topics,
+            'data': data,
+            'blockNumber': hex(self.block),
+            'blockHash': '0x' + keccak(self.block.to_bytes(32, 'big')).hex(),
+            'transactionHash': '0x' + keccak(len(self.logs).to_bytes(32, 'big')).hex(),
+            'transactionIndex': '0x0',
+            'logIndex': hex(len(self.logs)),
+            'removed': False,
+        })
+
+def _topic(value) -> str:
+    """Адрес или число в виде 32-байтного топика события"""
+    if isinstance(value, str):
+        return '0x' + '00' * 12 + value.lower()[2:]
+    return '0x' + value.to_bytes(32, 'big').hex()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Без Nagle ответ keep-alive не ждет задержанного ACK клиента
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code: int, data: bytes = b''):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server.count_request()
+
+        if server.latency:
+            time.sleep(server.latency * random.uniform(1 - server.jitter, 1 + server.jitter))
+        if server.error_rate and random.random() < server.error_rate:
+            # Имитация ограничения частоты у публичного RPC
+            server.failures += 1
+            self._reply(429, b'{"error": "Too Many Requests"}')
+            return
+
+        request = json.loads(body)
+        if isinstance(request, list):
+            response = [server.chain.handle(item) for item in request]
+        else:
+            response = server.chain.handle(request)
+        self._reply(200, json.dumps(response).encode())
+
+class MockRPCServer(ThreadingHTTPServer):
+    """
+    JSON-RPC сервер в процессе для бенчмарков и отладки без сети.
+    latency - задержка каждого HTTP-запроса в секундах (± jitter),
+    error_rate - доля запросов, на которые отвечается HTTP 429
+    """
+
+    daemon_threads = True
+
+    def __init__(self, chain: MockChain = None, latency: float = 0.0, jitter: float = 0.2, error_rate: float = 0.0,
+                 port: int = 0):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.chain = chain or MockChain()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.failures = 0
+        self._counter_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count_request(self):
+        with self._counter_lock:
+            self.requests += 1
+
+    def rpc_calls(self) -> int:
+        """Сколько JSON-RPC вызовов обработано (элементы батча считаются по одному)"""
+        return sum(self.chain.calls.values())
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.serve_forever, name='mock-rpc', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
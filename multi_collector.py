@@ -0,0 +1,307 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from web3 import Web3
+from logger import log_message, DEBUG, WARNING, ERROR
+from multicall import aggregate3, encode_call, MULTICALL3_ADDRESS, MULTICALL3_ABI
+from rpc import batch_request, chunked, RPCError
+from wallets import load_account, iter_unique_keys
+from journal import RunJournal, PENDING, BROADCAST, FAILED
+from receipt_tracker import CONFIRMED
+from nonce_manager import send_raw_transaction
+
+# RPC, nonce, трекер подтверждений и кэш газа общие для всех скриптов (core.py)
+from core import CHAIN_ID, rpc_pool, w3, nonce_manager, receipt_tracker, gas_cache
+
+# Сбор сразу нескольких контрактов ERC-721 и ERC-20: один общий проход
+# Multicall3 на пачку кошельков (баланс ETH и balanceOf по всем контрактам),
+# затем переводы каждого кошелька уходят одной очередью по nonce.
+# Стоимость сканирования платится один раз на кошелек, а не на кошелек и контракт
+
+ERC721 = 'erc721'
+ERC20 = 'erc20'
+
+# Минимальные ABI: только то, что нужно для поиска и перевода
+ERC721_ABI = [
+    {"inputs": [{"name": "owner", "type": "address"}], "name": "balanceOf",
+     "outputs": [{"name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [{"name": "owner", "type": "address"}], "name": "tokensOfOwner",
+     "outputs": [{"name": "", "type": "uint256[]"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [{"name": "owner", "type": "address"}, {"name": "index", "type": "uint256"}], "name": "tokenOfOwnerByIndex",
+     "outputs": [{"name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [{"name": "from", "type": "address"}, {"name": "to", "type": "address"}, {"name": "tokenId", "type": "uint256"}],
+     "name": "transferFrom", "outputs": [], "stateMutability": "payable", "type": "function"},
+]
+ERC20_ABI = [
+    {"inputs": [{"name": "account", "type": "address"}], "name": "balanceOf",
+     "outputs": [{"name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
+    {"inputs": [{"name": "to", "type": "address"}, {"name": "value", "type": "uint256"}], "name": "transfer",
+     "outputs": [{"name": "", "type": "bool"}], "stateMutability": "nonpayable", "type": "function"},
+]
+
+# Сколько кошельков сканируется за один проход и сколько обрабатываются параллельно
+SCAN_BATCH_SIZE = 1000
+COLLECT_CONCURRENCY = 20
+
+class Asset:
+    """Контракт для сбора: ERC-721 (все токены) или ERC-20 (весь баланс)"""
+
+    def __init__(self, kind: str, address: str):
+        if kind not in (ERC721, ERC20):
+            raise ValueError(f"Неизвестный тип контракта: {kind}")
+        self.kind = kind
+        self.address = Web3.to_checksum_address(address)
+        self.contract = w3.eth.contract(address=self.address, abi=ERC721_ABI if kind == ERC721 else ERC20_ABI)
+
+    def __repr__(self):
+        return f"{self.kind}:{self.address}"
+
+def parse_asset(spec: str) -> Asset:
+    """Контракт из строки вида erc721:0x... или erc20:0x..."""
+    kind, _, address = spec.partition(':')
+    return Asset(kind.strip().lower(), address.strip())
+
+def asset_key(asset: Asset, item) -> str:
+    """Ключ перевода в журнале: токен ERC-721 или баланс ERC-20 кошелька"""
+    if asset.kind == ERC721:
+        # Тот же формат, что у token_collector.token_key
+        return f"collect-nft:{asset.address}:{item}"
+    return f"collect-erc20:{asset.address}:{item}"
+
+def scan_holdings(addresses: list, assets: list, chunk_size: int = 200) -> tuple:
+    """
+    Один проход Multicall3 по всем кошелькам и контрактам: баланс ETH
+    (getEthBalance) и balanceOf каждого контракта. Для держателей ERC-721
+    затем tokensOfOwner (ERC-721A), при неудаче - tokenOfOwnerByIndex
+
+    :return: ({адрес: баланс ETH}, {адрес: [(asset, token_id или сумма), ...]})
+    """
+    multicall = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+    calls = []
+    for address in addresses:
+        calls.append((MULTICALL3_ADDRESS, encode_call(multicall.functions.getEthBalance(address))))
+        for asset in assets:
+            calls.append((asset.address, encode_call(asset.contract.functions.balanceOf(address))))
+    results = aggregate3(w3, calls, chunk_size)
+
+    eth_balances = {}
+    balances = []
+    step = len(assets) + 1
+    for position, address in enumerate(addresses):
+        row = results[position * step:(position + 1) * step]
+        success, data = row[0]
+        if success:
+            eth_balances[address] = w3.codec.decode(['uint256'], data)[0]
+        for asset, (success, data) in zip(assets, row[1:]):
+            if success:
+                balance = w3.codec.decode(['uint256'], data)[0]
+                if balance > 0:
+                    balances.append((address, asset, balance))
+
+    holdings = {}
+    nft_holders = []
+    for address, asset, balance in balances:
+        if asset.kind == ERC20:
+            holdings.setdefault(address, []).append((asset, balance))
+        else:
+            nft_holders.append((address, asset, balance))
+
+    # Токены всех держателей всех коллекций - одним набором aggregate3
+    results = aggregate3(w3, [
+        (asset.address, encode_call(asset.contract.functions.tokensOfOwner(address)))
+        for address, asset, _ in nft_holders
+    ], chunk_size)
+    enumerable = []
+    found = {}
+    for (address, asset, balance), (success, data) in zip(nft_holders, results):
+        if success:
+            found[(address, asset.address)] = list(w3.codec.decode(['uint256[]'], data)[0])
+        else:
+            enumerable.append((address, asset, balance))
+
+    # Коллекции без tokensOfOwner: ERC721Enumerable по индексу
+    by_index = [(address, asset, index) for address, asset, balance in enumerable for index in range(balance)]
+    results = aggregate3(w3, [
+        (asset.address, encode_call(asset.contract.functions.tokenOfOwnerByIndex(address, index)))
+        for address, asset, index in by_index
+    ], chunk_size)
+    for (address, asset, _), (success, data) in zip(by_index, results):
+        if success:
+            found.setdefault((address, asset.address), []).append(w3.codec.decode(['uint256'], data)[0])
+    for address, asset, balance in enumerable:
+        if (address, asset.address) not in found:
+            log_message(f"⚠️ {asset}: не удалось перечислить {balance} токенов {address} "
+                        f"(нет tokensOfOwner и tokenOfOwnerByIndex)", WARNING)
+
+    for address, asset, _ in nft_holders:
+        for token_id in found.get((address, asset.address), []):
+            holdings.setdefault(address, []).append((asset, token_id))
+    return eth_balances, holdings
+
+def transfer_call(asset: Asset, owner: str, to_address: str, item):
+    """Вызов перевода: transferFrom токена ERC-721 или transfer всего баланса ERC-20"""
+    if asset.kind == ERC721:
+        return asset.contract.functions.transferFrom(owner, to_address, item)
+    return asset.contract.functions.transfer(to_address, item)
+
+def collect_wallet(account, holdings: list, eth_balance: int, destination_address: str,
+                   journal: RunJournal = None) -> int:
+    """
+    Отправляет все переводы кошелька подряд с локальными nonce без ожидания
+    подтверждений. Переводы, на газ которых не хватает ETH, не отправляются;
+    перевод, оценка газа которого не прошла (например, revert), пропускается;
+    после ошибки отправки очередь кошелька останавливается, чтобы не
+    оставлять пропусков в nonce
+
+    :return: число отправленных транзакций
+    """
+    owner = account.address
+    gas_price = gas_cache.gas_price()
+    sent = 0
+    for asset, item in holdings:
+        journal_key = asset_key(asset, item if asset.kind == ERC721 else owner)
+        function = transfer_call(asset, owner, destination_address, item)
+        label = f"{asset} #{item}" if asset.kind == ERC721 else f"{asset} x{item}"
+        try:
+            data = function._encode_transaction_data()
+            # Оценка газа одна на функцию и контракт
+            gas = gas_cache.estimate_gas((function.fn_name, asset.address),
+                                         {'from': owner, 'to': asset.address, 'data': data})
+        except Exception as e:
+            # nonce еще не выдан - остальные переводы кошелька можно отправлять
+            log_message(f"❌ {owner}: оценка газа {label} не прошла: {str(e)}", ERROR)
+            if journal is not None:
+                journal.record(journal_key, FAILED, error=str(e))
+            continue
+        if eth_balance < gas * gas_price:
+            log_message(f"⚠️ {owner}: не хватает ETH на газ, не отправлено переводов: {len(holdings) - sent}", WARNING)
+            break
+        eth_balance -= gas * gas_price
+
+        def sign_and_send(nonce: int):
+            signed = account.sign_transaction({
+                'nonce': nonce,
+                'to': asset.address,
+                'value': 0,
+                'data': data,
+                'chainId': CHAIN_ID,
+                'gas': gas,
+                'gasPrice': gas_price
+            })
+            if journal is not None:
+                journal.record(journal_key, PENDING, signed.hash)
+            return send_raw_transaction(w3, signed.raw_transaction)
+
+        try:
+            tx_hash = nonce_manager.send(owner, sign_and_send)
+        except Exception as e:
+            log_message(f"❌ {owner}: ошибка при отправке {label}: {str(e)}", ERROR)
+            if journal is not None:
+                journal.record(journal_key, FAILED, error=str(e))
+            break
+        if journal is not None:
+            journal.record(journal_key, BROADCAST, tx_hash)
+
+        def on_receipt(tx_hash, status, receipt, label=label):
+            if status == CONFIRMED:
+                log_message(f"✅ Собрано {label}", DEBUG)
+            else:
+                log_message(f"❌ Перевод {label}: {status}", ERROR)
+
+        callback = journal.tracker_callback(journal_key, on_receipt) if journal else on_receipt
+        receipt_tracker.track(tx_hash, callback)
+        sent += 1
+    if sent:
+        log_message(f"📨 {owner}: отправлено переводов {sent}")
+    return sent
+
+def collect_assets_from_csv(filename: str, destination_address: str, assets: list, journal: RunJournal = None,
+                            concurrency: int = COLLECT_CONCURRENCY, batch_size: int = SCAN_BATCH_SIZE):
+    """
+    Собирает все токены перечисленных контрактов со всех ключей из CSV.
+    Ключи читаются потоково пачками по batch_size: по каждой пачке один
+    общий проход Multicall3, один батч pending nonce для держателей, затем
+    кошельки обрабатываются параллельно, а переводы одного кошелька идут
+    по порядку nonce. С журналом уже собранное пропускается
+    """
+    log_message(f"🔄 Начало сбора: {', '.join(map(repr, assets))}")
+
+    if not os.path.exists(filename):
+        log_message(f"❌ Файл {filename} не найден", ERROR)
+        return
+
+    destination_address = Web3.to_checksum_address(destination_address)
+    if journal is not None:
+        counts = journal.reconcile(rpc_pool)
+        log_message(f"📒 Журнал {journal.path}: подтверждено {counts[CONFIRMED]}, отклонено {counts[FAILED]}, в пути {counts[BROADCAST]}")
+
+    totals = {'wallets': 0, 'holders': 0, 'transfers': 0}
+
+    def process_batch(accounts: list):
+        eth_balances, holdings = scan_holdings([account.address for account in accounts], assets)
+        if journal is not None:
+            holdings = {
+                address: [
+                    (asset, item) for asset, item in items
+                    if not journal.should_skip(asset_key(asset, item if asset.kind == ERC721 else address))
+                ]
+                for address, items in holdings.items()
+            }
+            holdings = {address: items for address, items in holdings.items() if items}
+        holders = [account for account in accounts if account.address in holdings]
+
+        # Pending nonce всех держателей одним проходом батчей
+        nonces = {}
+        for chunk in chunked(holders, 100):
+            results = batch_request(rpc_pool, [('eth_getTransactionCount', [account.address, 'pending']) for account in chunk])
+            for account, result in zip(chunk, results):
+                if not isinstance(result, RPCError):
+                    nonces[account.address] = int(result, 16)
+        nonce_manager.prime(nonces)
+
+        def collect(account) -> int:
+            # Ошибка одного кошелька не прерывает executor.map для остальных
+            try:
+                return collect_wallet(account, holdings[account.address], eth_balances.get(account.address, 0),
+                                      destination_address, journal)
+            except Exception as e:
+                log_message(f"❌ {account.address}: ошибка сбора: {str(e)}", ERROR)
+                return 0
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='collect') as executor:
+            sent = sum(executor.map(collect, holders))
+        totals['wallets'] += len(accounts)
+        totals['holders'] += len(holders)
+        totals['transfers'] += sent
+        log_message(f"📋 Пачка из {len(accounts)} кошельков: с токенами {len(holders)}, отправлено {sent}")
+
+    def run_batch(accounts: list):
+        # Сбой пачки (например, сканирования) не отменяет следующие пачки и ожидание квитанций
+        try:
+            process_batch(accounts)
+        except Exception as e:
+            log_message(f"❌ Пачка из {len(accounts)} кошельков пропущена: {str(e)}", ERROR)
+
+    from main import log_invalid_row
+    batch = []
+    for private_key in iter_unique_keys(filename, log_invalid_row):
+        try:
+            batch.append(load_account(private_key))
+        except Exception as e:
+            log_message(f"❌ Ошибка ключа: {str(e)}", ERROR)
+            continue
+        if len(batch) >= batch_size:
+            run_batch(batch)
+            batch = []
+    if batch:
+        run_batch(batch)
+
+    log_message("⏳ Ожидание подтверждения отправленных транзакций...")
+    receipt_tracker.wait_all()
+    summary = receipt_tracker.summary()
+
+    log_message(f"\n{'='*50}")
+    log_message(f"✨ Сбор завершен")
+    log_message(f"📋 Проверено кошельков: {totals['wallets']}, с токенами: {totals['holders']}")
+    log_message(f"📊 Отправлено транзакций: {totals['transfers']}")
+    log_message(f"📊 Подтверждено: {summary['confirmed']}, отклонено: {summary['failed']}, без ответа: {summary['timeout']}")
+    return totals
@@ -0,0 +1,65 @@
+from web3 import Web3
+
+# Multicall3 в сети Abstract (chainId 2741)
+MULTICALL3_ADDRESS = Web3.to_checksum_address("0xAa4De41dba0Ca5dCBb288b7cC6b708F3aaC759E7")
+
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    },
+    {
+        "inputs": [{"internalType": "address", "name": "addr", "type": "address"}],
+        "name": "getEthBalance",
+        "outputs": [{"internalType": "uint256", "name": "balance", "type": "uint256"}],
+        "stateMutability": "view",
+        "type": "function"
+    }
+]
+
+def encode_call(function) -> bytes:
+    """Calldata для вызова функции контракта (contract.functions.xxx(...))"""
+    return Web3.to_bytes(hexstr=function._encode_transaction_data())
+
+def aggregate3(w3, calls: list, chunk_size: int = 200, block_identifier='latest') -> list:
+    """
+    Выполняет eth_call пачками через Multicall3.aggregate3
+
+    :param calls: список пар (адрес контракта, calldata)
+    :param chunk_size: сколько вызовов в одном aggregate3
+    :return: список пар (success, returnData) в том же порядке
+    """
+    multicall = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+    results = []
+    for start in range(0, len(calls), chunk_size):
+        chunk = calls[start:start + chunk_size]
+        results.extend(
+            multicall.functions.aggregate3(
+                [(target, True, calldata) for target, calldata in chunk]
+            ).call(block_identifier=block_identifier)
+        )
+    return results
@@ -0,0 +1,188 @@
+import sqlite3
+import threading
+from eth_utils import keccak
+from web3 import Web3
+from logger import log_message, DEBUG
+from rpc import batch_request, RPCError
+
+# Локальный индекс владельцев NFT по событиям контракта: Transfer и
+# ConsecutiveTransfer (ERC-2309, пачечный минт ERC-721A) загружаются
+# диапазонами eth_getLogs и складываются в SQLite. Повторный запуск
+# догружает только блоки после последнего проиндексированного, а вопрос
+# "какие токены на моих кошельках" решается запросом к базе без RPC
+
+NFT_INDEX_PATH = "nft_index.sqlite"
+
+TRANSFER_TOPIC = '0x' + keccak(text='Transfer(address,address,uint256)').hex()
+CONSECUTIVE_TRANSFER_TOPIC = '0x' + keccak(text='ConsecutiveTransfer(uint256,uint256,address,address)').hex()
+ZERO_ADDRESS = '0x' + '00' * 20
+
+# Диапазон блоков одного eth_getLogs; при ошибке "слишком много" делится пополам
+LOG_CHUNK_BLOCKS = 5000
+MIN_LOG_CHUNK_BLOCKS = 16
+# Сколько диапазонов eth_getLogs уходит одним батчем JSON-RPC
+LOG_RANGES_PER_BATCH = 4
+# SQLite ограничивает число параметров запроса
+QUERY_CHUNK_SIZE = 500
+
+def topic_address(topic: str) -> str:
+    """Адрес из 32-байтного топика события"""
+    return Web3.to_checksum_address('0x' + topic[-40:])
+
+def topic_int(topic: str) -> int:
+    return int(topic, 16)
+
+class NFTIndex:
+    """
+    Индекс владельцев токенов одного контракта в SQLite.
+    token_id хранится строкой: uint256 не помещается в INTEGER SQLite
+    """
+
+    def __init__(self, contract_address: str, path: str = NFT_INDEX_PATH, start_block: int = 0):
+        self.contract_address = Web3.to_checksum_address(contract_address)
+        self.path = path
+        self.start_block = start_block
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS owners (
+                contract TEXT NOT NULL,
+                token_id TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                block INTEGER NOT NULL,
+                PRIMARY KEY (contract, token_id)
+            );
+            CREATE INDEX IF NOT EXISTS owners_by_owner ON owners (contract, owner);
+            CREATE TABLE IF NOT EXISTS progress (
+                contract TEXT PRIMARY KEY,
+                last_block INTEGER NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    @property
+    def last_block(self) -> int:
+        """Последний проиндексированный блок (start_block - 1, если индекс пуст)"""
+        row = self._db.execute("SELECT last_block FROM progress WHERE contract = ?", (self.contract_address,)).fetchone()
+        return row[0] if row else self.start_block - 1
+
+    def apply_logs(self, logs: list, to_block: int):
+        """
+        Применяет события по порядку (блок, logIndex) и сдвигает last_block
+        в той же транзакции SQLite: после падения индекс продолжит с
+        последнего целиком обработанного диапазона
+        """
+        logs = sorted(logs, key=lambda log: (topic_int(log['blockNumber']), topic_int(log['logIndex'])))
+        with self._lock, self._db:
+            for log in logs:
+                if log.get('removed'):
+                    continue
+                topics = log['topics']
+                block = topic_int(log['blockNumber'])
+                if topics[0] == TRANSFER_TOPIC and len(topics) == 4:
+                    self._set_owner([topic_int(topics[3])], topic_address(topics[2]), block)
+                elif topics[0] == CONSECUTIVE_TRANSFER_TOPIC:
+                    first, last = topic_int(topics[1]), int(log['data'], 16)
+                    self._set_owner(range(first, last + 1), topic_address(topics[3]), block)
+            self._db.execute(
+                "INSERT INTO progress (contract, last_block) VALUES (?, ?) "
+                "ON CONFLICT (contract) DO UPDATE SET last_block = excluded.last_block",
+                (self.contract_address, to_block)
+            )
+
+    def _set_owner(self, token_ids, owner: str, block: int):
+        if owner.lower() == ZERO_ADDRESS:
+            # Сжигание
+            self._db.executemany(
+                "DELETE FROM owners WHERE contract = ? AND token_id = ?",
+                ((self.contract_address, str(token_id)) for token_id in token_ids)
+            )
+            return
+        self._db.executemany(
+            "INSERT INTO owners (contract, token_id, owner, block) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (contract, token_id) DO UPDATE SET owner = excluded.owner, block = excluded.block",
+            ((self.contract_address, str(token_id), owner, block) for token_id in token_ids)
+        )
+
+    def sync(self, rpc, to_block: int = None, chunk_blocks: int = LOG_CHUNK_BLOCKS) -> int:
+        """
+        Догружает события с last_block + 1 до to_block (по умолчанию текущий блок)
+        батчами eth_getLogs по несколько диапазонов. Диапазон, на который RPC
+        ответил ошибкой (слишком много логов или блоков), делится пополам
+
+        :param rpc: адрес RPC или пул узлов
+        :return: число примененных событий
+        """
+        if to_block is None:
+            to_block = int(batch_request(rpc, [('eth_blockNumber', [])])[0], 16)
+        start = self.last_block + 1
+        if start > to_block:
+            return 0
+
+        log_message(f"🗂️ Индекс NFT: блоки {start}..{to_block}")
+        applied = 0
+        pending = []
+        while start <= to_block or pending:
+            # Набираем диапазоны подряд: отложенные после деления идут первыми
+            ranges = pending[:LOG_RANGES_PER_BATCH]
+            pending = pending[LOG_RANGES_PER_BATCH:]
+            while len(ranges) < LOG_RANGES_PER_BATCH and start <= to_block:
+                stop = min(start + chunk_blocks - 1, to_block)
+                ranges.append((start, stop))
+                start = stop + 1
+
+            results = batch_request(rpc, [
+                ('eth_getLogs', [{
+                    'address': self.contract_address,
+                    'fromBlock': hex(first),
+                    'toBlock': hex(last),
+                    'topics': [[TRANSFER_TOPIC, CONSECUTIVE_TRANSFER_TOPIC]],
+                }])
+                for first, last in ranges
+            ])
+
+            # Диапазоны применяются строго по порядку: после первой ошибки
+            # остальные откладываются, чтобы last_block не перескочил дыру
+            for position, ((first, last), result) in enumerate(zip(ranges, results)):
+                if isinstance(result, RPCError):
+                    if last - first + 1 <= MIN_LOG_CHUNK_BLOCKS:
+                        raise result
+                    middle = (first + last) // 2
+                    chunk_blocks = max(MIN_LOG_CHUNK_BLOCKS, (last - first + 1) // 2)
+                    log_message(f"⚠️ eth_getLogs {first}..{last}: {result.message}, диапазон уменьшен до {chunk_blocks}", DEBUG)
+                    pending = [(first, middle), (middle + 1, last)] + ranges[position + 1:] + pending
+                    break
+                self.apply_logs(result, last)
+                applied += len(result)
+
+        log_message(f"✅ Индекс NFT до блока {to_block}: событий {applied}, токенов {self.count()}")
+        return applied
+
+    def tokens_of(self, addresses: list) -> dict:
+        """{адрес: [token_id, ...]} только для адресов с токенами, без запросов к RPC"""
+        addresses = [Web3.to_checksum_address(address) for address in addresses]
+        inventory = {}
+        with self._lock:
+            for start in range(0, len(addresses), QUERY_CHUNK_SIZE):
+                chunk = addresses[start:start + QUERY_CHUNK_SIZE]
+                rows = self._db.execute(
+                    f"SELECT owner, token_id FROM owners WHERE contract = ? AND owner IN ({','.join('?' * len(chunk))})",
+                    [self.contract_address] + chunk
+                )
+                for owner, token_id in rows:
+                    inventory.setdefault(owner, []).append(int(token_id))
+        for token_ids in inventory.values():
+            token_ids.sort()
+        return inventory
+
+    def owner_of(self, token_id: int) -> str:
+        row = self._db.execute(
+            "SELECT owner FROM owners WHERE contract = ? AND token_id = ?", (self.contract_address, str(token_id))
+        ).fetchone()
+        return row[0] if row else None
+
+    def count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM owners WHERE contract = ?", (self.contract_address,)).fetchone()[0]
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,185 @@
+import asyncio
+import threading
+from eth_utils import keccak
+from hexbytes import HexBytes
+from rpc import ALREADY_KNOWN_MESSAGES, NONCE_MESSAGES
+
+# Фрагменты сообщений RPC, после которых локальный nonce нужно пересинхронизировать.
+# "already known" сюда не входит: та же сырая транзакция уже в мемпуле,
+# повторная подпись с новым nonce отправила бы перевод второй раз
+NONCE_ERRORS = NONCE_MESSAGES
+
+def is_nonce_error(error: Exception) -> bool:
+    """Проверяет, связана ли ошибка RPC с nonce"""
+    message = str(error).lower()
+    return any(fragment in message for fragment in NONCE_ERRORS)
+
+def is_already_known(error: Exception) -> bool:
+    """Узел уже знает ровно эту транзакцию"""
+    message = str(error).lower()
+    return any(fragment in message for fragment in ALREADY_KNOWN_MESSAGES)
+
+def send_raw_transaction(w3, raw_transaction) -> HexBytes:
+    """
+    eth_sendRawTransaction для send_with_nonce: ответ "already known"
+    считается успехом, хэш - keccak от сырой транзакции. К остальным
+    ошибкам добавляется tx_hash попытки: по нему NonceManager.send
+    проверяет, не попала ли она в блок
+    """
+    try:
+        return w3.eth.send_raw_transaction(raw_transaction)
+    except Exception as e:
+        if is_already_known(e):
+            return HexBytes(keccak(HexBytes(raw_transaction)))
+        e.tx_hash = HexBytes(keccak(HexBytes(raw_transaction)))
+        raise
+
+async def send_raw_transaction_async(aw3, raw_transaction) -> HexBytes:
+    """Асинхронный вариант send_raw_transaction"""
+    try:
+        return await aw3.eth.send_raw_transaction(raw_transaction)
+    except Exception as e:
+        if is_already_known(e):
+            return HexBytes(keccak(HexBytes(raw_transaction)))
+        e.tx_hash = HexBytes(keccak(HexBytes(raw_transaction)))
+        raise
+
+def _attempt_hash(error: Exception):
+    """Хэш подписанной попытки для ошибки nonce (см. send_raw_transaction) или None"""
+    return getattr(error, 'tx_hash', None) if is_nonce_error(error) else None
+
+class NonceManager:
+    """
+    Локальный менеджер nonce: pending nonce запрашивается у RPC один раз
+    на адрес, дальше номера выдаются локально без обращения к сети
+    """
+
+    def __init__(self, w3):
+        self.w3 = w3
+        self._nonces = {}
+        self._lock = threading.Lock()
+
+    def next_nonce(self, address: str) -> int:
+        """Выдает следующий nonce для адреса"""
+        with self._lock:
+            if address not in self._nonces:
+                self._nonces[address] = self.w3.eth.get_transaction_count(address, 'pending')
+            nonce = self._nonces[address]
+            self._nonces[address] = nonce + 1
+            return nonce
+
+    def prime(self, nonces: dict):
+        """
+        Заполняет nonce адресов из уже полученного среза (батч
+        eth_getTransactionCount), адреса с локальным nonce не трогаются
+        """
+        with self._lock:
+            for address, nonce in nonces.items():
+                self._nonces.setdefault(address, nonce)
+
+    def release(self, address: str, nonce: int):
+        """
+        Возвращает nonce транзакции, которая не была отправлена.
+        Если после нее уже выданы другие номера, образовался пропуск -
+        в этом случае состояние адреса сбрасывается и будет запрошено заново
+        """
+        with self._lock:
+            if self._nonces.get(address) == nonce + 1:
+                self._nonces[address] = nonce
+            else:
+                self._nonces.pop(address, None)
+
+    def resync(self, address: str) -> int:
+        """Заново запрашивает pending nonce у RPC (после "nonce too low" и т.п.)"""
+        with self._lock:
+            self._nonces[address] = self.w3.eth.get_transaction_count(address, 'pending')
+            return self._nonces[address]
+
+    def _known(self, tx_hash) -> bool:
+        try:
+            return self.w3.eth.get_transaction(tx_hash) is not None
+        except Exception:
+            return False
+
+    def send(self, address: str, send_with_nonce, retries: int = 1):
+        """
+        Вызывает send_with_nonce(nonce) с локальным nonce.
+        При "nonce too low/high" сначала проверяется хэш уже подписанной
+        попытки: если узел ее знает (попытка дошла, ответ потерялся),
+        возвращается он. Иначе nonce пересинхронизируется и отправка
+        повторяется. send_with_nonce отправляет через send_raw_transaction,
+        чтобы "already known" вернулось хэшем, а хэш попытки - в ошибке
+        """
+        while True:
+            nonce = self.next_nonce(address)
+            try:
+                return send_with_nonce(nonce)
+            except Exception as e:
+                tx_hash = _attempt_hash(e)
+                if tx_hash is not None and self._known(tx_hash):
+                    return tx_hash
+                if is_nonce_error(e) and retries > 0:
+                    retries -= 1
+                    self.resync(address)
+                    continue
+                self.release(address, nonce)
+                raise
+
+class AsyncNonceManager:
+    """Асинхронный вариант NonceManager для AsyncWeb3"""
+
+    def __init__(self, aw3):
+        self.aw3 = aw3
+        self._nonces = {}
+        self._locks = {}
+
+    def _lock(self, address: str) -> asyncio.Lock:
+        if address not in self._locks:
+            self._locks[address] = asyncio.Lock()
+        return self._locks[address]
+
+    async def next_nonce(self, address: str) -> int:
+        """Выдает следующий nonce для адреса"""
+        async with self._lock(address):
+            if address not in self._nonces:
+                self._nonces[address] = await self.aw3.eth.get_transaction_count(address, 'pending')
+            nonce = self._nonces[address]
+            self._nonces[address] = nonce + 1
+            return nonce
+
+    async def release(self, address: str, nonce: int):
+        """Возвращает nonce неотправленной транзакции (см. NonceManager.release)"""
+        async with self._lock(address):
+            if self._nonces.get(address) == nonce + 1:
+                self._nonces[address] = nonce
+            else:
+                self._nonces.pop(address, None)
+
+    async def resync(self, address: str) -> int:
+        """Заново запрашивает pending nonce у RPC"""
+        async with self._lock(address):
+            self._nonces[address] = await self.aw3.eth.get_transaction_count(address, 'pending')
+            return self._nonces[address]
+
+    async def _known(self, tx_hash) -> bool:
+        try:
+            return await self.aw3.eth.get_transaction(tx_hash) is not None
+        except Exception:
+            return False
+
+    async def send(self, address: str, send_with_nonce, retries: int = 1):
+        """Асинхронный вариант NonceManager.send, send_with_nonce - корутина"""
+        while True:
+            nonce = await self.next_nonce(address)
+            try:
+                return await send_with_nonce(nonce)
+            except Exception as e:
+                tx_hash = _attempt_hash(e)
+                if tx_hash is not None and await self._known(tx_hash):
+                    return tx_hash
+                if is_nonce_error(e) and retries > 0:
+                    retries -= 1
+                    await self.resync(address)
+                    continue
+                await self.release(address, nonce)
+                raise
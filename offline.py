@@ -0,0 +1,246 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from eth_account import Account
+from logger import log_message, WARNING, ERROR
+from rpc import batch_request, send_raw_batch, chunked, RPCError
+from wallets import normalize_key, iter_wallets, SeenSet
+from journal import RunJournal, PENDING, BROADCAST, FAILED
+
+# RPC, трекер подтверждений и кэш газа общие для всех скриптов (core.py)
+from core import CHAIN_ID, rpc_pool, w3, receipt_tracker, gas_cache
+
+# Двухфазная рассылка: sign_distribution подписывает все переводы заранее
+# (несколькими процессами) и пишет сырые транзакции в JSONL-файл,
+# broadcast_signed отправляет файл одним потоком eth_sendRawTransaction.
+# Файл можно проверить перед отправкой и отправить повторно
+
+# Сколько строк получает процесс подписи за один раз
+SIGN_CHUNK_SIZE = 256
+# Сколько eth_sendRawTransaction уходит одним батчем
+BROADCAST_BATCH_SIZE = 50
+
+def _derive_address(private_key: str) -> str:
+    """Выполняется в процессе подписи"""
+    return Account.from_key(private_key).address
+
+def _sign_transfer(job: tuple) -> tuple:
+    """Выполняется в процессе подписи: (индекс, ключ, получатель, nonce, value, gas, gasPrice, chainId)"""
+    index, private_key, to_address, nonce, value, gas, gas_price, chain_id = job
+    signed = Account.sign_transaction({
+        'nonce': nonce,
+        'to': to_address,
+        'value': value,
+        'chainId': chain_id,
+        'gas': gas,
+        'gasPrice': gas_price
+    }, private_key)
+    return index, '0x' + bytes(signed.raw_transaction).hex(), '0x' + bytes(signed.hash).hex()
+
+def _snapshot(addresses: list, batch_size: int = 100) -> dict:
+    """Pending nonce и баланс адресов одним проходом батчей: {адрес: (nonce, баланс)}"""
+    snapshot = {}
+    for chunk in chunked(addresses, batch_size // 2):
+        calls = []
+        for address in chunk:
+            calls.append(('eth_getTransactionCount', [address, 'pending']))
+            calls.append(('eth_getBalance', [address, 'latest']))
+        results = batch_request(rpc_pool, calls)
+        for index, address in enumerate(chunk):
+            nonce, balance = results[2 * index], results[2 * index + 1]
+            if isinstance(nonce, RPCError) or isinstance(balance, RPCError):
+                log_message(f"❌ Ошибка среза {address}: {str(nonce if isinstance(nonce, RPCError) else balance)}", ERROR)
+                continue
+            snapshot[address] = (int(nonce, 16), int(balance, 16))
+    return snapshot
+
+def sign_distribution(filename: str, amount: float, out_path: str, start_from: int = 1, journal: RunJournal = None,
+                      workers: int = None) -> int:
+    """
+    Фаза 1: подписывает переводы amount ETH по всем строкам CSV без отправки.
+    Nonce и баланс отправителей берутся одним срезом, цена газа и оценка
+    газа одни на весь файл. Строки, на которые у отправителя не хватает
+    баланса, пропускаются, чтобы nonce оставались без пропусков
+
+    :return: число подписанных транзакций
+    """
+    log_message("✍️ Подготовка подписанных транзакций")
+    from main import address_distribution_key, log_invalid_row
+
+    # Строки нужны целиком: nonce раздаются только после среза всех отправителей
+    rows = [row for row in iter_wallets(filename, log_invalid_row) if row[0] >= start_from]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Адреса выводятся один раз на уникальный ключ, параллельно
+        seen = SeenSet()
+        keys = []
+        for _, from_private_key, to_private_key in rows:
+            for private_key in (from_private_key, to_private_key):
+                if seen.add(normalize_key(private_key).lower()):
+                    keys.append(private_key)
+        addresses = dict(zip(
+            (normalize_key(key).lower() for key in keys),
+            executor.map(_derive_address, keys, chunksize=SIGN_CHUNK_SIZE)
+        ))
+
+        def address_of(private_key: str) -> str:
+            return addresses[normalize_key(private_key).lower()]
+
+        if journal is not None:
+            rows = [
+                row for row in rows
+                if not journal.should_skip(address_distribution_key(row[0], address_of(row[1]), address_of(row[2])))
+            ]
+
+        senders = list(dict.fromkeys(address_of(row[1]) for row in rows))
+        snapshot = _snapshot(senders)
+        block_number = w3.eth.block_number
+
+        amount_wei = w3.to_wei(amount, 'ether')
+        gas = gas_cache.estimate_gas(('transfer',), {
+            'from': senders[0] if senders else None,
+            'to': address_of(rows[0][2]) if rows else None,
+            'value': amount_wei
+        }) if rows else 0
+        gas_price = gas_cache.gas_price()
+        cost = amount_wei + gas * gas_price
+
+        # Nonce по порядку строк; строки сверх баланса отправителя отбрасываются
+        jobs = []
+        skipped = 0
+        for index, from_private_key, to_private_key in rows:
+            sender = address_of(from_private_key)
+            if sender not in snapshot:
+                skipped += 1
+                continue
+            nonce, balance = snapshot[sender]
+            if balance < cost:
+                skipped += 1
+                continue
+            snapshot[sender] = (nonce + 1, balance - cost)
+            jobs.append((index, from_private_key, address_of(to_private_key), nonce, amount_wei, gas, gas_price, CHAIN_ID))
+        if skipped:
+            log_message(f"⚠️ Пропущено строк без баланса или среза: {skipped}", WARNING)
+
+        log_message(f"✍️ Подпись {len(jobs)} транзакций, процессов: {workers or os.cpu_count()}")
+        tmp_path = out_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(json.dumps({
+                'type': 'header',
+                'chain_id': CHAIN_ID,
+                'block': block_number,
+                'gas': gas,
+                'gas_price': gas_price,
+                'amount_wei': amount_wei,
+                'created': time.time(),
+                'source': os.path.abspath(filename),
+            }) + '\n')
+            for job, (index, raw_transaction, tx_hash) in zip(
+                jobs, executor.map(_sign_transfer, jobs, chunksize=SIGN_CHUNK_SIZE)
+            ):
+                file.write(json.dumps({
+                    'index': index,
+                    'from': address_of(job[1]),
+                    'to': job[2],
+                    'nonce': job[3],
+                    'value': job[4],
+                    'hash': tx_hash,
+                    'raw': raw_transaction,
+                }) + '\n')
+        os.replace(tmp_path, out_path)
+
+    log_message(f"✅ Подписано {len(jobs)} транзакций: {out_path}")
+    return len(jobs)
+
+def read_signed(path: str):
+    """Потоково читает файл подписанных транзакций: (заголовок, генератор записей)"""
+    file = open(path, 'r')
+    header = json.loads(file.readline())
+    if header.get('type') != 'header':
+        file.close()
+        raise ValueError(f"{path}: нет заголовка файла подписанных транзакций")
+
+    def entries():
+        with file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+    return header, entries()
+
+def broadcast_signed(path: str, journal: RunJournal = None, batch_size: int = BROADCAST_BATCH_SIZE) -> dict:
+    """
+    Фаза 2: отправляет подписанные транзакции батчами eth_sendRawTransaction
+    с той скоростью, которую позволяет ограничитель RPC.
+    Подтверждения отслеживает общий трекер, итог пишется в журнал
+    """
+    from main import address_distribution_key, log_confirmation, resume_from_journal
+
+    header, entries = read_signed(path)
+    if header['chain_id'] != CHAIN_ID:
+        raise ValueError(f"Файл подписан для chainId {header['chain_id']}, текущая сеть {CHAIN_ID}")
+    current_price = gas_cache.gas_price()
+    if header['gas_price'] < current_price:
+        log_message(f"⚠️ Цена газа выросла с подписи: {header['gas_price']} -> {current_price}, "
+                    f"транзакции могут застрять", WARNING)
+
+    if journal is not None:
+        resume_from_journal(journal)
+
+    results = {'sent': 0, 'skipped': 0, 'failed': 0}
+    # Отправители, у которых nonce не ушел: их следующие nonce не попадут в блок
+    stalled = {}
+
+    def fail(entry: dict, key: str, message: str):
+        log_message(f"❌ Строка {entry['index']} (nonce {entry['nonce']}): {message}", ERROR)
+        results['failed'] += 1
+        if journal is not None:
+            journal.record(key, FAILED, error=message)
+
+    def send_batch(batch: list):
+        sendable = []
+        for entry in batch:
+            key = address_distribution_key(entry['index'], entry['from'], entry['to'])
+            if entry['from'] in stalled:
+                fail(entry, key, f"не отправлено: nonce {stalled[entry['from']]} отправителя не принят")
+                continue
+            if journal is not None:
+                journal.record(key, PENDING, entry['hash'])
+            sendable.append(entry)
+        # "nonce too low" для уже включенной в блок транзакции пул сверяет по хэшу и возвращает успех
+        responses = send_raw_batch(rpc_pool, [entry['raw'] for entry in sendable])
+        for entry, response in zip(sendable, responses):
+            key = address_distribution_key(entry['index'], entry['from'], entry['to'])
+            if entry['from'] in stalled:
+                # Узел мог поставить транзакцию в очередь, но без предыдущего nonce она не исполнится
+                fail(entry, key, f"не отправлено: nonce {stalled[entry['from']]} отправителя не принят")
+                continue
+            if isinstance(response, RPCError) and 'already known' not in response.message.lower():
+                stalled[entry['from']] = entry['nonce']
+                fail(entry, key, response.message)
+                continue
+            results['sent'] += 1
+            if journal is not None:
+                journal.record(key, BROADCAST, entry['hash'])
+            callback = journal.tracker_callback(key, log_confirmation) if journal else log_confirmation
+            receipt_tracker.track(entry['hash'], callback)
+
+    batch = []
+    for entry in entries:
+        if journal is not None and journal.should_skip(address_distribution_key(entry['index'], entry['from'], entry['to'])):
+            results['skipped'] += 1
+            continue
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            send_batch(batch)
+            batch = []
+    if batch:
+        send_batch(batch)
+
+    log_message(f"📨 Отправлено: {results['sent']}, пропущено: {results['skipped']}, с ошибкой: {results['failed']}")
+    log_message("⏳ Ожидание подтверждения отправленных транзакций...")
+    receipt_tracker.wait_all()
+    summary = receipt_tracker.summary()
+    log_message(f"📊 Подтверждено: {summary['confirmed']}, отклонено: {summary['failed']}, без ответа: {summary['timeout']}")
+    return results
@@ -0,0 +1,206 @@
+import asyncio
+import queue
+import threading
+import time
+from rpc import batch_request, chunked, RPCError
+from metrics import tx_in_flight, tx_finished, tx_confirm_seconds, tracer
+
+PENDING = 'pending'
+CONFIRMED = 'confirmed'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+# Хэш заменен транзакцией с тем же nonce и снят с отслеживания
+REPLACED = 'replaced'
+
+class ReceiptTracker:
+    """
+    Отдельный этап подтверждения транзакций: отправители кладут хэши
+    в очередь, фоновый поток раз в poll_interval проверяет все ожидающие
+    хэши батчами eth_getTransactionReceipt.
+    rpc_url - адрес RPC или пул узлов (rpc_pool.RPCPool)
+    """
+
+    def __init__(self, rpc_url, poll_interval: float = 1.0, timeout: float = 120, batch_size: int = 100):
+        self.rpc_url = rpc_url
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.batch_size = batch_size
+
+        # Таблица статусов: хэш -> {'status', 'receipt'}
+        self.statuses = {}
+
+        self._incoming = queue.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+        self._block_listeners = []
+        self._last_block = 0
+        self._dropped = queue.Queue()
+        self._replaced = set()
+
+    def track(self, tx_hash, callback=None, timeout: float = None):
+        """
+        Ставит хэш на отслеживание.
+        callback(tx_hash, status, receipt) вызывается из потока трекера
+        """
+        if not isinstance(tx_hash, str):
+            tx_hash = '0x' + bytes(tx_hash).hex()
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+
+        with self._lock:
+            self.statuses[tx_hash] = {'status': PENDING, 'receipt': None}
+        tx_in_flight.inc()
+        self._incoming.put((tx_hash, callback, deadline, time.time()))
+        self.start()
+        return tx_hash
+
+    def drop(self, tx_hash):
+        """Снимает хэш с отслеживания без колбэка (транзакция заменена)"""
+        if not isinstance(tx_hash, str):
+            tx_hash = '0x' + bytes(tx_hash).hex()
+        self._dropped.put(tx_hash)
+
+    def add_block_listener(self, listener):
+        """listener(block_number) вызывается, когда в квитанциях появляется новый блок"""
+        self._block_listeners.append(listener)
+
+    def track_async(self, tx_hash, timeout: float = None) -> asyncio.Future:
+        """Ставит хэш на отслеживание и возвращает future с (status, receipt)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(_, status, receipt):
+            loop.call_soon_threadsafe(
+                lambda: future.done() or future.set_result((status, receipt))
+            )
+
+        self.track(tx_hash, resolve, timeout)
+        return future
+
+    def status(self, tx_hash) -> str:
+        if not isinstance(tx_hash, str):
+            tx_hash = '0x' + bytes(tx_hash).hex()
+        with self._lock:
+            return self.statuses.get(tx_hash, {}).get('status')
+
+    def wait(self, tx_hash, timeout: float = None) -> dict:
+        """Блокирует до завершения отслеживания одного хэша"""
+        if not isinstance(tx_hash, str):
+            tx_hash = '0x' + bytes(tx_hash).hex()
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self.statuses.get(tx_hash, {}).get('status') != PENDING,
+                timeout
+            )
+            return self.statuses.get(tx_hash)
+
+    def wait_all(self, timeout: float = None) -> dict:
+        """Блокирует, пока не завершатся все отслеживаемые хэши. Возвращает таблицу статусов"""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: all(item['status'] != PENDING for item in self.statuses.values()),
+                timeout
+            )
+            return dict(self.statuses)
+
+    def summary(self) -> dict:
+        """Количество транзакций в каждом статусе"""
+        with self._lock:
+            counts = {PENDING: 0, CONFIRMED: 0, FAILED: 0, TIMEOUT: 0, REPLACED: 0}
+            for item in self.statuses.values():
+                counts[item['status']] += 1
+            return counts
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='receipt-tracker', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            while True:
+                try:
+                    tx_hash, callback, deadline, started = self._incoming.get_nowait()
+                except queue.Empty:
+                    break
+                self._pending[tx_hash] = (callback, deadline, started)
+            # Снятый хэш мог еще не дойти из очереди до _pending - ждет в _replaced
+            while True:
+                try:
+                    self._replaced.add(self._dropped.get_nowait())
+                except queue.Empty:
+                    break
+            for tx_hash in list(self._replaced):
+                if tx_hash in self._pending:
+                    self._replaced.discard(tx_hash)
+                    self._finish(tx_hash, REPLACED, None, None)
+                elif self.status(tx_hash) not in (None, PENDING):
+                    # Уже завершился сам - снимать нечего
+                    self._replaced.discard(tx_hash)
+
+            if self._pending:
+                self._poll()
+
+            self._stop.wait(self.poll_interval)
+
+    def _poll(self):
+        hashes = list(self._pending)
+        for chunk in chunked(hashes, self.batch_size):
+            try:
+                receipts = batch_request(
+                    self.rpc_url,
+                    [('eth_getTransactionReceipt', [tx_hash]) for tx_hash in chunk]
+                )
+            except Exception:
+                # Сетевая ошибка - повторим на следующем цикле
+                receipts = [None] * len(chunk)
+
+            now = time.monotonic()
+            for tx_hash, receipt in zip(chunk, receipts):
+                callback, deadline, _ = self._pending[tx_hash]
+                if receipt is None or isinstance(receipt, RPCError):
+                    if now < deadline:
+                        continue
+                    status, receipt = TIMEOUT, None
+                else:
+                    status = CONFIRMED if int(receipt.get('status', '0x0'), 16) == 1 else FAILED
+
+                self._finish(tx_hash, status, receipt, callback)
+
+            self._notify_block(receipts)
+
+    def _notify_block(self, receipts: list):
+        blocks = [
+            int(receipt['blockNumber'], 16) for receipt in receipts
+            if isinstance(receipt, dict) and receipt.get('blockNumber')
+        ]
+        if blocks and max(blocks) > self._last_block:
+            self._last_block = max(blocks)
+            for listener in self._block_listeners:
+                listener(self._last_block)
+
+    def _finish(self, tx_hash: str, status: str, receipt, callback):
+        _, _, started = self._pending.pop(tx_hash)
+        finished = time.time()
+        tx_in_flight.dec()
+        tx_finished.inc(status=status)
+        if status not in (TIMEOUT, REPLACED):
+            tx_confirm_seconds.observe(finished - started, status=status)
+        tracer.record('tx', started, finished, tx_hash=tx_hash, status=status,
+                      block=int(receipt['blockNumber'], 16) if receipt else None)
+        if callback is not None:
+            try:
+                callback(tx_hash, status, receipt)
+            except Exception:
+                pass
+        with self._changed:
+            self.statuses[tx_hash] = {'status': status, 'receipt': receipt}
+            self._changed.notify_all()
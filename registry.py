@@ -0,0 +1,236 @@
+from array import array
+from itertools import compress
+from eth_keys import keys
+from web3 import Web3
+import wallets
+from wallets import normalize_key, iter_wallets
+
+# Компактный реестр кошельков для файлов на миллионы ключей: вместо
+# строк и словарей ключи и адреса лежат подряд в bytearray, индекс по
+# адресу и по ключу - открытая адресация в array('I'), баланс uint128 -
+# две array('Q') (младшие и старшие 64 бита), роль - байт флагов.
+# Около 45 байт на кошелек без ключей и 77 с ключами против ~300-400
+# байт на строки, словари и int в обычных контейнерах
+
+# Роли кошелька в CSV (флаги, кошелек может быть и тем и другим)
+SENDER = 1
+RECEIVER = 2
+BOTH = SENDER | RECEIVER
+# Служебный флаг: баланс запрошен хотя бы раз
+_BALANCE_KNOWN = 4
+
+ROLE_NAMES = {SENDER: "Отправитель", RECEIVER: "Получатель", BOTH: "Отпр/Получ"}
+
+KEY_SIZE = 32
+ADDRESS_SIZE = 20
+_MASK64 = (1 << 64) - 1
+# Индекс расширяется вдвое, когда заполнен больше чем на 2/3
+_INITIAL_SLOTS = 1024
+
+def _probe(slots: array, data: bytearray, size: int, value: bytes, start: int) -> int:
+    """Ячейка индекса для value: свободная или с этим значением, поиск с ячейки start"""
+    mask = len(slots) - 1
+    slot = start & mask
+    while True:
+        position = slots[slot]
+        if position == 0:
+            return slot
+        start = (position - 1) * size
+        if data[start:start + size] == value:
+            return slot
+        slot = (slot + 1) & mask
+
+def address_bytes(address) -> bytes:
+    """20 байт адреса из строки 0x... или bytes"""
+    if isinstance(address, str):
+        return bytes.fromhex(address[2:] if address.startswith('0x') else address)
+    return bytes(address)
+
+class WalletRegistry:
+    """
+    Реестр уникальных кошельков. Кошелек - номер от 0 до len() - 1,
+    по номеру доступны адрес, ключ, роль и баланс.
+    keep_keys=False - хранить только адреса (например, для мониторинга балансов)
+    """
+
+    def __init__(self, keep_keys: bool = True):
+        self.keep_keys = keep_keys
+        self._keys = bytearray()
+        self._addresses = bytearray()
+        self._flags = bytearray()
+        self._balance_lo = array('Q')
+        self._balance_hi = array('Q')
+        # Ячейка хранит номер кошелька + 1, 0 - пусто
+        self._slots = array('I', bytes(4 * _INITIAL_SLOTS))
+        # Индекс по ключу: повторный ключ в CSV не выводится заново
+        self._key_slots = array('I', bytes(4 * _INITIAL_SLOTS)) if keep_keys else None
+
+    @classmethod
+    def from_csv(cls, filename: str, on_invalid=None, keep_keys: bool = True) -> 'WalletRegistry':
+        """
+        Реестр по wallets.csv: первый столбец - отправители, второй - получатели.
+        Ключи хранятся на время загрузки (повторы отсекаются до вывода адреса)
+        и отбрасываются в конце, если keep_keys=False
+        """
+        registry = cls(keep_keys=True)
+        for _, from_private_key, to_private_key in iter_wallets(filename, on_invalid):
+            registry.add(from_private_key, SENDER)
+            registry.add(to_private_key, RECEIVER)
+        if not keep_keys:
+            registry.drop_keys()
+        return registry
+
+    def __len__(self) -> int:
+        return len(self._flags)
+
+    def __contains__(self, address) -> bool:
+        return self.find(address) >= 0
+
+    @property
+    def nbytes(self) -> int:
+        """Сколько байт занимают данные реестра"""
+        slots = len(self._slots) + (len(self._key_slots) if self._key_slots is not None else 0)
+        return (len(self._keys) + len(self._addresses) + len(self._flags) + self._slots.itemsize * slots
+                + self._balance_lo.itemsize * (len(self._balance_lo) + len(self._balance_hi)))
+
+    def drop_keys(self):
+        """Освобождает ключи и индекс по ним, дальше хранятся только адреса"""
+        self.keep_keys = False
+        self._keys = bytearray()
+        self._key_slots = None
+
+    def _slot(self, raw_address: bytes) -> int:
+        # Адрес - часть keccak, первые 8 байт уже равномерны
+        return _probe(self._slots, self._addresses, ADDRESS_SIZE, raw_address,
+                      int.from_bytes(raw_address[:8], 'little'))
+
+    def _key_slot(self, raw_key: bytes) -> int:
+        # Ключи бывают последовательными (тестовые кошельки), поэтому хэш
+        return _probe(self._key_slots, self._keys, KEY_SIZE, raw_key, hash(bytes(raw_key)))
+
+    def _grow(self):
+        slots = self._slots
+        self._slots = array('I', bytes(8 * len(slots)))
+        for position in slots:
+            if position:
+                start = (position - 1) * ADDRESS_SIZE
+                self._slots[self._slot(self._addresses[start:start + ADDRESS_SIZE])] = position
+        if self._key_slots is not None:
+            key_slots = self._key_slots
+            self._key_slots = array('I', bytes(len(self._slots) * 4))
+            for position in key_slots:
+                if position:
+                    start = (position - 1) * KEY_SIZE
+                    self._key_slots[self._key_slot(self._keys[start:start + KEY_SIZE])] = position
+
+    def find(self, address) -> int:
+        """Номер кошелька по адресу или -1"""
+        position = self._slots[self._slot(address_bytes(address))]
+        return position - 1
+
+    def add_address(self, address, role: int = 0, private_key: bytes = None) -> int:
+        """Добавляет адрес (или добавляет роль уже известному), возвращает номер"""
+        raw_address = address_bytes(address)
+        slot = self._slot(raw_address)
+        position = self._slots[slot]
+        if position:
+            index = position - 1
+            self._flags[index] |= role
+            if private_key and self.keep_keys and self.private_key(index) is None:
+                # Адрес добавлен раньше без ключа
+                self._keys[index * KEY_SIZE:(index + 1) * KEY_SIZE] = private_key
+                self._key_slots[self._key_slot(private_key)] = position
+            return index
+
+        index = len(self._flags)
+        self._addresses += raw_address
+        if self.keep_keys:
+            self._keys += private_key or bytes(KEY_SIZE)
+            if private_key:
+                self._key_slots[self._key_slot(private_key)] = index + 1
+        self._flags.append(role)
+        self._balance_lo.append(0)
+        self._balance_hi.append(0)
+        self._slots[slot] = index + 1
+        if 3 * len(self._flags) > 2 * len(self._slots):
+            self._grow()
+        return index
+
+    def add(self, private_key: str, role: int = 0) -> int:
+        """
+        Добавляет кошелек по приватному ключу. Известный ключ находится по
+        индексу ключей, адрес выводится (самая дорогая часть) только для новых,
+        которых нет и в индексе адресов на диске (wallets.use_address_index)
+        """
+        raw_key = bytes.fromhex(normalize_key(private_key))
+        if self.keep_keys:
+            position = self._key_slots[self._key_slot(raw_key)]
+            if position:
+                self._flags[position - 1] |= role
+                return position - 1
+        address_index = wallets.address_index
+        address = address_index.lookup(private_key) if address_index is not None else None
+        if address is not None:
+            raw_address = address_bytes(address)
+        else:
+            raw_address = keys.PrivateKey(raw_key).public_key.to_canonical_address()
+            if address_index is not None:
+                address_index.remember(private_key, raw_address)
+        return self.add_address(raw_address, role, raw_key)
+
+    def address(self, index: int) -> str:
+        start = index * ADDRESS_SIZE
+        return Web3.to_checksum_address(bytes(self._addresses[start:start + ADDRESS_SIZE]))
+
+    def addresses(self, indices=None) -> list:
+        """Адреса с checksum по номерам (по умолчанию все)"""
+        return [self.address(index) for index in (range(len(self)) if indices is None else indices)]
+
+    def private_key(self, index: int) -> str:
+        """Ключ в hex без 0x или None, если ключи не хранятся / кошелек добавлен по адресу"""
+        if not self.keep_keys:
+            return None
+        raw_key = bytes(self._keys[index * KEY_SIZE:(index + 1) * KEY_SIZE])
+        return raw_key.hex() if any(raw_key) else None
+
+    def role(self, index: int) -> int:
+        return self._flags[index] & BOTH
+
+    def balance(self, index: int) -> int:
+        """Баланс в wei или None, если еще не запрашивался"""
+        if not self._flags[index] & _BALANCE_KNOWN:
+            return None
+        return self._balance_lo[index] | (self._balance_hi[index] << 64)
+
+    def set_balance(self, index: int, balance_wei: int):
+        self._balance_lo[index] = balance_wei & _MASK64
+        self._balance_hi[index] = balance_wei >> 64
+        self._flags[index] |= _BALANCE_KNOWN
+
+    def _role_mask(self, role: int = None, known: bool = False):
+        """Маска для itertools.compress: кошельки с ролью role (и известным балансом)"""
+        required = _BALANCE_KNOWN if known else 0
+        if role is None:
+            return (flags & required == required for flags in self._flags) if known else None
+        return (flags & role and flags & required == required for flags in self._flags)
+
+    def indices(self, role: int = None, known: bool = False) -> list:
+        """Номера кошельков с ролью role; known - только с запрошенным балансом"""
+        mask = self._role_mask(role, known)
+        return list(range(len(self))) if mask is None else list(compress(range(len(self)), mask))
+
+    def select(self, min_balance: int = 0, role: int = None) -> list:
+        """Номера кошельков с известным балансом больше min_balance wei (например, выше пыли)"""
+        high, low = min_balance >> 64, min_balance & _MASK64
+        candidates = compress(zip(range(len(self)), self._balance_lo, self._balance_hi), self._role_mask(role, True))
+        return [
+            index for index, balance_lo, balance_hi in candidates
+            if balance_hi > high or (balance_hi == high and balance_lo > low)
+        ]
+
+    def total(self, role: int = None) -> int:
+        """Сумма балансов в wei (суммы по массивам, без сборки uint128 на каждый кошелек)"""
+        if role is None:
+            return sum(self._balance_lo) + (sum(self._balance_hi) << 64)
+        return (sum(compress(self._balance_lo, self._role_mask(role)))
+                + (sum(compress(self._balance_hi, self._role_mask(role))) << 64))
@@ -0,0 +1,201 @@
+import asyncio
+import itertools
+import random
+import threading
+import time
+import aiohttp
+import requests
+from metrics import observe_batch, observe_retry
+
+class RPCError(Exception):
+    """Ошибка, которую RPC вернул для отдельного запроса"""
+
+    def __init__(self, error: dict):
+        self.code = error.get('code')
+        self.message = error.get('message', '')
+        super().__init__(f"{self.code}: {self.message}")
+
+# Коды и фрагменты ответов, после которых запрос стоит повторить
+TRANSIENT_HTTP_CODES = (429, 500, 502, 503, 504)
+TRANSIENT_RPC_CODES = (-32005, -32603, 429)
+THROTTLE_MESSAGES = ("rate limit", "too many requests", "limit exceeded", "capacity exceeded")
+TRANSIENT_MESSAGES = THROTTLE_MESSAGES + ("timeout", "timed out", "temporarily unavailable", "header not found")
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов (token bucket) с подстройкой под RPC:
+    каждый успешный запрос немного поднимает частоту, ответ 429 или
+    "rate limit" уменьшает ее вдвое (AIMD)
+    """
+
+    def __init__(self, rate: float = 20, burst: float = 2, min_rate: float = 1, max_rate: float = 500,
+                 increase: float = 0.5):
+        self.rate = rate
+        # Запас токенов на burst секунд работы с текущей частотой
+        self.burst = burst
+        self.capacity = rate * burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """Забирает токены; возвращает, сколько нужно подождать до их появления"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1):
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1):
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            self.capacity = self.rate * self.burst
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.capacity = self.rate * self.burst
+            self._tokens = min(self._tokens, 0)
+
+# Ограничитель batch_request по адресу RPC; у узлов пула (rpc_pool.py) свои
+rate_limiter = TokenBucket()
+
+class TransientError(Exception):
+    """Временная ошибка RPC, запрос можно повторить"""
+
+    def __init__(self, message: str, throttled: bool = False):
+        super().__init__(message)
+        self.throttled = throttled
+
+def classify_error(error) -> TransientError:
+    """Возвращает TransientError, если ошибку стоит повторить, иначе None"""
+    if isinstance(error, dict):
+        code = error.get('code')
+        message = str(error.get('message', '')).lower()
+        throttled = code == 429 or any(fragment in message for fragment in THROTTLE_MESSAGES)
+        if throttled or code in TRANSIENT_RPC_CODES and any(fragment in message for fragment in TRANSIENT_MESSAGES):
+            return TransientError(f"{code}: {message}", throttled)
+        return None
+
+    status = None
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+    elif isinstance(error, aiohttp.ClientResponseError):
+        status = error.status
+    if status is not None:
+        if status in TRANSIENT_HTTP_CODES:
+            return TransientError(f"HTTP {status}", status == 429)
+        return None
+
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+        return TransientError(str(error) or type(error).__name__)
+    return None
+
+def backoff_delay(attempt: int, base_delay: float = 0.25, max_delay: float = 8) -> float:
+    """Экспоненциальная задержка с полным джиттером"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+# Узел уже держит ровно эту сырую транзакцию: повтор отправки - успех
+ALREADY_KNOWN_MESSAGES = ("already known", "known transaction")
+# Ошибки nonce: на повторе "nonce too low" значит, что транзакция с этим
+# nonce уже в блоке - возможно, та же самая (проверяется по хэшу)
+NONCE_MESSAGES = ("nonce too low", "nonce too high")
+
+_ids = itertools.count(1)
+_session = requests.Session()
+
+def batch_request(rpc_url: str, calls: list, session: requests.Session = None, timeout: float = 30,
+                  retries: int = 5) -> list:
+    """
+    Отправляет несколько JSON-RPC запросов одним HTTP-запросом.
+    Проходит через общий ограничитель частоты, временные ошибки повторяются
+
+    :param rpc_url: адрес RPC или пул узлов (rpc_pool.RPCPool)
+    :param calls: список пар (method, params)
+    :return: результаты в том же порядке; для запросов с ошибкой - RPCError
+    """
+    if not calls:
+        return []
+    if not isinstance(rpc_url, str):
+        return rpc_url.batch(calls)
+
+    ids = [next(_ids) for _ in calls]
+    payload = [
+        {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}
+        for request_id, (method, params) in zip(ids, calls)
+    ]
+
+    attempt = 0
+    started = time.monotonic()
+    while True:
+        # Каждый запрос в батче расходует свой токен
+        rate_limiter.acquire(len(calls))
+        try:
+            response = (session or _session).post(rpc_url, json=payload, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+            # Некоторые RPC на ошибку всего батча отвечают одним объектом
+            transient = classify_error(data.get('error', {})) if isinstance(data, dict) else None
+        except Exception as e:
+            transient = classify_error(e)
+            if transient is None or attempt >= retries:
+                observe_batch(calls, started, error=True)
+                raise
+
+        if transient is None:
+            rate_limiter.on_success()
+            break
+        if transient.throttled:
+            rate_limiter.on_throttle()
+        if attempt >= retries:
+            observe_batch(calls, started, error=True)
+            raise RPCError(data.get('error') or {'message': str(transient)})
+        observe_retry(transient.throttled)
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+    observe_batch(calls, started, error=isinstance(data, dict))
+    if isinstance(data, dict):
+        raise RPCError(data.get('error') or {'message': str(data)})
+
+    by_id = {item.get('id'): item for item in data}
+    results = []
+    for request_id in ids:
+        item = by_id.get(request_id)
+        if item is None:
+            results.append(RPCError({'message': 'нет ответа в батче'}))
+        elif 'error' in item:
+            results.append(RPCError(item['error']))
+        else:
+            results.append(item.get('result'))
+    return results
+
+def send_raw_batch(rpc, raw_transactions: list) -> list:
+    """
+    eth_sendRawTransaction пачкой: через пул (rpc_pool.RPCPool) - на все
+    узлы, по адресу RPC - одним батчем. Результаты как у batch_request
+    """
+    if not isinstance(rpc, str):
+        return rpc.broadcast_batch(raw_transactions)
+    return batch_request(rpc, [('eth_sendRawTransaction', [raw]) for raw in raw_transactions])
+
+def chunked(items: list, size: int):
+    """Делит список на части не больше size элементов"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,317 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from eth_utils import keccak
+from web3 import Web3
+from web3.providers.base import JSONBaseProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
+from rpc import TokenBucket, RPCError, classify_error, backoff_delay, ALREADY_KNOWN_MESSAGES, NONCE_MESSAGES
+from metrics import observe_rpc, observe_batch, observe_retry
+
+# Вес ошибок в оценке здоровья узла: 10% ошибок ~ удвоение задержки
+ERROR_PENALTY = 10
+# Сглаживание задержки и доли ошибок (EWMA)
+SMOOTHING = 0.2
+
+def _batch_results(data: list, ids: list) -> list:
+    """Результаты батча по id запросов; для запросов с ошибкой - RPCError"""
+    by_id = {item.get('id'): item for item in data}
+    results = []
+    for request_id in ids:
+        item = by_id.get(request_id)
+        if item is None:
+            results.append(RPCError({'message': 'нет ответа в батче'}))
+        elif 'error' in item:
+            results.append(RPCError(item['error']))
+        else:
+            results.append(item.get('result'))
+    return results
+
+def _nonce_error(response: dict) -> bool:
+    message = str(response.get('error', {}).get('message', '')).lower()
+    return any(fragment in message for fragment in NONCE_MESSAGES)
+
+class Endpoint:
+    """Один RPC-узел пула: keep-alive сессия, свой ограничитель и статистика"""
+
+    def __init__(self, url: str, pool_size: int = 32):
+        self.url = url
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.limiter = TokenBucket()
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.requests += 1
+            self.latency = latency if self.requests == 1 else self.latency + SMOOTHING * (latency - self.latency)
+            self.error_rate -= SMOOTHING * self.error_rate
+        self.limiter.on_success()
+
+    def record_error(self, throttled: bool = False):
+        with self._lock:
+            self.requests += 1
+            self.errors += 1
+            self.error_rate += SMOOTHING * (1 - self.error_rate)
+        if throttled:
+            self.limiter.on_throttle()
+
+    def score(self) -> float:
+        """Чем меньше, тем здоровее узел"""
+        return self.latency * (1 + ERROR_PENALTY * self.error_rate) + self.error_rate
+
+    def post(self, payload: bytes, timeout: float):
+        """Отправляет готовый JSON-RPC запрос, обновляя статистику"""
+        self.limiter.acquire()
+        start = time.monotonic()
+        try:
+            response = self.session.post(
+                self.url, data=payload, timeout=timeout,
+                headers={'Content-Type': 'application/json'}
+            )
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            transient = classify_error(e)
+            self.record_error(transient is not None and transient.throttled)
+            raise
+
+        error = data.get('error') if isinstance(data, dict) else None
+        transient = classify_error(error) if error else None
+        if transient is not None:
+            self.record_error(transient.throttled)
+        else:
+            self.record_success(time.monotonic() - start)
+        return data, transient
+
+class RPCPool:
+    """
+    Пул RPC-узлов: чтения идут на самый здоровый узел (по задержке
+    и доле ошибок) с переключением на следующий при сбое, сырые
+    транзакции рассылаются на все узлы одновременно
+    """
+
+    def __init__(self, urls: list, timeout: float = 30, retries: int = 3):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.timeout = timeout
+        self.retries = retries
+        self._ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(max_workers=max(2, len(self.endpoints)), thread_name_prefix='rpc-pool')
+
+    def ranked(self) -> list:
+        """Узлы от самого здорового к самому плохому"""
+        return sorted(self.endpoints, key=lambda endpoint: endpoint.score())
+
+    def _send(self, payload: bytes):
+        """Отправляет запрос на лучший узел, при сбое - на следующий"""
+        last_error = None
+        for attempt in range(self.retries):
+            for endpoint in self.ranked():
+                try:
+                    data, transient = endpoint.post(payload, self.timeout)
+                except Exception as e:
+                    transient = classify_error(e)
+                    if transient is None:
+                        raise
+                    observe_retry(transient.throttled)
+                    last_error = e
+                    continue
+                if transient is None:
+                    return data
+                observe_retry(transient.throttled)
+                last_error = RPCError(data['error'])
+            if attempt + 1 < self.retries:
+                time.sleep(backoff_delay(attempt))
+        if isinstance(last_error, RPCError):
+            return {'jsonrpc': '2.0', 'error': {'code': last_error.code, 'message': last_error.message}}
+        raise last_error
+
+    def request(self, payload: bytes) -> dict:
+        return self._send(payload)
+
+    def _batch_payload(self, calls: list) -> tuple:
+        ids = [next(self._ids) for _ in calls]
+        payload = json.dumps([
+            {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}
+            for request_id, (method, params) in zip(ids, calls)
+        ]).encode()
+        return ids, payload
+
+    def batch(self, calls: list) -> list:
+        """Батч JSON-RPC через лучший узел, формат как у rpc.batch_request"""
+        if not calls:
+            return []
+        ids, payload = self._batch_payload(calls)
+        started = time.monotonic()
+        try:
+            data = self._send(payload)
+        except Exception:
+            observe_batch(calls, started, error=True)
+            raise
+        observe_batch(calls, started, error=isinstance(data, dict))
+        if isinstance(data, dict):
+            raise RPCError(data.get('error') or {'message': str(data)})
+        return _batch_results(data, ids)
+
+    def known_transactions(self, tx_hashes: list) -> set:
+        """Хэши, которые узел знает (в мемпуле или в блоке)"""
+        try:
+            results = self.batch([('eth_getTransactionByHash', [tx_hash]) for tx_hash in tx_hashes])
+        except Exception:
+            return set()
+        return {tx_hash for tx_hash, result in zip(tx_hashes, results) if result and not isinstance(result, RPCError)}
+
+    def broadcast(self, payload: bytes, raw_transaction: str) -> dict:
+        """
+        Отправляет eth_sendRawTransaction на все узлы одновременно.
+        Успех, если хотя бы один узел принял транзакцию; если все узлы
+        ответили временной ошибкой, рассылка повторяется с задержкой.
+        "nonce too low" может означать, что эта же транзакция уже в блоке
+        (например, прошлая попытка дошла, но ответ потерялся) - тогда
+        проверяется ее хэш
+        """
+        def send(endpoint):
+            try:
+                return endpoint.post(payload, self.timeout)
+            except Exception as e:
+                return {'jsonrpc': '2.0', 'error': {'code': -32000, 'message': str(e)}}, classify_error(e)
+
+        request_id = json.loads(payload).get('id')
+        tx_hash = '0x' + keccak(hexstr=raw_transaction).hex()
+        for attempt in range(self.retries):
+            results = list(self._executor.map(send, self.endpoints))
+            for response, _ in results:
+                message = str(response.get('error', {}).get('message', '')).lower()
+                if 'error' not in response or any(fragment in message for fragment in ALREADY_KNOWN_MESSAGES):
+                    return {'jsonrpc': '2.0', 'id': request_id, 'result': tx_hash}
+            if any(_nonce_error(response) for response, _ in results) and self.known_transactions([tx_hash]):
+                return {'jsonrpc': '2.0', 'id': request_id, 'result': tx_hash}
+            # Повторяем, только если все узлы ответили временной ошибкой
+            transient = [error for _, error in results]
+            if any(error is None for error in transient) or attempt + 1 >= self.retries:
+                break
+            observe_retry(any(error.throttled for error in transient))
+            time.sleep(backoff_delay(attempt))
+        return dict(results[0][0], id=request_id)
+
+    def broadcast_batch(self, raw_transactions: list) -> list:
+        """
+        Рассылает пачку сырых транзакций одним батчем на каждый узел
+        (порядок внутри батча сохраняется, nonce одного отправителя идут
+        подряд). Результат как у batch(): хэш или RPCError на транзакцию
+        """
+        if not raw_transactions:
+            return []
+        calls = [('eth_sendRawTransaction', [raw]) for raw in raw_transactions]
+        hashes = ['0x' + keccak(hexstr=raw).hex() for raw in raw_transactions]
+        ids, payload = self._batch_payload(calls)
+
+        def send(endpoint):
+            try:
+                data, transient = endpoint.post(payload, self.timeout)
+            except Exception as e:
+                return [RPCError({'message': str(e)})] * len(ids), classify_error(e)
+            if isinstance(data, dict):
+                return [RPCError(data.get('error') or {'message': str(data)})] * len(ids), transient
+            return _batch_results(data, ids), None
+
+        started = time.monotonic()
+        for attempt in range(self.retries):
+            answers = list(self._executor.map(send, self.endpoints))
+            transient = [error for _, error in answers]
+            if any(error is None for error in transient) or attempt + 1 >= self.retries:
+                break
+            observe_retry(any(error.throttled for error in transient))
+            time.sleep(backoff_delay(attempt))
+
+        results = []
+        for position, tx_hash in enumerate(hashes):
+            responses = [endpoint_results[position] for endpoint_results, _ in answers]
+            accepted = any(
+                not isinstance(response, RPCError)
+                or any(fragment in response.message.lower() for fragment in ALREADY_KNOWN_MESSAGES)
+                for response in responses
+            )
+            # Ответ по существу (например, "nonce too low") важнее временной ошибки соседнего узла
+            errors = [response for response in responses if isinstance(response, RPCError)]
+            error = next((response for response in errors
+                          if classify_error({'code': response.code, 'message': response.message}) is None), errors[0]) \
+                if not accepted else None
+            results.append(tx_hash if accepted else error)
+
+        # "nonce too low" на уже включенную в блок транзакцию - тоже успех
+        unresolved = [
+            tx_hash for tx_hash, result in zip(hashes, results)
+            if isinstance(result, RPCError) and _nonce_error({'error': {'message': result.message}})
+        ]
+        known = self.known_transactions(unresolved) if unresolved else set()
+        results = [tx_hash if tx_hash in known else result for tx_hash, result in zip(hashes, results)]
+        observe_batch(calls, started, error=any(isinstance(result, RPCError) for result in results))
+        return results
+    def stats(self) -> list:
+        """Статистика узлов для логов"""
+        return [
+            {
+                'url': endpoint.url,
+                'latency_ms': round(endpoint.latency * 1000, 1),
+                'error_rate': round(endpoint.error_rate, 3),
+                'requests': endpoint.requests,
+                'errors': endpoint.errors,
+            }
+            for endpoint in self.endpoints
+        ]
+
+def pool_request(pool: RPCPool, method, params, payload: bytes) -> dict:
+    """Запрос web3 через пул: сырые транзакции рассылаются на все узлы"""
+    started = time.monotonic()
+    try:
+        if method == 'eth_sendRawTransaction':
+            raw_transaction = params[0] if isinstance(params[0], str) else Web3.to_hex(params[0])
+            response = pool.broadcast(payload, raw_transaction)
+        else:
+            response = pool.request(payload)
+    except Exception:
+        observe_rpc(method, started, error=True)
+        raise
+    observe_rpc(method, started, error='error' in response)
+    return response
+
+class PooledHTTPProvider(JSONBaseProvider):
+    """Провайдер web3 поверх RPCPool"""
+
+    def __init__(self, pool: RPCPool):
+        super().__init__()
+        self.pool = pool
+
+    def make_request(self, method, params):
+        return pool_request(self.pool, method, params, self.encode_rpc_request(method, params))
+
+class AsyncPooledHTTPProvider(AsyncJSONBaseProvider):
+    """
+    Провайдер AsyncWeb3 поверх того же RPCPool: общие с синхронным web3
+    узлы, ограничители частоты, оценка здоровья и переключение узлов.
+    Запросы пула блокирующие, поэтому выполняются в отдельных потоках
+    """
+
+    def __init__(self, pool: RPCPool, max_workers: int = 32):
+        super().__init__()
+        self.pool = pool
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='rpc-async')
+
+    async def make_request(self, method, params):
+        payload = self.encode_rpc_request(method, params)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, pool_request, self.pool, method, params, payload
+        )
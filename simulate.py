@@ -0,0 +1,279 @@
+import json
+import os
+import time
+from web3 import Web3
+from logger import log_message, WARNING, ERROR
+from rpc import batch_request, chunked, RPCError
+from wallets import get_address_from_private_key, load_account, iter_wallets
+
+# RPC и кэш газа общие для всех скриптов (core.py)
+from core import CHAIN_ID, rpc_pool, w3, gas_cache
+
+# Пробный прогон без отправки: один срез балансов, nonce и NFT на
+# зафиксированном блоке, затем вся рассылка и сбор считаются в памяти.
+# Результат - план: только те шаги, которые пройдут, с итоговыми
+# балансами и нехваткой средств по отправителям. Скрипты принимают план
+# и не тратят RPC на строки и кошельки, которые заведомо не пройдут
+
+DISTRIBUTE = 'distribute'
+COLLECT_ETH = 'collect-eth'
+COLLECT_NFT = 'collect-nft'
+# NFT собираются до ETH: после сбора ETH на газ за переводы ничего не остается
+WORKFLOWS = (DISTRIBUTE, COLLECT_NFT, COLLECT_ETH)
+
+class Snapshot:
+    """Срез состояния на одном блоке: балансы и nonce в wei, NFT по владельцам"""
+
+    def __init__(self, block: int, balances: dict, nonces: dict, tokens: dict, gas_price: int):
+        self.block = block
+        self.balances = balances
+        self.nonces = nonces
+        self.tokens = tokens
+        self.gas_price = gas_price
+
+def take_snapshot(addresses: list, block_number: int = None, nft: bool = False, batch_size: int = 100) -> Snapshot:
+    """
+    Балансы и nonce всех адресов батчами JSON-RPC на одном блоке,
+    при nft=True еще и инвентаризация NFT через Multicall3 на том же блоке
+    """
+    if block_number is None:
+        block_number = w3.eth.block_number
+    block = hex(block_number)
+
+    balances, nonces = {}, {}
+    for chunk in chunked(addresses, batch_size // 2):
+        calls = []
+        for address in chunk:
+            calls.append(('eth_getBalance', [address, block]))
+            calls.append(('eth_getTransactionCount', [address, block]))
+        results = batch_request(rpc_pool, calls)
+        for index, address in enumerate(chunk):
+            balance, nonce = results[2 * index], results[2 * index + 1]
+            if isinstance(balance, RPCError) or isinstance(nonce, RPCError):
+                log_message(f"❌ Ошибка среза {address}: {str(balance if isinstance(balance, RPCError) else nonce)}", ERROR)
+                continue
+            balances[address] = int(balance, 16)
+            nonces[address] = int(nonce, 16)
+
+    tokens = {}
+    if nft:
+        from token_collector import scan_nft_inventory
+        tokens = scan_nft_inventory(addresses, block_identifier=block_number)
+
+    return Snapshot(block_number, balances, nonces, tokens, gas_cache.gas_price())
+
+def simulate_distribution(rows: list, amount_wei: int, gas: int, snapshot: Snapshot, state: dict) -> tuple:
+    """
+    Рассылка по строкам (индекс, отправитель, получатель) в памяти.
+    state - текущие балансы, обновляются по ходу (получатель может быть
+    отправителем в следующих строках)
+
+    :return: (шаги плана, {отправитель: нехватка в wei})
+    """
+    cost = amount_wei + gas * snapshot.gas_price
+    nonces = {}
+    steps = []
+    shortfall = {}
+    for index, from_address, to_address in rows:
+        if from_address not in state:
+            continue
+        if state[from_address] < cost:
+            shortfall[from_address] = shortfall.get(from_address, 0) + cost
+            continue
+        nonce = nonces.get(from_address, snapshot.nonces[from_address])
+        nonces[from_address] = nonce + 1
+        state[from_address] -= cost
+        state[to_address] = state.get(to_address, 0) + amount_wei
+        steps.append({'workflow': DISTRIBUTE, 'index': index, 'from': from_address, 'to': to_address,
+                      'nonce': nonce, 'value': amount_wei, 'gas': gas})
+    # Нехватка - сколько не хватило сверх остатка на счету
+    shortfall = {address: max(0, missing - state[address]) for address, missing in shortfall.items()}
+    return steps, shortfall
+
+def simulate_eth_collection(addresses: list, destination_address: str, gas: int, snapshot: Snapshot,
+                            state: dict) -> list:
+    """Сбор ETH в памяти: кошельки, где после газа остается больше пыли"""
+    from collector import DUST_THRESHOLD_WEI, sweepable_amount
+    steps = []
+    for address in addresses:
+        if address not in state:
+            continue
+        value = sweepable_amount(state[address], gas, snapshot.gas_price)
+        if value <= DUST_THRESHOLD_WEI:
+            continue
+        state[address] -= value + gas * snapshot.gas_price
+        state[destination_address] = state.get(destination_address, 0) + value
+        steps.append({'workflow': COLLECT_ETH, 'address': address, 'value': value, 'gas': gas})
+    return steps
+
+def simulate_nft_collection(addresses: list, gas: int, snapshot: Snapshot, state: dict,
+                            operator_address: str = None) -> tuple:
+    """
+    Сбор NFT в памяти. Без оператора газ за каждый перевод платит владелец
+    и переводится столько токенов, на сколько хватает баланса. С оператором
+    владелец платит только за setApprovalForAll (считается равным переводу),
+    переводы оплачивает оператор
+
+    :return: (шаги плана, {адрес: нехватка в wei})
+    """
+    fee = gas * snapshot.gas_price
+    steps = []
+    shortfall = {}
+    for address in addresses:
+        token_ids = snapshot.tokens.get(address)
+        if not token_ids or address not in state:
+            continue
+        if operator_address:
+            if state[address] < fee:
+                shortfall[address] = fee - state[address]
+                continue
+            state[address] -= fee
+            affordable = min(len(token_ids), state.get(operator_address, 0) // fee)
+            payer = operator_address
+        else:
+            affordable = min(len(token_ids), state[address] // fee)
+            payer = address
+        if affordable < len(token_ids):
+            shortfall[payer] = shortfall.get(payer, 0) + (len(token_ids) - affordable) * fee
+        if affordable:
+            state[payer] -= affordable * fee
+            steps.append({'workflow': COLLECT_NFT, 'address': address, 'token_ids': token_ids[:affordable], 'gas': gas})
+    return steps, shortfall
+
+def plan_from_csv(filename: str, out_path: str, amount: float = None, destination_address: str = None,
+                  workflows: tuple = WORKFLOWS, operator_private_key: str = None, block_number: int = None) -> dict:
+    """
+    Пробный прогон рассылки и сбора по CSV на одном блоке без отправки
+    транзакций. Шаги идут в порядке workflows, каждый следующий видит
+    балансы после предыдущего. План пишется в JSONL: заголовок с итогами,
+    затем шаги, которые пройдут
+
+    :return: заголовок плана
+    """
+    from main import log_invalid_row
+    if DISTRIBUTE in workflows and amount is None:
+        raise ValueError("Для рассылки нужна сумма (amount)")
+    if (COLLECT_ETH in workflows or COLLECT_NFT in workflows) and not destination_address:
+        raise ValueError("Для сбора нужен адрес (destination_address)")
+    log_message("🧪 Пробный прогон")
+
+    rows = []
+    addresses = {}
+    for index, from_private_key, to_private_key in iter_wallets(filename, log_invalid_row):
+        try:
+            from_address = get_address_from_private_key(from_private_key)
+            to_address = get_address_from_private_key(to_private_key)
+        except Exception as e:
+            log_message(f"❌ Ошибка ключа в строке {index}: {str(e)}", ERROR)
+            continue
+        rows.append((index, from_address, to_address))
+        addresses.setdefault(from_address, None)
+        addresses.setdefault(to_address, None)
+    addresses = list(addresses)
+
+    operator_address = load_account(operator_private_key).address if operator_private_key else None
+    if destination_address:
+        destination_address = Web3.to_checksum_address(destination_address)
+    extra = [address for address in (operator_address, destination_address) if address and address not in addresses]
+
+    snapshot = take_snapshot(addresses + extra, block_number, nft=COLLECT_NFT in workflows)
+    log_message(f"📸 Срез на блоке {snapshot.block}: адресов {len(snapshot.balances)}, держателей NFT {len(snapshot.tokens)}")
+
+    state = dict(snapshot.balances)
+    steps = []
+    shortfall = {}
+    totals = {}
+    for workflow in workflows:
+        if workflow == DISTRIBUTE:
+            amount_wei = w3.to_wei(amount, 'ether')
+            gas = gas_cache.estimate_gas(('transfer',), {'from': rows[0][1], 'to': rows[0][2], 'value': amount_wei}) if rows else 0
+            workflow_steps, missing = simulate_distribution(rows, amount_wei, gas, snapshot, state)
+            totals[DISTRIBUTE] = {'rows': len(rows), 'ok': len(workflow_steps)}
+        elif workflow == COLLECT_ETH:
+            gas = gas_cache.estimate_gas(('transfer',), {'from': addresses[0], 'to': destination_address, 'value': 0}) if addresses else 0
+            workflow_steps = simulate_eth_collection(addresses, destination_address, gas, snapshot, state)
+            missing = {}
+            totals[COLLECT_ETH] = {'wallets': len(addresses), 'ok': len(workflow_steps)}
+        elif workflow == COLLECT_NFT:
+            gas = nft_transfer_gas(snapshot, destination_address)
+            workflow_steps, missing = simulate_nft_collection(addresses, gas, snapshot, state, operator_address)
+            totals[COLLECT_NFT] = {
+                'holders': len(snapshot.tokens),
+                'ok': len(workflow_steps),
+                'tokens': sum(len(tokens) for tokens in snapshot.tokens.values()),
+                'transfers': sum(len(step['token_ids']) for step in workflow_steps),
+            }
+        else:
+            raise ValueError(f"Неизвестный режим: {workflow}")
+        steps.extend(workflow_steps)
+        for address, value in missing.items():
+            shortfall[address] = shortfall.get(address, 0) + value
+
+    # Шаг сбора NFT - по переводу на каждый токен
+    total_gas = sum(step['gas'] * len(step['token_ids']) if 'token_ids' in step else step['gas'] for step in steps)
+    header = {
+        'type': 'header',
+        'chain_id': CHAIN_ID,
+        'block': snapshot.block,
+        'gas_price': snapshot.gas_price,
+        'workflows': list(workflows),
+        'totals': totals,
+        'total_gas': total_gas,
+        'total_fee': total_gas * snapshot.gas_price,
+        'shortfall': shortfall,
+        'final_balances': {address: state[address] for address in addresses + extra if address in state},
+        'created': time.time(),
+        'source': os.path.abspath(filename),
+    }
+
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        file.write(json.dumps(header) + '\n')
+        for step in steps:
+            file.write(json.dumps(step) + '\n')
+    os.replace(tmp_path, out_path)
+
+    for workflow, counts in totals.items():
+        log_message(f"📋 {workflow}: {counts}")
+    log_message(f"⛽ Газ всего: {total_gas}, плата: {w3.from_wei(header['total_fee'], 'ether')} ETH")
+    if shortfall:
+        log_message(f"⚠️ Не хватает средств на {len(shortfall)} адресах, всего "
+                    f"{w3.from_wei(sum(shortfall.values()), 'ether')} ETH", WARNING)
+    log_message(f"✅ План записан: {out_path} ({len(steps)} шагов)")
+    return header
+
+def nft_transfer_gas(snapshot: Snapshot, destination_address: str) -> int:
+    """Оценка газа transferFrom по первому держателю (общий кэш с token_collector)"""
+    if not snapshot.tokens:
+        return 0
+    from token_collector import NFT_ADDRESS, get_nft_contract
+    owner, token_ids = next(iter(snapshot.tokens.items()))
+    data = get_nft_contract().functions.transferFrom(owner, destination_address, token_ids[0])._encode_transaction_data()
+    return gas_cache.estimate_gas(('transferFrom', NFT_ADDRESS), {'from': owner, 'to': NFT_ADDRESS, 'data': data})
+
+def load_plan(path: str) -> dict:
+    """
+    Читает план для реального запуска: {режим: шаги}, где шаги -
+    множество индексов строк (distribute), множество адресов (collect-eth)
+    или {адрес: [token_id, ...]} (collect-nft)
+    """
+    plan = {DISTRIBUTE: set(), COLLECT_ETH: set(), COLLECT_NFT: {}}
+    with open(path, 'r') as file:
+        header = json.loads(file.readline())
+        if header.get('type') != 'header':
+            raise ValueError(f"{path}: нет заголовка плана")
+        if header['chain_id'] != CHAIN_ID:
+            raise ValueError(f"План составлен для chainId {header['chain_id']}, текущая сеть {CHAIN_ID}")
+        for line in file:
+            if not line.strip():
+                continue
+            step = json.loads(line)
+            if step['workflow'] == DISTRIBUTE:
+                plan[DISTRIBUTE].add(step['index'])
+            elif step['workflow'] == COLLECT_ETH:
+                plan[COLLECT_ETH].add(step['address'])
+            elif step['workflow'] == COLLECT_NFT:
+                plan[COLLECT_NFT][step['address']] = step['token_ids']
+    log_message(f"📋 План {path} (блок {header['block']}): рассылка {len(plan[DISTRIBUTE])}, "
+                f"сбор ETH {len(plan[COLLECT_ETH])}, сбор NFT {len(plan[COLLECT_NFT])}")
+    return plan
@@ -0,0 +1,51 @@
+import importlib
+import os
+import sys
+import pytest
+from web3 import Web3, AsyncWeb3
+
+# Модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Модули скриптов берут общие объекты из core.py при импорте
+SCRIPT_MODULES = ('core', 'main', 'collector', 'token_collector', 'multi_collector', 'offline', 'simulate', 'balance')
+SHARED_NAMES = ('rpc_pool', 'w3', 'aw3', 'nonce_manager', 'async_nonce_manager', 'receipt_tracker', 'gas_cache')
+
+@pytest.fixture
+def mock_core(monkeypatch):
+    """
+    Подменяет общие объекты core.py во всех модулях скриптов объектами
+    поверх локального MockRPCServer. Вызов: url = mock_core(chain)
+    """
+    from mock_rpc import MockRPCServer
+    from rpc_pool import RPCPool, PooledHTTPProvider, AsyncPooledHTTPProvider
+    from nonce_manager import NonceManager, AsyncNonceManager
+    from receipt_tracker import ReceiptTracker
+    from gas_cache import GasCache
+    servers, trackers = [], []
+
+    def start(chain) -> str:
+        server = MockRPCServer(chain)
+        url = server.start()
+        servers.append(server)
+        pool = RPCPool([url])
+        w3 = Web3(PooledHTTPProvider(pool))
+        aw3 = AsyncWeb3(AsyncPooledHTTPProvider(pool))
+        shared = {
+            'rpc_pool': pool, 'w3': w3, 'aw3': aw3,
+            'nonce_manager': NonceManager(w3), 'async_nonce_manager': AsyncNonceManager(aw3),
+            'receipt_tracker': ReceiptTracker(pool, poll_interval=0.1), 'gas_cache': GasCache(w3),
+        }
+        trackers.append(shared['receipt_tracker'])
+        for module_name in SCRIPT_MODULES:
+            module = importlib.import_module(module_name)
+            for name in SHARED_NAMES:
+                if hasattr(module, name):
+                    monkeypatch.setattr(module, name, shared[name])
+        return url
+
+    yield start
+    for tracker in trackers:
+        tracker.stop()
+    for server in servers:
+        server.stop()
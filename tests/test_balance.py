@@ -0,0 +1,107 @@
+import pytest
+from eth_account import Account
+import balance
+from balance import BalanceWatcher
+from eth_utils import keccak
+from mock_rpc import MockChain, MockRPCServer, CHAIN_ID
+from registry import WalletRegistry
+from rpc_pool import RPCPool
+
+KEYS = ['%064x' % (i + 1) for i in range(4)]
+OUTSIDER = '0x' + '99' * 20
+
+class FlakyBalanceChain(MockChain):
+    """
+    eth_getBalance отвечает ошибкой, пока включен failing; блоки начиная
+    с forked_from заменены другой веткой (реорг)
+    """
+
+    failing = False
+    forked_from = None
+
+    def handle(self, request: dict) -> dict:
+        if request.get('method') == 'eth_getBalance' and self.failing:
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': -32000, 'message': 'backend unavailable'}}
+        return super().handle(request)
+
+    def eth_getBlockByNumber(self, number, full=False):
+        block = super().eth_getBlockByNumber(number, full)
+        if block is not None and self.forked_from is not None:
+            height = int(block['number'], 16)
+            if height >= self.forked_from:
+                block['hash'] = '0x' + keccak(b'fork' + height.to_bytes(32, 'big')).hex()
+            if height - 1 >= self.forked_from:
+                block['parentHash'] = '0x' + keccak(b'fork' + (height - 1).to_bytes(32, 'big')).hex()
+        return block
+
+@pytest.fixture
+def chain(tmp_path, monkeypatch):
+    chain = FlakyBalanceChain()
+    server = MockRPCServer(chain)
+    monkeypatch.setattr(balance, 'rpc_pool', RPCPool([server.start()], retries=1))
+    chain.accounts = [Account.from_key(key) for key in KEYS]
+    for account in chain.accounts:
+        chain.fund(account.address, 10 ** 18)
+    chain.csv = tmp_path / 'wallets.csv'
+    chain.csv.write_text('from,to\n%s,%s\n%s,%s\n' % tuple(KEYS))
+    yield chain
+    server.stop()
+
+def transfer(chain: MockChain, account, to: str, value: int = 10 ** 15):
+    nonce = chain.nonces.get(account.address.lower(), 0)
+    signed = account.sign_transaction({
+        'nonce': nonce, 'to': to, 'value': value, 'chainId': CHAIN_ID, 'gas': 21000, 'gasPrice': chain.gas_price,
+    })
+    chain.eth_sendRawTransaction('0x' + bytes(signed.raw_transaction).hex())
+
+def make_watcher(chain, changes: list, **kwargs) -> BalanceWatcher:
+    registry = WalletRegistry.from_csv(str(chain.csv), keep_keys=False)
+    watcher = BalanceWatcher(registry, lambda address, *_: changes.append(address), **kwargs)
+    watcher.start()
+    return watcher
+
+def test_failed_refresh_keeps_last_block_for_retry(chain):
+    changes = []
+    watcher = make_watcher(chain, changes)
+    start = watcher.last_block
+    transfer(chain, chain.accounts[0], OUTSIDER)
+
+    chain.failing = True
+    with pytest.raises(Exception):
+        watcher.advance(chain.block)
+    assert watcher.last_block == start and changes == []
+
+    # Повтор с того же блока видит перевод
+    chain.failing = False
+    assert watcher.advance(chain.block) == 1
+    assert changes == [chain.accounts[0].address] and watcher.last_block == chain.block
+
+def test_advance_requeries_only_touched_addresses(chain):
+    changes = []
+    watcher = make_watcher(chain, changes)
+    before = chain.calls['eth_getBalance']
+    transfer(chain, chain.accounts[0], chain.accounts[3].address)
+    # Начисление изнутри контракта в блоках не видно: кошелек не перезапрашивается
+    chain.fund(chain.accounts[2].address, 10 ** 15)
+
+    assert watcher.advance() == 2
+
+    assert sorted(changes) == sorted([chain.accounts[0].address, chain.accounts[3].address])
+    assert chain.calls['eth_getBalance'] - before == 2
+    assert watcher.stats['requeried'] == 2 and watcher.stats['full_refreshes'] == 0
+
+def test_reorg_falls_back_to_full_refresh(chain):
+    changes = []
+    watcher = make_watcher(chain, changes)
+    chain.forked_from = watcher.last_block
+    transfer(chain, chain.accounts[0], OUTSIDER)
+    chain.fund(chain.accounts[2].address, 10 ** 15)
+
+    assert watcher.advance() == 2
+
+    assert sorted(changes) == sorted([chain.accounts[0].address, chain.accounts[2].address])
+    assert watcher.stats['full_refreshes'] == 1
+    # Хэш головы новой ветки: следующий блок сверяется уже с ней
+    assert watcher.last_hash == chain.eth_getBlockByNumber(hex(chain.block))['hash']
+    transfer(chain, chain.accounts[1], OUTSIDER)
+    assert watcher.advance() == 1 and watcher.stats['full_refreshes'] == 1
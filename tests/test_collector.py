@@ -0,0 +1,60 @@
+import pytest
+from eth_account import Account
+from collector import plan_sweeps, collect_from_csv, collection_key, DUST_THRESHOLD_WEI
+from gas_cache import GAS_ESTIMATE_MARGIN
+from journal import RunJournal, CONFIRMED
+from mock_rpc import MockChain, TRANSFER_GAS
+
+KEYS = ['%064x' % (i + 1) for i in range(5)]
+DESTINATION = '0x' + 'dd' * 20
+GAS = int(TRANSFER_GAS * GAS_ESTIMATE_MARGIN)
+
+@pytest.fixture
+def chain(mock_core):
+    chain = MockChain()
+    mock_core(chain)
+    chain.accounts = [Account.from_key(key) for key in KEYS]
+    return chain
+
+def test_plan_sweeps_wei_math_and_dust_threshold(chain):
+    fee = GAS * chain.gas_price
+    balances = [
+        10 ** 18 + 1,                      # обычный кошелек, сумма до wei
+        fee + DUST_THRESHOLD_WEI,          # после газа ровно порог - пыль
+        fee + DUST_THRESHOLD_WEI + 1,      # на 1 wei выше порога
+        fee - 1,                           # не хватает на газ
+        0,
+    ]
+    for account, balance in zip(chain.accounts, balances):
+        chain.fund(account.address, balance)
+
+    plans = plan_sweeps(KEYS, DESTINATION)
+
+    assert [(account.address, value) for account, _, value, _, _ in plans] == [
+        (chain.accounts[0].address, 10 ** 18 + 1 - fee),
+        (chain.accounts[2].address, DUST_THRESHOLD_WEI + 1),
+    ]
+    assert all(gas == GAS and gas_price == chain.gas_price for _, _, _, gas, gas_price in plans)
+
+def test_collect_from_csv_sweeps_each_wallet_once(chain, tmp_path):
+    for account in chain.accounts[:3]:
+        chain.fund(account.address, 10 ** 17)
+    csv = tmp_path / 'wallets.csv'
+    # Ключи повторяются в обоих столбцах и в разном написании
+    rows = [(KEYS[0], KEYS[1]), ('0x' + KEYS[1], KEYS[2]), (KEYS[2].upper(), KEYS[0])]
+    csv.write_text('from,to\n' + ''.join(f'{from_key},{to_key}\n' for from_key, to_key in rows))
+    journal = RunJournal(str(tmp_path / 'collect.journal.jsonl'))
+
+    collect_from_csv(str(csv), DESTINATION, journal=journal)
+
+    fee = GAS * chain.gas_price
+    assert chain.balances[DESTINATION] == 3 * (10 ** 17 - fee)
+    assert chain.calls['eth_sendRawTransaction'] == 3
+    # Списан фактический газ, запас оценки остается на кошельке
+    assert all(chain.balances[account.address.lower()] == (GAS - TRANSFER_GAS) * chain.gas_price
+               for account in chain.accounts[:3])
+    assert all(journal.state(collection_key(account.address)) == CONFIRMED for account in chain.accounts[:3])
+
+    # Повторный запуск с журналом ничего не отправляет
+    collect_from_csv(str(csv), DESTINATION, journal=RunJournal(journal.path))
+    assert chain.calls['eth_sendRawTransaction'] == 3
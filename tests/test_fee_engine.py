@@ -0,0 +1,113 @@
+import json
+import pytest
+from eth_account import Account
+from web3 import Web3
+from mock_rpc import MockChain, MockRPCServer, CHAIN_ID
+from receipt_tracker import ReceiptTracker, CONFIRMED, FAILED
+from nonce_manager import NonceManager
+from fee_engine import FeeScheduler, FeeHistory
+from journal import RunJournal, PENDING
+
+SENDER_KEY = '0x' + '77' * 32
+RECIPIENT = '0x' + '88' * 20
+
+class StaleFeeChain(MockChain):
+    """eth_feeHistory отстает от сети: отдает reported_base_fee вместо текущей базовой комиссии"""
+
+    def __init__(self):
+        super().__init__()
+        self.reported_base_fee = self.gas_price
+
+    def eth_feeHistory(self, count, newest='latest', percentiles=None):
+        history = super().eth_feeHistory(count, newest, percentiles)
+        history['baseFeePerGas'] = [hex(self.reported_base_fee)] * len(history['baseFeePerGas'])
+        return history
+
+@pytest.fixture
+def make_scheduler():
+    started = []
+
+    def make(chain: MockChain, **kwargs) -> FeeScheduler:
+        server = MockRPCServer(chain)
+        url = server.start()
+        account = Account.from_key(SENDER_KEY)
+        chain.fund(account.address, 10 ** 18)
+        w3 = Web3(Web3.HTTPProvider(url))
+        tracker = ReceiptTracker(url, poll_interval=0.1)
+        kwargs.setdefault('target', 10 ** 12)
+        scheduler = FeeScheduler(w3, url, tracker, NonceManager(w3), CHAIN_ID, poll_interval=0.1, **kwargs)
+        scheduler.account = account
+        scheduler.chain = chain
+        started.append((scheduler, tracker, server))
+        return scheduler
+
+    yield make
+    for scheduler, tracker, server in started:
+        scheduler.stop()
+        tracker.stop()
+        server.stop()
+
+@pytest.fixture
+def scheduler(make_scheduler):
+    return make_scheduler(MockChain())
+
+def transfer(fees):
+    return {'to': RECIPIENT, 'value': 1, 'gas': 21000}
+
+def test_failed_job_does_not_block_release(scheduler):
+    results = {}
+
+    def broken(fees):
+        raise ValueError('сборка не удалась')
+
+    def failing_pending(tx_hash):
+        # Запись pending упала после выдачи nonce: nonce должен вернуться
+        raise IOError('журнал недоступен')
+
+    for label, build, on_pending in (('first', transfer, None), ('broken', broken, None),
+                                     ('no-journal', transfer, failing_pending), ('last', transfer, None)):
+        scheduler.submit(scheduler.account, build, label=label, on_pending=on_pending,
+                         callback=lambda tx_hash, status, receipt, label=label: results.__setitem__(label, status))
+
+    assert scheduler.wait(timeout=10) == 0
+    assert results == {'first': CONFIRMED, 'broken': FAILED, 'no-journal': FAILED, 'last': CONFIRMED}
+    assert scheduler.stats['failed'] == 2
+    # Без пропуска nonce: обе успешные транзакции в блоках
+    assert scheduler.chain.balances[RECIPIENT] == 2
+
+def test_wait_fails_jobs_still_queued_at_deadline(make_scheduler):
+    # Потолок ниже базовой комиссии: дешевое окно так и не наступает
+    scheduler = make_scheduler(MockChain(), target=1, max_wait=0.5)
+    results = []
+    scheduler.submit(scheduler.account, transfer, label='expensive',
+                     callback=lambda tx_hash, status, receipt: results.append(status))
+
+    assert scheduler.wait() == 1
+    assert results == [FAILED] and scheduler.pending() == 0
+    assert scheduler.stats['failed'] == 1 and scheduler.chain.nonces == {}
+
+def test_replacement_hash_journaled_as_pending(make_scheduler, tmp_path):
+    chain = StaleFeeChain()
+    # Устаревшая история: maxFeePerGas первой отправки ниже базовой комиссии, транзакция застревает
+    chain.reported_base_fee = chain.gas_price // 4
+    scheduler = make_scheduler(chain, stuck_after=0.2)
+    scheduler.history = FeeHistory(scheduler.w3, ttl=0)
+    journal = RunJournal(str(tmp_path / 'run.journal.jsonl'))
+    pending = []
+
+    def on_pending(tx_hash):
+        journal.record('job', PENDING, tx_hash)
+        pending.append(tx_hash)
+        if len(pending) == 1:
+            chain.reported_base_fee = chain.gas_price
+
+    scheduler.submit(scheduler.account, transfer, label='job', on_pending=on_pending,
+                     callback=journal.tracker_callback('job'))
+
+    assert scheduler.wait(timeout=10) == 0
+    assert len(pending) == 2 and scheduler.stats['replaced'] == 1
+    with open(journal.path) as file:
+        entries = [json.loads(line) for line in file]
+    replacement = [entry for entry in entries if entry['state'] == PENDING][-1]
+    assert replacement['tx_hash'] == pending[1] and replacement['replaces'] == [pending[0]]
+    assert journal.get('job')['tx_hash'] == pending[1] and journal.state('job') == CONFIRMED
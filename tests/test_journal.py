@@ -0,0 +1,82 @@
+import pytest
+from eth_account import Account
+from mock_rpc import MockChain, MockRPCServer, CHAIN_ID
+from journal import RunJournal, PENDING, BROADCAST, CONFIRMED, FAILED
+
+SENDER_KEY = '0x' + '55' * 32
+
+@pytest.fixture
+def chain():
+    chain = MockChain()
+    server = MockRPCServer(chain)
+    chain.url = server.start()
+    chain.account = Account.from_key(SENDER_KEY)
+    chain.fund(chain.account.address, 10 ** 18)
+    yield chain
+    server.stop()
+
+def sign_fields(chain: MockChain, nonce: int) -> dict:
+    return {
+        'nonce': nonce,
+        'to': '0x' + '66' * 20,
+        'value': 1,
+        'chainId': CHAIN_ID,
+        'gas': 21000,
+        'gasPrice': chain.gas_price,
+    }
+
+def sign(chain: MockChain, nonce: int):
+    return chain.account.sign_transaction(sign_fields(chain, nonce))
+
+def test_pending_resolved_against_chain(chain, tmp_path):
+    journal = RunJournal(str(tmp_path / 'run.journal.jsonl'))
+    sent, lost = sign(chain, 0), sign(chain, 1)
+    chain.eth_sendRawTransaction('0x' + bytes(sent.raw_transaction).hex())
+    # Падение между записью pending и отправкой: вторая транзакция в сеть не ушла
+    journal.record('sent', PENDING, sent.hash)
+    journal.record('lost', PENDING, lost.hash)
+
+    counts = journal.reconcile(chain.url)
+
+    assert counts[CONFIRMED] == 1 and counts[FAILED] == 1
+    assert journal.should_skip('sent')
+    assert journal.state('lost') == FAILED and not journal.should_skip('lost')
+
+def test_pending_in_mempool_becomes_broadcast(chain, tmp_path):
+    journal = RunJournal(str(tmp_path / 'run.journal.jsonl'))
+    pooled = sign(chain, 0)
+    # Базовая комиссия выросла - транзакция ждет в мемпуле
+    chain.set_base_fee(chain.gas_price * 10)
+    chain.eth_sendRawTransaction('0x' + bytes(pooled.raw_transaction).hex())
+    journal.record('pooled', PENDING, pooled.hash)
+
+    journal.reconcile(chain.url)
+
+    assert journal.state('pooled') == BROADCAST and journal.should_skip('pooled')
+
+def test_should_skip_resolves_pending_after_reconcile(chain, tmp_path):
+    journal = RunJournal(str(tmp_path / 'run.journal.jsonl'))
+    # Без RPC pending считается отправленной
+    journal.record('lost', PENDING, sign(chain, 0).hash)
+    assert journal.should_skip('lost')
+
+    journal.reconcile(chain.url)
+    journal.record('later', PENDING, sign(chain, 1).hash)
+
+    assert not journal.should_skip('later')
+
+def test_reconcile_checks_replaced_hashes(chain, tmp_path):
+    journal = RunJournal(str(tmp_path / 'run.journal.jsonl'))
+    original = sign(chain, 0)
+    chain.eth_sendRawTransaction('0x' + bytes(original.raw_transaction).hex())
+    journal.record('job', BROADCAST, original.hash)
+    # Падение после записи замены: в блок попала исходная транзакция, замена в сеть не ушла
+    replacement = chain.account.sign_transaction({**sign_fields(chain, 0), 'gasPrice': chain.gas_price * 2})
+    journal.record('job', PENDING, replacement.hash)
+    assert journal.get('job')['replaces'] == ['0x' + bytes(original.hash).hex()]
+
+    counts = journal.reconcile(chain.url)
+
+    assert counts[CONFIRMED] == 1
+    assert journal.get('job')['tx_hash'] == '0x' + bytes(original.hash).hex()
+    assert journal.should_skip('job')
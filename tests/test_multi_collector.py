@@ -0,0 +1,60 @@
+import pytest
+from eth_account import Account
+from web3 import Web3
+from multi_collector import parse_asset, asset_key, collect_assets_from_csv, ERC20
+from journal import RunJournal, CONFIRMED
+from mock_rpc import MockChain, CHAIN_ID
+from token_collector import NFT_ADDRESS, load_nft_abi
+
+KEYS = ['%064x' % (i + 1) for i in range(3)]
+TOKEN = Web3.to_checksum_address('0x' + 'ee' * 20)
+DESTINATION = Web3.to_checksum_address('0x' + 'dd' * 20)
+
+@pytest.fixture
+def chain(mock_core, tmp_path):
+    chain = MockChain(nft_address=NFT_ADDRESS, nft_abi=load_nft_abi())
+    mock_core(chain)
+    chain.accounts = [Account.from_key(key) for key in KEYS]
+    a, b, c = chain.accounts
+    for account in chain.accounts:
+        chain.fund(account.address, 10 ** 18)
+    chain.mint(a.address, [1, 2])
+    chain.mint(b.address, [5])
+    chain.mint_erc20(TOKEN, a.address, 700)
+    chain.mint_erc20(TOKEN, c.address, 300)
+    chain.csv = tmp_path / 'wallets.csv'
+    chain.csv.write_text(f'from,to\n{KEYS[0]},{KEYS[1]}\n{KEYS[2]},{KEYS[0]}\n')
+    chain.journal = str(tmp_path / 'collect.journal.jsonl')
+    return chain
+
+def sent_nonces(chain: MockChain, address: str) -> list:
+    """nonce транзакций отправителя в порядке включения в блоки"""
+    return [
+        int(item['nonce'], 16) for block in sorted(chain.block_transactions)
+        for item in chain.block_transactions[block] if item['from'] == address.lower()
+    ]
+
+def test_wallet_transfers_across_assets_go_in_nonce_order(chain):
+    a, b, c = chain.accounts
+    # У кошелька уже есть отправленная транзакция: очередь продолжает его pending nonce
+    signed = a.sign_transaction({'nonce': 0, 'to': DESTINATION, 'value': 1, 'chainId': CHAIN_ID,
+                                 'gas': 21000, 'gasPrice': chain.gas_price})
+    chain.eth_sendRawTransaction('0x' + bytes(signed.raw_transaction).hex())
+    assets = [parse_asset(f'erc721:{NFT_ADDRESS}'), parse_asset(f'{ERC20}:{TOKEN}')]
+    journal = RunJournal(chain.journal)
+
+    collect_assets_from_csv(str(chain.csv), DESTINATION, assets, journal=journal, concurrency=3)
+
+    # Один ERC-20 и два NFT одного кошелька - подряд, без пропусков nonce
+    assert sent_nonces(chain, a.address) == [0, 1, 2, 3]
+    assert sent_nonces(chain, b.address) == [0] and sent_nonces(chain, c.address) == [0]
+    assert chain.tokens_of(DESTINATION) == [1, 2, 5]
+    assert chain.erc20[TOKEN.lower()][DESTINATION.lower()] == 1000
+    keys = [asset_key(assets[0], token_id) for token_id in (1, 2, 5)]
+    keys += [asset_key(assets[1], address) for address in (a.address, c.address)]
+    assert all(journal.state(key) == CONFIRMED for key in keys)
+
+    # Повторный запуск с журналом ничего не отправляет
+    before = chain.calls['eth_sendRawTransaction']
+    collect_assets_from_csv(str(chain.csv), DESTINATION, assets, journal=RunJournal(chain.journal))
+    assert chain.calls['eth_sendRawTransaction'] == before
@@ -0,0 +1,107 @@
+import pytest
+from eth_account import Account
+from mock_rpc import MockChain, MockRPCServer, CHAIN_ID
+from nft_index import NFTIndex, MIN_LOG_CHUNK_BLOCKS
+from token_collector import NFT_ADDRESS, load_nft_abi
+
+KEYS = ['%064x' % (i + 1) for i in range(3)]
+BURN_ADDRESS = '0x' + '00' * 20
+
+class LimitedLogsChain(MockChain):
+    """
+    eth_getLogs отклоняет диапазоны длиннее max_range и, пока задан
+    broken_from, диапазоны, задевающие блоки начиная с broken_from
+    """
+
+    max_range = None
+    broken_from = None
+
+    def __init__(self):
+        super().__init__(nft_address=NFT_ADDRESS, nft_abi=load_nft_abi())
+        self.log_ranges = []
+
+    def eth_getLogs(self, log_filter):
+        first, last = int(log_filter['fromBlock'], 16), int(log_filter['toBlock'], 16)
+        self.log_ranges.append((first, last))
+        if self.max_range is not None and last - first + 1 > self.max_range:
+            raise Exception('query returned more than 10000 results')
+        if self.broken_from is not None and last >= self.broken_from:
+            raise Exception('backend unavailable')
+        return super().eth_getLogs(log_filter)
+
+@pytest.fixture
+def chain(tmp_path):
+    chain = LimitedLogsChain()
+    server = MockRPCServer(chain)
+    chain.url = server.start()
+    chain.accounts = [Account.from_key(key) for key in KEYS]
+    for account in chain.accounts:
+        chain.fund(account.address, 10 ** 18)
+    chain.index_path = str(tmp_path / 'nft_index.sqlite')
+    yield chain
+    server.stop()
+
+def transfer_nft(chain: MockChain, sender, to: str, token_id: int):
+    data = chain.nft.functions.transferFrom(sender.address, to, token_id)._encode_transaction_data()
+    signed = sender.sign_transaction({
+        'nonce': chain.nonces.get(sender.address.lower(), 0), 'to': NFT_ADDRESS, 'value': 0, 'data': data,
+        'chainId': CHAIN_ID, 'gas': 100000, 'gasPrice': chain.gas_price,
+    })
+    chain.eth_sendRawTransaction('0x' + bytes(signed.raw_transaction).hex())
+
+def build_history(chain: MockChain):
+    """Минт пачкой и по одному, перевод и сжигание с разрывами в сотни блоков"""
+    a, b, c = chain.accounts
+    chain.mint(a.address, [1, 2, 3, 4])
+    chain.block += 300
+    chain.mint(b.address, [10])
+    chain.block += 300
+    transfer_nft(chain, a, c.address, 2)
+    chain.block += 300
+    transfer_nft(chain, a, BURN_ADDRESS, 3)
+
+def expected_inventory(chain: MockChain) -> dict:
+    a, b, c = chain.accounts
+    return {a.address: [1, 4], b.address: [10], c.address: [2]}
+
+def test_sync_splits_ranges_rpc_rejects(chain):
+    build_history(chain)
+    chain.max_range = 100
+    index = NFTIndex(NFT_ADDRESS, chain.index_path)
+
+    applied = index.sync(chain.url, chunk_blocks=1000)
+
+    assert applied == 4
+    assert index.tokens_of([account.address for account in chain.accounts]) == expected_inventory(chain)
+    assert index.owner_of(3) is None and index.count() == 4 and index.last_block == chain.block
+    # Отклоненные диапазоны делились, но не мельче MIN_LOG_CHUNK_BLOCKS
+    assert any(last - first + 1 > chain.max_range for first, last in chain.log_ranges)
+    assert all(last - first + 1 >= MIN_LOG_CHUNK_BLOCKS for first, last in chain.log_ranges)
+
+def test_sync_resumes_after_failed_range(chain):
+    build_history(chain)
+    chain.broken_from = 500
+    index = NFTIndex(NFT_ADDRESS, chain.index_path)
+
+    with pytest.raises(Exception):
+        index.sync(chain.url, chunk_blocks=100)
+    # last_block не перескакивает неудачный диапазон
+    stopped = index.last_block
+    assert stopped < 500
+    index.close()
+
+    chain.broken_from = None
+    chain.log_ranges.clear()
+    index = NFTIndex(NFT_ADDRESS, chain.index_path)
+    index.sync(chain.url, chunk_blocks=100)
+
+    assert chain.log_ranges[0][0] == stopped + 1
+    assert index.tokens_of([account.address for account in chain.accounts]) == expected_inventory(chain)
+
+    # Новые блоки догружаются отдельно, старые не запрашиваются
+    chain.log_ranges.clear()
+    head = chain.block
+    transfer_nft(chain, chain.accounts[1], chain.accounts[0].address, 10)
+    assert index.sync(chain.url) == 1
+    assert chain.log_ranges == [(head + 1, chain.block)]
+    assert index.owner_of(10) == chain.accounts[0].address
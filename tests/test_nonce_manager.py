@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from eth_account import Account
+from web3 import Web3, AsyncWeb3
+from mock_rpc import MockChain, MockRPCServer, CHAIN_ID
+from nonce_manager import NonceManager, AsyncNonceManager, send_raw_transaction, send_raw_transaction_async
+
+SENDER_KEY = '0x' + '33' * 32
+RECIPIENT = '0x' + '44' * 20
+AMOUNT = 10 ** 16
+
+class AlreadyKnownChain(MockChain):
+    """Принимает первую транзакцию и отвечает "already known", как соседний узел после рассылки"""
+
+    def handle(self, request: dict) -> dict:
+        response = super().handle(request)
+        if request.get('method') == 'eth_sendRawTransaction' and not getattr(self, 'answered', False):
+            self.answered = True
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': -32000, 'message': 'already known'}}
+        return response
+
+@pytest.fixture
+def chain():
+    chain = AlreadyKnownChain()
+    server = MockRPCServer(chain)
+    chain.w3 = Web3(Web3.HTTPProvider(server.start()))
+    chain.account = Account.from_key(SENDER_KEY)
+    chain.fund(chain.account.address, 10 ** 18)
+    yield chain
+    server.stop()
+
+def sender(chain: MockChain, signed: list):
+    def sign_and_send(nonce: int):
+        transaction = chain.account.sign_transaction({
+            'nonce': nonce,
+            'to': RECIPIENT,
+            'value': AMOUNT,
+            'chainId': CHAIN_ID,
+            'gas': 21000,
+            'gasPrice': chain.gas_price,
+        })
+        signed.append(transaction)
+        return send_raw_transaction(chain.w3, transaction.raw_transaction)
+    return sign_and_send
+
+def test_already_known_is_success_without_resend(chain):
+    signed = []
+    tx_hash = NonceManager(chain.w3).send(chain.account.address, sender(chain, signed))
+
+    assert len(signed) == 1
+    assert tx_hash == signed[0].hash
+    assert chain.nonces[chain.account.address.lower()] == 1
+    assert chain.balances[RECIPIENT.lower()] == AMOUNT
+
+def test_nonce_too_low_resyncs(chain):
+    chain.answered = True
+    manager = NonceManager(chain.w3)
+    manager.prime({chain.account.address: 0})
+    # Транзакцию с nonce 0 отправил кто-то другой
+    chain.nonces[chain.account.address.lower()] = 1
+
+    signed = []
+    manager.send(chain.account.address, sender(chain, signed))
+
+    assert len(signed) == 2
+    assert chain.nonces[chain.account.address.lower()] == 2
+    assert manager.next_nonce(chain.account.address) == 2
+
+class LostAnswerChain(MockChain):
+    """Включает первую транзакцию в блок, но отвечает "nonce too low", как балансировщик после повтора на другой узел"""
+
+    def handle(self, request: dict) -> dict:
+        response = super().handle(request)
+        if request.get('method') == 'eth_sendRawTransaction' and not getattr(self, 'answered', False):
+            self.answered = True
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': -32000, 'message': 'nonce too low'}}
+        return response
+
+@pytest.fixture
+def lost_answer_chain():
+    chain = LostAnswerChain()
+    server = MockRPCServer(chain)
+    chain.url = server.start()
+    chain.w3 = Web3(Web3.HTTPProvider(chain.url))
+    chain.account = Account.from_key(SENDER_KEY)
+    chain.fund(chain.account.address, 10 ** 18)
+    yield chain
+    server.stop()
+
+def test_nonce_too_low_for_landed_attempt_is_not_resigned(lost_answer_chain):
+    chain = lost_answer_chain
+    signed = []
+    tx_hash = NonceManager(chain.w3).send(chain.account.address, sender(chain, signed))
+
+    assert len(signed) == 1 and tx_hash == signed[0].hash
+    assert chain.nonces[chain.account.address.lower()] == 1
+    assert chain.balances[RECIPIENT.lower()] == AMOUNT
+
+def test_async_nonce_too_low_for_landed_attempt_is_not_resigned(lost_answer_chain):
+    chain = lost_answer_chain
+    aw3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(chain.url))
+    signed = []
+
+    async def sign_and_send(nonce: int):
+        transaction = chain.account.sign_transaction({
+            'nonce': nonce, 'to': RECIPIENT, 'value': AMOUNT, 'chainId': CHAIN_ID, 'gas': 21000,
+            'gasPrice': chain.gas_price,
+        })
+        signed.append(transaction)
+        return await send_raw_transaction_async(aw3, transaction.raw_transaction)
+
+    tx_hash = asyncio.run(AsyncNonceManager(aw3).send(chain.account.address, sign_and_send))
+
+    assert len(signed) == 1 and tx_hash == signed[0].hash
+    assert chain.balances[RECIPIENT.lower()] == AMOUNT
@@ -0,0 +1,89 @@
+import json
+import pytest
+import rlp
+from eth_account import Account
+from eth_account._utils.legacy_transactions import Transaction
+from eth_utils import keccak
+from web3 import Web3
+import offline
+from journal import RunJournal, CONFIRMED, FAILED
+from main import address_distribution_key
+from mock_rpc import MockChain
+
+KEYS = ['%064x' % (i + 1) for i in range(6)]
+AMOUNT = 0.001
+
+class UnderpricedChain(MockChain):
+    """
+    Отклоняет nonce из reject ("transaction underpriced"), а следующий
+    за ним nonce того же отправителя принимает в очередь, как geth,
+    но не исполняет (без предыдущего nonce он не попадет в блок)
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.reject = set()
+        self.queued = []
+
+    def eth_sendRawTransaction(self, raw_transaction):
+        raw = Web3.to_bytes(hexstr=raw_transaction)
+        sender = Account.recover_transaction(raw).lower()
+        nonce = rlp.decode(raw, Transaction).nonce
+        if (sender, nonce) in self.reject:
+            raise Exception('transaction underpriced')
+        if any(rejected == sender and nonce > rejected_nonce for rejected, rejected_nonce in self.reject):
+            self.queued.append(nonce)
+            return '0x' + keccak(raw).hex()
+        return super().eth_sendRawTransaction(raw_transaction)
+
+@pytest.fixture
+def chain(mock_core, tmp_path):
+    chain = UnderpricedChain()
+    mock_core(chain)
+    chain.accounts = [Account.from_key(key) for key in KEYS]
+    for account in chain.accounts:
+        chain.fund(account.address, 10 ** 18)
+    chain.csv = tmp_path / 'wallets.csv'
+    chain.signed = str(tmp_path / 'signed.jsonl')
+    chain.journal = str(tmp_path / 'run.journal.jsonl')
+    return chain
+
+def write_csv(chain, rows):
+    chain.csv.write_text('from,to\n' + ''.join(f'{KEYS[a]},{KEYS[b]}\n' for a, b in rows))
+
+def journal_state(journal: RunJournal, chain, index: int, sender: int, recipient: int) -> str:
+    return journal.state(address_distribution_key(index, chain.accounts[sender].address, chain.accounts[recipient].address))
+
+def test_sign_broadcast_round_trip_and_resume(chain):
+    write_csv(chain, [(0, 3), (0, 4), (1, 5)])
+
+    assert offline.sign_distribution(str(chain.csv), AMOUNT, chain.signed, workers=1) == 3
+    with open(chain.signed) as file:
+        header, *entries = [json.loads(line) for line in file]
+    assert header['amount_wei'] == Web3.to_wei(AMOUNT, 'ether')
+    assert [(entry['index'], entry['nonce']) for entry in entries] == [(1, 0), (2, 1), (3, 0)]
+
+    journal = RunJournal(chain.journal)
+    assert offline.broadcast_signed(chain.signed, journal=journal) == {'sent': 3, 'skipped': 0, 'failed': 0}
+    assert chain.balances[chain.accounts[3].address.lower()] == 10 ** 18 + Web3.to_wei(AMOUNT, 'ether')
+    assert journal_state(journal, chain, 1, 0, 3) == CONFIRMED
+
+    # Повторная отправка файла с журналом: все уже подтверждено
+    results = offline.broadcast_signed(chain.signed, journal=RunJournal(chain.journal))
+    assert results == {'sent': 0, 'skipped': 3, 'failed': 0}
+    # Без журнала: узел отвечает "nonce too low", транзакции находятся по хэшу и не считаются ошибкой
+    assert offline.broadcast_signed(chain.signed)['failed'] == 0
+
+def test_rejected_nonce_marks_later_entries_of_sender_unsent(chain):
+    write_csv(chain, [(0, 3), (0, 4), (0, 5), (1, 5)])
+    offline.sign_distribution(str(chain.csv), AMOUNT, chain.signed, workers=1)
+    chain.reject.add((chain.accounts[0].address.lower(), 0))
+    journal = RunJournal(chain.journal)
+
+    results = offline.broadcast_signed(chain.signed, journal=journal, batch_size=2)
+
+    assert results == {'sent': 1, 'skipped': 0, 'failed': 3}
+    # nonce 1 попал в очередь узла, но в журнале не отправлен; nonce 2 (следующая пачка) не отправлялся
+    assert chain.queued == [1]
+    assert [journal_state(journal, chain, index, 0, recipient) for index, recipient in ((1, 3), (2, 4), (3, 5))] == [FAILED] * 3
+    assert journal_state(journal, chain, 4, 1, 5) == CONFIRMED
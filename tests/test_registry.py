@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+import registry as registry_module
+from eth_account import Account
+from registry import WalletRegistry, SENDER, RECEIVER, BOTH
+
+KEYS = ['%064x' % (i + 1) for i in range(3)]
+
+def write_csv(path, rows):
+    path.write_text('from,to\n' + ''.join(f'{a},{b}\n' for a, b in rows))
+    return str(path)
+
+def test_repeated_keys_are_derived_once(tmp_path, monkeypatch):
+    derived = []
+    private_key = registry_module.keys.PrivateKey
+
+    def counting(raw_key):
+        derived.append(raw_key)
+        return private_key(raw_key)
+
+    monkeypatch.setattr(registry_module, 'keys', SimpleNamespace(PrivateKey=counting))
+    # Ключ 0 - отправитель и получатель, ключ 1 с префиксом 0x повторяется
+    filename = write_csv(tmp_path / 'wallets.csv', [(KEYS[0], KEYS[1]), ('0x' + KEYS[1], KEYS[0]), (KEYS[2], KEYS[1])])
+
+    registry = WalletRegistry.from_csv(filename)
+
+    assert len(derived) == len(registry) == 3
+    index = registry.find(Account.from_key(KEYS[0]).address)
+    assert registry.role(index) == BOTH and registry.private_key(index) == KEYS[0]
+    assert registry.role(registry.find(Account.from_key(KEYS[2]).address)) == SENDER
+
+def test_keys_dropped_after_load(tmp_path):
+    filename = write_csv(tmp_path / 'wallets.csv', [(KEYS[0], KEYS[1]), (KEYS[0], KEYS[1])])
+
+    registry = WalletRegistry.from_csv(filename, keep_keys=False)
+
+    assert len(registry) == 2 and registry.private_key(0) is None
+    assert registry.role(registry.find(Account.from_key(KEYS[1]).address)) == RECEIVER
+    assert registry.nbytes < WalletRegistry.from_csv(filename).nbytes
@@ -0,0 +1,139 @@
+import asyncio
+import pytest
+from eth_account import Account
+from web3 import Web3, AsyncWeb3
+from mock_rpc import MockChain, MockRPCServer, CHAIN_ID
+from rpc_pool import RPCPool, PooledHTTPProvider, AsyncPooledHTTPProvider
+from nonce_manager import NonceManager, send_raw_transaction
+
+SENDER_KEY = '0x' + '11' * 32
+RECIPIENT = '0x' + '22' * 20
+AMOUNT = 10 ** 17
+
+class TimeoutAfterSendChain(MockChain):
+    """Принимает транзакцию, но отвечает -32603 "request timed out", как перегруженный RPC"""
+
+    def __init__(self, timeouts: int = 1):
+        super().__init__()
+        self.timeouts = timeouts
+
+    def handle(self, request: dict) -> dict:
+        response = super().handle(request)
+        if request.get('method') == 'eth_sendRawTransaction' and self.timeouts > 0:
+            self.timeouts -= 1
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': -32603, 'message': 'request timed out'}}
+        return response
+
+@pytest.fixture
+def chain():
+    chain = TimeoutAfterSendChain()
+    server = MockRPCServer(chain)
+    chain.url = server.start()
+    yield chain
+    server.stop()
+
+def signed_transfer(chain: MockChain):
+    account = Account.from_key(SENDER_KEY)
+    chain.fund(account.address, 10 ** 18)
+    return account, account.sign_transaction({
+        'nonce': 0,
+        'to': RECIPIENT,
+        'value': AMOUNT,
+        'chainId': CHAIN_ID,
+        'gas': 21000,
+        'gasPrice': chain.gas_price,
+    })
+
+def assert_sent_once(chain: MockChain, account):
+    assert chain.nonces[account.address.lower()] == 1
+    assert chain.balances[RECIPIENT.lower()] == AMOUNT
+
+def test_retry_of_accepted_send_returns_local_hash(chain):
+    account, signed = signed_transfer(chain)
+    w3 = Web3(PooledHTTPProvider(RPCPool([chain.url])))
+
+    assert w3.eth.send_raw_transaction(signed.raw_transaction) == signed.hash
+    assert_sent_once(chain, account)
+
+def test_async_retry_of_accepted_send_returns_local_hash(chain):
+    account, signed = signed_transfer(chain)
+    aw3 = AsyncWeb3(AsyncPooledHTTPProvider(RPCPool([chain.url])))
+
+    assert asyncio.run(aw3.eth.send_raw_transaction(signed.raw_transaction)) == signed.hash
+    assert_sent_once(chain, account)
+
+@pytest.fixture
+def endpoints():
+    """Два узла с общей цепочкой: второй на каждый запрос отвечает HTTP 429"""
+    chain = MockChain()
+    healthy, throttled = MockRPCServer(chain), MockRPCServer(chain, error_rate=1.0)
+    urls = [throttled.start(), healthy.start()]
+    yield chain, urls
+    healthy.stop()
+    throttled.stop()
+
+def test_pool_fails_over_and_ranks_healthy_endpoint_first(endpoints):
+    chain, urls = endpoints
+    pool = RPCPool(urls)
+    w3 = Web3(PooledHTTPProvider(pool))
+
+    for _ in range(3):
+        assert w3.eth.block_number == chain.block
+
+    throttled, healthy = pool.endpoints
+    assert throttled.errors >= 1 and healthy.errors == 0
+    assert pool.ranked()[0] is healthy
+    # 429 снижает частоту только у своего узла
+    assert throttled.limiter.rate < healthy.limiter.rate
+
+def test_async_web3_shares_pool_endpoints(endpoints):
+    chain, urls = endpoints
+    pool = RPCPool(urls)
+    w3, aw3 = Web3(PooledHTTPProvider(pool)), AsyncWeb3(AsyncPooledHTTPProvider(pool))
+    assert w3.eth.block_number == chain.block
+    requests_before = sum(endpoint.requests for endpoint in pool.endpoints)
+
+    async def read_many():
+        return await asyncio.gather(*(aw3.eth.get_balance(RECIPIENT) for _ in range(10)))
+
+    assert asyncio.run(read_many()) == [0] * 10
+    throttled, healthy = pool.endpoints
+    # Асинхронные запросы идут через те же узлы и статистику, что и синхронные
+    assert sum(endpoint.requests for endpoint in pool.endpoints) >= requests_before + 10
+    assert healthy.requests >= 10
+
+def test_retried_send_of_mined_transaction_is_not_resigned(chain):
+    # Первая попытка попала в блок, но ответ - таймаут; повтор получает "nonce too low"
+    account = Account.from_key(SENDER_KEY)
+    chain.fund(account.address, 10 ** 18)
+    w3 = Web3(PooledHTTPProvider(RPCPool([chain.url])))
+    signed = []
+
+    def sign_and_send(nonce: int):
+        signed.append(account.sign_transaction({
+            'nonce': nonce, 'to': RECIPIENT, 'value': AMOUNT, 'chainId': CHAIN_ID, 'gas': 21000,
+            'gasPrice': chain.gas_price,
+        }))
+        return send_raw_transaction(w3, signed[-1].raw_transaction)
+
+    tx_hash = NonceManager(w3).send(account.address, sign_and_send)
+
+    assert len(signed) == 1 and tx_hash == signed[0].hash
+    assert chain.calls['eth_sendRawTransaction'] == 2
+    assert_sent_once(chain, account)
+
+def test_broadcast_batch_sends_to_every_endpoint_in_order(endpoints):
+    chain, urls = endpoints
+    pool = RPCPool(urls)
+    account = Account.from_key(SENDER_KEY)
+    chain.fund(account.address, 10 ** 18)
+    signed = [account.sign_transaction({
+        'nonce': nonce, 'to': RECIPIENT, 'value': AMOUNT, 'chainId': CHAIN_ID, 'gas': 21000, 'gasPrice': chain.gas_price,
+    }) for nonce in range(3)]
+
+    results = pool.broadcast_batch(['0x' + bytes(item.raw_transaction).hex() for item in signed])
+
+    assert results == ['0x' + bytes(item.hash).hex() for item in signed]
+    assert chain.nonces[account.address.lower()] == 3
+    # Повтор той же пачки: все транзакции уже в блоке, ответы "already known"/"nonce too low" - успех
+    assert pool.broadcast_batch(['0x' + bytes(item.raw_transaction).hex() for item in signed]) == results
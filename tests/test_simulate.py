@@ -0,0 +1,67 @@
+import json
+import pytest
+from eth_account import Account
+from web3 import Web3
+import simulate
+from simulate import plan_from_csv, load_plan, DISTRIBUTE, COLLECT_ETH
+from gas_cache import GAS_ESTIMATE_MARGIN
+from mock_rpc import MockChain, TRANSFER_GAS
+
+KEYS = ['%064x' % (i + 1) for i in range(3)]
+DESTINATION = Web3.to_checksum_address('0x' + 'dd' * 20)
+AMOUNT = 0.01
+GAS = int(TRANSFER_GAS * GAS_ESTIMATE_MARGIN)
+
+@pytest.fixture
+def chain(mock_core, tmp_path):
+    chain = MockChain()
+    mock_core(chain)
+    chain.accounts = [Account.from_key(key) for key in KEYS]
+    chain.csv = tmp_path / 'wallets.csv'
+    chain.plan = str(tmp_path / 'plan.jsonl')
+    return chain
+
+def write_csv(chain, rows: list):
+    chain.csv.write_text('from,to\n' + ''.join(f'{KEYS[a]},{KEYS[b]}\n' for a, b in rows))
+
+def test_plan_totals_and_shortfall(chain):
+    a, b, c = chain.accounts
+    amount_wei = Web3.to_wei(AMOUNT, 'ether')
+    fee = GAS * chain.gas_price
+    cost = amount_wei + fee
+    half = cost // 2
+    # A хватает на один перевод; B получает перевод в первой строке, но на свой ему не хватает газа
+    chain.fund(a.address, cost + half)
+    write_csv(chain, [(0, 1), (0, 2), (1, 2)])
+    rpc_calls = chain.calls.get('eth_getBalance', 0)
+
+    header = plan_from_csv(str(chain.csv), chain.plan, amount=AMOUNT, destination_address=DESTINATION,
+                           workflows=(DISTRIBUTE, COLLECT_ETH))
+
+    assert header['totals'] == {DISTRIBUTE: {'rows': 3, 'ok': 1}, COLLECT_ETH: {'wallets': 3, 'ok': 2}}
+    assert header['shortfall'] == {a.address: cost - half, b.address: cost - amount_wei}
+    # Один перевод рассылки и два сбора
+    assert header['total_gas'] == 3 * GAS and header['total_fee'] == 3 * fee
+    assert header['final_balances'] == {
+        a.address: 0, b.address: 0, c.address: 0,
+        DESTINATION: (half - fee) + (amount_wei - fee),
+    }
+    # Один срез на все адреса, ни одной транзакции
+    assert chain.calls['eth_getBalance'] - rpc_calls == 4
+    assert 'eth_sendRawTransaction' not in chain.calls
+
+    with open(chain.plan) as file:
+        steps = [json.loads(line) for line in file][1:]
+    assert [(step['workflow'], step.get('index'), step.get('nonce')) for step in steps] == [
+        (DISTRIBUTE, 1, 0), (COLLECT_ETH, None, None), (COLLECT_ETH, None, None),
+    ]
+    plan = load_plan(chain.plan)
+    assert plan[DISTRIBUTE] == {1} and plan[COLLECT_ETH] == {a.address, b.address}
+
+def test_plan_rejected_for_other_chain(chain, monkeypatch):
+    write_csv(chain, [(0, 1)])
+    plan_from_csv(str(chain.csv), chain.plan, amount=AMOUNT, workflows=(DISTRIBUTE,))
+    monkeypatch.setattr(simulate, 'CHAIN_ID', 1)
+
+    with pytest.raises(ValueError):
+        load_plan(chain.plan)
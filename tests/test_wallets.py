@@ -0,0 +1,55 @@
+import threading
+import time
+from wallets import iter_wallets, stream_wallets, iter_unique_keys
+
+KEYS = ['%064x' % (i + 1) for i in range(4)]
+
+def write_csv(path, lines: list) -> str:
+    path.write_text('from,to\n' + ''.join(line + '\n' for line in lines))
+    return str(path)
+
+def test_rows_numbered_after_header_skipping_short_rows(tmp_path):
+    filename = write_csv(tmp_path / 'wallets.csv', [
+        f'{KEYS[0]},{KEYS[1]}',
+        '',
+        f'not-a-key,{KEYS[2]}',
+        f'0x{KEYS[2]},{KEYS[3]}',
+    ])
+    invalid = []
+
+    rows = list(iter_wallets(filename, lambda index, error: invalid.append(index)))
+
+    # Пустая строка номера не получает, строка с битым ключом получает
+    assert [index for index, _, _ in rows] == [1, 3]
+    assert invalid == [2]
+    assert rows[1][1] == '0x' + KEYS[2]
+
+def test_stream_matches_iter_with_small_queue(tmp_path):
+    filename = write_csv(tmp_path / 'wallets.csv', [f'{KEYS[i % 4]},{KEYS[(i + 1) % 4]}' for i in range(50)])
+
+    assert list(stream_wallets(filename, maxsize=2)) == list(iter_wallets(filename))
+
+def test_stream_stops_reader_when_consumer_leaves(tmp_path):
+    filename = write_csv(tmp_path / 'wallets.csv', [f'{KEYS[0]},{KEYS[1]}'] * 100)
+    rows = stream_wallets(filename, maxsize=2)
+
+    assert next(rows)[0] == 1
+    rows.close()
+
+    deadline = time.monotonic() + 5
+    while any(thread.name == 'csv-reader' for thread in threading.enumerate()) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not any(thread.name == 'csv-reader' for thread in threading.enumerate())
+
+def test_unique_keys_across_columns_and_spellings(tmp_path):
+    filename = write_csv(tmp_path / 'wallets.csv', [
+        f'{KEYS[0]},{KEYS[1]}',
+        f'0x{KEYS[1]},{KEYS[2]}',
+        f' {KEYS[0].upper()} ,{KEYS[3]}',
+        f'{KEYS[2]},{KEYS[0]}',
+    ])
+
+    keys = list(iter_unique_keys(filename))
+
+    # Первое написание ключа, порядок появления
+    assert keys == [KEYS[0], KEYS[1], KEYS[2], KEYS[3]]
@@ -1,205 +1,390 @@
 from web3 import Web3
-import time
-from eth_account import Account
 import json
-import csv
 import os
 import sys
 import io
-from datetime import datetime
+from logger import log_message, DEBUG, WARNING, ERROR
+from receipt_tracker import ReceiptTracker, CONFIRMED
+from multicall import aggregate3, encode_call
+from wallets import get_address_from_private_key, load_account, iter_unique_keys
+from journal import RunJournal, PENDING, BROADCAST, FAILED
+from nonce_manager import send_raw_transaction
+from nft_index import NFTIndex, NFT_INDEX_PATH
 
-def log_message(message: str):
-    """Функция для логирования с принудительным выводом"""
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
-    sys.stdout.flush()
-
-# RPC
-RPC_URL = "https://api.mainnet.abs.xyz"
-w3 = Web3(Web3.HTTPProvider(RPC_URL))
+# RPC, nonce, трекер подтверждений и кэш газа общие для всех скриптов (core.py)
+from core import CHAIN_ID, rpc_pool, w3, nonce_manager, receipt_tracker, gas_cache
 
 # Адреса контрактов
 NFT_ADDRESS = Web3.to_checksum_address("0xa6c46c07f7f1966d772e29049175ebba26262513")
 
-# Загружаем ABI
-with open('abi.json', 'r') as file:
-    NFT_ABI = json.load(file)
+ABI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'abi.json')
+
+# ABI и контракт загружаются при первом обращении, а не при импорте
+NFT_ABI = None
+nft_contract = None
+
+def load_nft_abi() -> list:
+    global NFT_ABI
+    if NFT_ABI is None:
+        with open(ABI_PATH, 'r') as file:
+            NFT_ABI = json.load(file)
+    return NFT_ABI
+
+def get_nft_contract():
+    global nft_contract
+    if nft_contract is None:
+        nft_contract = w3.eth.contract(address=NFT_ADDRESS, abi=load_nft_abi())
+    return nft_contract
+
+# Держатели с большим числом NFT сканируются окнами tokensOfOwnerIn
+LARGE_HOLDER_BALANCE = 500
+TOKEN_RANGE_SIZE = 5000
+# Сколько кошельков из CSV инвентаризуется за один проход
+INVENTORY_BATCH_SIZE = 1000
+
+def scan_nft_inventory(addresses: list, chunk_size: int = 200, block_identifier='latest') -> dict:
+    """
+    Инвентаризация NFT для списка адресов через Multicall3:
+    balanceOf для всех адресов, затем tokensOfOwner для держателей
+    (или окна tokensOfOwnerIn для крупных держателей).
+    block_identifier - блок среза (все вызовы читают один блок)
+
+    :return: {адрес: [token_id, ...]} только для адресов с NFT
+    """
+    contract = get_nft_contract()
+    # Шаг 1: balanceOf всех адресов
+    results = aggregate3(
+        w3,
+        [(NFT_ADDRESS, encode_call(contract.functions.balanceOf(address))) for address in addresses],
+        chunk_size,
+        block_identifier
+    )
+    balances = {}
+    for address, (success, data) in zip(addresses, results):
+        if success:
+            balance = w3.codec.decode(['uint256'], data)[0]
+            if balance > 0:
+                balances[address] = balance
+    
+    inventory = {}
+    small = [address for address, balance in balances.items() if balance <= LARGE_HOLDER_BALANCE]
+    large = [address for address, balance in balances.items() if balance > LARGE_HOLDER_BALANCE]
+    
+    # Шаг 2: tokensOfOwner для обычных держателей
+    results = aggregate3(
+        w3,
+        [(NFT_ADDRESS, encode_call(contract.functions.tokensOfOwner(address))) for address in small],
+        chunk_size,
+        block_identifier
+    )
+    for address, (success, data) in zip(small, results):
+        if success:
+            inventory[address] = list(w3.codec.decode(['uint256[]'], data)[0])
+        else:
+            # tokensOfOwner не уложился в лимит газа - сканируем окнами
+            large.append(address)
+    
+    # Шаг 3: крупные держатели - окна tokensOfOwnerIn, пока не найдены все токены
+    if large:
+        total_supply = contract.functions.totalSupply().call(block_identifier=block_identifier)
+        limit = max(total_supply * 2, TOKEN_RANGE_SIZE)
+        start = 0
+        for address in large:
+            inventory[address] = []
+        while large and start < limit:
+            stop = start + TOKEN_RANGE_SIZE
+            results = aggregate3(
+                w3,
+                [(NFT_ADDRESS, encode_call(contract.functions.tokensOfOwnerIn(address, start, stop))) for address in large],
+                chunk_size,
+                block_identifier
+            )
+            for address, (success, data) in zip(large, results):
+                if success:
+                    inventory[address].extend(w3.codec.decode(['uint256[]'], data)[0])
+            large = [address for address in large if len(inventory[address]) < balances[address]]
+            start = stop
+    
+    return {address: token_ids for address, token_ids in inventory.items() if token_ids}
+
+def open_nft_index(path: str = NFT_INDEX_PATH, start_block: int = 0) -> NFTIndex:
+    """Индекс владельцев NFT коллекции по событиям (nft_index.py)"""
+    return NFTIndex(NFT_ADDRESS, path, start_block)
 
-# Инициализация контракта
-nft_contract = w3.eth.contract(address=NFT_ADDRESS, abi=NFT_ABI)
+def log_invalid_row(index: int, error: Exception):
+    """Колбэк потокового чтения CSV для битых строк"""
+    log_message(f"❌ Ошибка ключа в строке {index}: {str(error)}", ERROR)
 
-def get_address_from_private_key(private_key: str) -> str:
-    if private_key.startswith('0x'):
-        private_key = private_key[2:]
-    account = Account.from_key(private_key)
-    return account.address
+def token_key(token_id: int) -> str:
+    """Ключ токена в журнале сбора NFT"""
+    return f"collect-nft:{NFT_ADDRESS}:{token_id}"
 
-def transfer_nft(from_private_key: str, to_address: str):
+def transfer_nft(from_private_key: str, to_address: str, tracker: ReceiptTracker = None, token_ids: list = None,
+                 operator_private_key: str = None, safe_transfer: bool = False, journal: RunJournal = None):
+    """
+    Переводит все NFT кошелька на to_address.
+    token_ids - заранее найденные токены (scan_nft_inventory), тогда
+    balanceOf/tokensOfOwner не вызываются
+
+    По умолчанию владелец сам отправляет transferFrom (approve не нужен).
+    Если указан operator_private_key, владелец один раз делает
+    setApprovalForAll, а переводы отправляет оператор (и платит за газ)
+    """
+    contract = get_nft_contract()
     try:
-        if from_private_key.startswith('0x'):
-            from_private_key = from_private_key[2:]
-        account = Account.from_key(from_private_key)
+        account = load_account(from_private_key)
         sender_address = account.address
         
         log_message(f"👤 Проверка NFT на адресе: {sender_address}")
         
-        # Проверяем баланс NFT
-        balance = nft_contract.functions.balanceOf(sender_address).call()
-        
-        if balance <= 0:
-            log_message(f"⚠️ Пропуск: нет NFT на адресе")
-            return False
+        if token_ids is None:
+            # Проверяем баланс NFT
+            balance = contract.functions.balanceOf(sender_address).call()
             
-        log_message(f"💰 Найдено NFT: {balance}")
+            if balance <= 0:
+                log_message(f"⚠️ Пропуск: нет NFT на адресе", WARNING)
+                return False
+                
+            log_message(f"💰 Найдено NFT: {balance}")
         
         try:
-            # Получаем список токенов через tokensOfOwner
-            token_ids = nft_contract.functions.tokensOfOwner(sender_address).call()
+            if token_ids is None:
+                # Получаем список токенов через tokensOfOwner
+                token_ids = contract.functions.tokensOfOwner(sender_address).call()
             
             if not token_ids:
-                log_message("❌ Не удалось найти NFT")
+                log_message("❌ Не удалось найти NFT", ERROR)
                 return False
+            
+            # Токены, уже переведенные или находящиеся в пути, пропускаем
+            if journal is not None:
+                token_ids = [token_id for token_id in token_ids if not journal.should_skip(token_key(token_id))]
+                if not token_ids:
+                    log_message("⏭️ Все NFT кошелька уже обработаны")
+                    return False
                 
             log_message(f"✅ Найдено NFT: {len(token_ids)}")
             
-            for token_id in token_ids:
-                # Сначала делаем approve
-                nonce = w3.eth.get_transaction_count(sender_address)
-                
-                approve_tx = nft_contract.functions.approve(
-                    Web3.to_checksum_address(to_address),
-                    token_id
-                ).build_transaction({
-                    'chainId': 2741,
-                    'gas': 0,
-                    'gasPrice': w3.eth.gas_price,
-                    'nonce': nonce,
-                })
-                
-                # Оцениваем газ для approve
-                gas_estimate = w3.eth.estimate_gas({
-                    'from': sender_address,
-                    'to': NFT_ADDRESS,
-                    'data': approve_tx['data']
-                })
-                
-                approve_tx.update({'gas': gas_estimate})
-                
-                log_message(f"✍️ Подписание разрешения для NFT #{token_id}...")
-                signed = Account.sign_transaction(approve_tx, from_private_key)
-                
-                log_message("📤 Отправка разрешения...")
-                tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
-                
-                log_message("⏳ Ожидание подтверждения разрешения...")
-                receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-                
-                log_message("✅ Разрешение получено")
-                time.sleep(0.1)
-                
-                # Теперь делаем transferFrom
-                nonce = w3.eth.get_transaction_count(sender_address)
-                
-                transfer_tx = nft_contract.functions.transferFrom(
-                    sender_address,
-                    Web3.to_checksum_address(to_address),
-                    token_id
-                ).build_transaction({
-                    'chainId': 2741,
-                    'gas': 0,
-                    'gasPrice': w3.eth.gas_price,
-                    'nonce': nonce,
-                })
-                
-                # Оцениваем газ
-                gas_estimate = w3.eth.estimate_gas({
-                    'from': sender_address,
-                    'to': NFT_ADDRESS,
-                    'data': transfer_tx['data']
-                })
-                
-                transfer_tx.update({'gas': gas_estimate})
-                
-                log_message(f"✍️ Подписание транзакции для NFT #{token_id}...")
-                signed = Account.sign_transaction(transfer_tx, from_private_key)
-                
-                log_message("📤 Отправка транзакции...")
-                tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
-                
-                log_message("⏳ Ожидание подтверждения...")
-                receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+            def send_contract_tx(function, label: str, signer, journal_key: str = None):
+                """Строит, подписывает и отправляет вызов контракта с локальным nonce"""
+                def sign_and_send(nonce: int):
+                    tx = function.build_transaction({
+                        'chainId': CHAIN_ID,
+                        'gas': 0,
+                        'gasPrice': gas_cache.gas_price(),
+                        'nonce': nonce,
+                    })
+                    
+                    # Оценка газа запоминается по функции и контракту
+                    gas_estimate = gas_cache.estimate_gas((function.fn_name, NFT_ADDRESS), {
+                        'from': signer.address,
+                        'to': NFT_ADDRESS,
+                        'data': tx['data']
+                    })
+                    tx.update({'gas': gas_estimate})
+                    
+                    log_message(f"✍️ Подписание {label}...", DEBUG)
+                    signed = signer.sign_transaction(tx)
+                    # Хэш известен до отправки: после падения на отправке запись сверяется с сетью
+                    if journal is not None and journal_key is not None:
+                        journal.record(journal_key, PENDING, signed.hash)
+                    
+                    log_message(f"📤 Отправка {label}...", DEBUG)
+                    return send_raw_transaction(w3, signed.raw_transaction)
                 
-                log_message(f"✅ Успешно переведен NFT #{token_id}")
-                log_message(f"🔗 Хэш транзакции: {receipt['transactionHash'].hex()}")
+                return nonce_manager.send(signer.address, sign_and_send)
+            
+            own_tracker = tracker or receipt_tracker
+            signer = account
+            
+            if operator_private_key:
+                signer = load_account(operator_private_key)
                 
-                time.sleep(0.1)
+                # Одно разрешение на весь кошелек вместо approve на каждый токен
+                if not contract.functions.isApprovedForAll(sender_address, signer.address).call():
+                    approval_hash = send_contract_tx(
+                        contract.functions.setApprovalForAll(signer.address, True),
+                        "разрешения для оператора",
+                        account
+                    )
+                    own_tracker.track(approval_hash)
+                    log_message("⏳ Ожидание подтверждения разрешения...")
+                    if own_tracker.wait(approval_hash)['status'] != CONFIRMED:
+                        log_message("❌ Разрешение для оператора не подтверждено", ERROR)
+                        return False
+                    log_message("✅ Разрешение получено")
+            
+            if safe_transfer:
+                transfer_function = contract.get_function_by_signature('safeTransferFrom(address,address,uint256)')
+            else:
+                transfer_function = contract.functions.transferFrom
+            
+            # Все переводы отправляются подряд без ожидания,
+            # подтверждения собираются после отправки всей пачки
+            pending = []
+            for token_id in token_ids:
+                try:
+                    transfer_hash = send_contract_tx(
+                        transfer_function(
+                            sender_address,
+                            Web3.to_checksum_address(to_address),
+                            token_id
+                        ),
+                        f"транзакции для NFT #{token_id}",
+                        signer,
+                        token_key(token_id)
+                    )
+                except Exception as e:
+                    # Уже отправленные переводы все равно отслеживаем
+                    log_message(f"❌ Ошибка при отправке NFT #{token_id}: {str(e)}", ERROR)
+                    if journal is not None:
+                        journal.record(token_key(token_id), FAILED, error=str(e))
+                    break
+                if journal is not None:
+                    journal.record(token_key(token_id), BROADCAST, transfer_hash)
+                pending.append((token_id, transfer_hash))
+            
+            def on_transfer(token_id):
+                def callback(tx_hash, status, receipt):
+                    if status == CONFIRMED:
+                        log_message(f"✅ Успешно переведен NFT #{token_id}")
+                        log_message(f"🔗 Хэш транзакции: {tx_hash}")
+                    else:
+                        log_message(f"❌ Перевод NFT #{token_id}: {status}", ERROR)
+                return callback
+            
+            # Подтверждения проверяет трекер батчами
+            for token_id, transfer_hash in pending:
+                callback = on_transfer(token_id)
+                if journal is not None:
+                    callback = journal.tracker_callback(token_key(token_id), callback)
+                own_tracker.track(transfer_hash, callback)
+            
+            if tracker is not None:
+                log_message(f"📨 Отправлено переводов: {len(pending)}")
+                return bool(pending)
             
-            return True
+            log_message("⏳ Ожидание подтверждений...")
+            return len(pending) == len(token_ids) and all(
+                own_tracker.wait(transfer_hash)['status'] == CONFIRMED
+                for _, transfer_hash in pending
+            )
             
         except Exception as e:
-            log_message(f"❌ Ошибка при отправке: {str(e)}")
+            log_message(f"❌ Ошибка при отправке: {str(e)}", ERROR)
             return False
                 
     except Exception as e:
-        log_message(f"❌ Ошибка: {str(e)}")
+        log_message(f"❌ Ошибка: {str(e)}", ERROR)
         return False
 
-def collect_nfts_from_csv(filename: str, destination_address: str):
-    """Собирает все NFT со всех приватных ключей из CSV"""
+def collect_nfts_from_csv(filename: str, destination_address: str, operator_private_key: str = None,
+                          journal: RunJournal = None, inventory: dict = None, index: NFTIndex = None):
+    """
+    Собирает все NFT со всех приватных ключей из CSV.
+    operator_private_key - кошелек-оператор, который отправляет переводы
+    после setApprovalForAll (см. transfer_nft).
+    С журналом уже переведенные токены и токены в пути пропускаются.
+    inventory - NFT по владельцам из плана пробного прогона (simulate.py):
+    тогда инвентаризация не запрашивается, а кошельки вне плана пропускаются.
+    index - локальный индекс владельцев: перед сбором догружаются только
+    новые блоки, держатели находятся запросом к базе вместо tokensOfOwner
+    """
     log_message("🔄 Начало сбора NFT")
     
     if not os.path.exists(filename):
-        log_message(f"❌ Файл {filename} не найден")
+        log_message(f"❌ Файл {filename} не найден", ERROR)
         return
     
     successful_transactions = 0
     
     try:
-        with open(filename, 'r') as file:
-            reader = csv.reader(file)
-            next(reader, None)  # Пропускаем заголовок
-            rows = list(reader)
-            
-            log_message(f"📋 Найдено кошельков для проверки: {len(rows) * 2}")
-            
-            processed_keys = set()
-            
-            for row in rows:
-                for private_key in row[:2]:
-                    private_key = private_key.strip()
-                    
-                    if private_key in processed_keys:
-                        continue
-                    
-                    processed_keys.add(private_key)
-                    
-                    log_message(f"\n{'='*50}")
-                    success = transfer_nft(private_key, destination_address)
-                    
-                    if success:
-                        successful_transactions += 1
-                    
-                    time.sleep(0.2)
-            
-            log_message(f"\n{'='*50}")
-            log_message(f"✨ Сбор NFT завершен")
-            log_message(f"📊 Успешных транзакций: {successful_transactions}")
-            
+        if journal is not None:
+            counts = journal.reconcile(rpc_pool)
+            log_message(f"📒 Журнал {journal.path}: подтверждено {counts[CONFIRMED]}, отклонено {counts[FAILED]}, в пути {counts[BROADCAST]}")
+        
+        if inventory is None and index is not None:
+            index.sync(rpc_pool)
+        
+        # CSV читается потоково: ключи набираются пачками по INVENTORY_BATCH_SIZE,
+        # каждая пачка инвентаризуется через Multicall3 и сразу обрабатывается
+        checked = 0
+        holders = 0
+        batch = []
+        
+        def process_batch(batch: list) -> tuple:
+            if inventory is None and index is not None:
+                found = index.tokens_of([address for _, address in batch])
+            elif inventory is None:
+                found = scan_nft_inventory([address for _, address in batch])
+            else:
+                found = {address: inventory[address] for _, address in batch if address in inventory}
+            sent = 0
+            for private_key, address in batch:
+                # Кошельки без NFT пропускаются без запросов к RPC
+                if address not in found:
+                    continue
+                log_message(f"\n{'='*50}")
+                if transfer_nft(private_key, destination_address, tracker=receipt_tracker, token_ids=found[address],
+                                operator_private_key=operator_private_key, journal=journal):
+                    sent += 1
+            return len(found), sent
+        
+        log_message("🔎 Инвентаризация NFT...")
+        for private_key in iter_unique_keys(filename, log_invalid_row):
+            try:
+                batch.append((private_key, get_address_from_private_key(private_key)))
+            except Exception as e:
+                log_message(f"❌ Ошибка ключа: {str(e)}", ERROR)
+                continue
+            if len(batch) >= INVENTORY_BATCH_SIZE:
+                found, sent = process_batch(batch)
+                checked += len(batch)
+                holders += found
+                successful_transactions += sent
+                batch = []
+        if batch:
+            found, sent = process_batch(batch)
+            checked += len(batch)
+            holders += found
+            successful_transactions += sent
+        
+        log_message(f"📋 Кошельков с NFT: {holders} из {checked}")
+        
+        log_message("⏳ Ожидание подтверждения отправленных транзакций...")
+        receipt_tracker.wait_all()
+        summary = receipt_tracker.summary()
+        
+        log_message(f"\n{'='*50}")
+        log_message(f"✨ Сбор NFT завершен")
+        log_message(f"📊 Кошельков с отправленными NFT: {successful_transactions}")
+        log_message(f"📊 Подтверждено: {summary['confirmed']}, отклонено: {summary['failed']}, без ответа: {summary['timeout']}")
+        
     except Exception as e:
-        log_message(f"❌ Ошибка при чтении файла: {str(e)}")
+        log_message(f"❌ Ошибка при чтении файла: {str(e)}", ERROR)
 
 if __name__ == "__main__":
     # Настройка вывода
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', write_through=True)
+    # Вывод буферизуется логгером, write_through не нужен
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     
     # Проверка подключения
     log_message("🌐 Проверка подключения к RPC...")
     if not w3.is_connected():
-        log_message("❌ Не удалось подключиться к RPC")
+        log_message("❌ Не удалось подключиться к RPC", ERROR)
         sys.exit(1)
     log_message("✅ Подключение успешно")
     
     # Адрес для сбора NFT
     destination_address = "ВАШ АДРЕС"
     
+    # Приватный ключ оператора, если газ за переводы должен платить он (None - платят владельцы)
+    operator_private_key = None
+    
+    # Журнал запуска: True - продолжить прерванный запуск с места остановки.
+    # Ключи журнала не устаревают, поэтому для нового запуска оставьте False
+    resume = False
+    journal = RunJournal("token_collector.journal.jsonl") if resume else None
+    
     # Запуск сбора NFT
-    collect_nfts_from_csv("wallets.csv", destination_address) 
\ No newline at end of file
+    collect_nfts_from_csv("wallets.csv", destination_address, operator_private_key, journal) 
\ No newline at end of file
@@ -0,0 +1,246 @@
+import atexit
+import csv
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+from eth_account import Account
+from eth_utils import keccak, to_checksum_address
+
+# Кэш на весь запуск: нормализованный ключ -> LocalAccount
+_accounts = {}
+_accounts_lock = threading.Lock()
+
+# Зашифрованный индекс адресов на диске (use_address_index), по умолчанию выключен
+address_index = None
+
+def normalize_key(private_key: str) -> str:
+    """Убирает пробелы и префикс 0x"""
+    private_key = private_key.strip()
+    if private_key.startswith('0x'):
+        private_key = private_key[2:]
+    return private_key
+
+def load_account(private_key: str):
+    """LocalAccount для ключа; ключ выводится один раз за запуск"""
+    private_key = normalize_key(private_key)
+    account = _accounts.get(private_key)
+    if account is None:
+        account = Account.from_key(private_key)
+        with _accounts_lock:
+            _accounts[private_key] = account
+    return account
+
+def get_address_from_private_key(private_key: str) -> str:
+    """Адрес ключа: из индекса на диске, если он включен, иначе через load_account"""
+    if address_index is not None:
+        return address_index.address(private_key)
+    return load_account(private_key).address
+
+# Приватный ключ: 64 hex-символа, можно с префиксом 0x
+KEY_PATTERN = re.compile(r'^(0x)?[0-9a-fA-F]{64}$')
+
+# Сколько строк может ждать обработки в очереди потокового чтения
+STREAM_QUEUE_SIZE = 1024
+
+def validate_key(private_key: str) -> str:
+    """Проверяет формат ключа, возвращает ключ без пробелов"""
+    private_key = private_key.strip()
+    if not KEY_PATTERN.match(private_key):
+        raise ValueError(f"некорректный приватный ключ ({len(private_key)} символов)")
+    return private_key
+
+def iter_wallets(filename: str, on_invalid=None):
+    """
+    Потоково читает wallets.csv: строки проверяются по мере чтения,
+    файл целиком в память не загружается.
+    Строки нумеруются с 1 после заголовка; строки меньше чем из двух
+    колонок (пустые) не получают номера, строки с битым ключом получают
+
+    :param on_invalid: вызывается как on_invalid(номер, ошибка) для битых строк
+    :return: генератор (номер, from_private_key, to_private_key)
+    """
+    with open(filename, 'r') as file:
+        reader = csv.reader(file)
+        next(reader, None)  # Пропускаем заголовок
+        index = 0
+        for row in reader:
+            if len(row) < 2:
+                continue
+            index += 1
+            try:
+                yield index, validate_key(row[0]), validate_key(row[1])
+            except ValueError as e:
+                if on_invalid is not None:
+                    on_invalid(index, e)
+
+def stream_wallets(filename: str, on_invalid=None, maxsize: int = STREAM_QUEUE_SIZE):
+    """
+    iter_wallets через ограниченную очередь: файл читает отдельный поток,
+    обработка начинается с первой корректной строки, а читатель не
+    уходит вперед больше чем на maxsize строк
+    """
+    rows = queue.Queue(maxsize)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                rows.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            for row in iter_wallets(filename, on_invalid):
+                if not put(row):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=reader, name='csv-reader', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = rows.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Потребитель остановился раньше - отпускаем поток чтения
+        stopped.set()
+
+class SeenSet:
+    """
+    Компактное множество уже встреченных ключей: вместо строк хранятся
+    64-битные хэши (int), что в несколько раз меньше по памяти
+    """
+
+    def __init__(self):
+        self._hashes = set()
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'little')
+
+    def add(self, value: str) -> bool:
+        """Добавляет значение, возвращает False, если оно уже было"""
+        value_hash = self._hash(value)
+        if value_hash in self._hashes:
+            return False
+        self._hashes.add(value_hash)
+        return True
+
+    def __contains__(self, value: str) -> bool:
+        return self._hash(value) in self._hashes
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+def iter_unique_keys(filename: str, on_invalid=None):
+    """Потоково: уникальные ключи из обоих столбцов в порядке появления"""
+    seen = SeenSet()
+    for _, from_private_key, to_private_key in stream_wallets(filename, on_invalid):
+        for private_key in (from_private_key, to_private_key):
+            if seen.add(normalize_key(private_key).lower()):
+                yield private_key
+
+def _key_id(private_key: str) -> str:
+    """Идентификатор ключа в индексе: хэш, а не сам ключ"""
+    return keccak(hexstr=normalize_key(private_key)).hex()
+
+def save_address_index(path: str, password: str, index: dict):
+    """
+    Сохраняет индекс {хэш ключа: адрес} в зашифрованный файл (scrypt + AES-GCM).
+    Сами ключи в индекс не попадают
+    """
+    from Crypto.Cipher import AES
+    from Crypto.Protocol.KDF import scrypt
+    from Crypto.Random import get_random_bytes
+
+    salt = get_random_bytes(16)
+    cipher = AES.new(scrypt(password, salt, 32, N=2**14, r=8, p=1), AES.MODE_GCM)
+    ciphertext, tag = cipher.encrypt_and_digest(json.dumps(index).encode())
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump({
+            'salt': salt.hex(),
+            'nonce': cipher.nonce.hex(),
+            'tag': tag.hex(),
+            'data': ciphertext.hex(),
+        }, file)
+    os.replace(tmp_path, path)
+
+def load_address_index(path: str, password: str) -> dict:
+    """Читает зашифрованный индекс: {хэш ключа: адрес}"""
+    from Crypto.Cipher import AES
+    from Crypto.Protocol.KDF import scrypt
+
+    with open(path, 'r') as file:
+        stored = json.load(file)
+
+    key = scrypt(password, bytes.fromhex(stored['salt']), 32, N=2**14, r=8, p=1)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=bytes.fromhex(stored['nonce']))
+    data = cipher.decrypt_and_verify(bytes.fromhex(stored['data']), bytes.fromhex(stored['tag']))
+    return json.loads(data)
+
+class AddressIndex:
+    """
+    Адреса ключей с опорой на зашифрованный индекс на диске:
+    для известных ключей адрес берется из индекса без вывода secp256k1
+    """
+
+    def __init__(self, path: str = None, password: str = None):
+        self.path = path
+        self.password = password
+        self._index = {}
+        if path and password and os.path.exists(path):
+            self._index = load_address_index(path, password)
+
+    def lookup(self, private_key: str) -> str:
+        """Адрес из индекса или None"""
+        return self._index.get(_key_id(private_key))
+
+    def remember(self, private_key: str, address) -> str:
+        """Запоминает адрес (строка или 20 байт), возвращает его с checksum"""
+        address = to_checksum_address(address)
+        self._index[_key_id(private_key)] = address
+        return address
+
+    def address(self, private_key: str) -> str:
+        address = self.lookup(private_key)
+        if address is None:
+            address = self.remember(private_key, load_account(private_key).address)
+        return address
+
+    def save(self):
+        if not (self.path and self.password):
+            return
+        # В индекс попадают и адреса, выведенные через load_account
+        with _accounts_lock:
+            for key, account in _accounts.items():
+                self._index.setdefault(_key_id(key), account.address)
+        save_address_index(self.path, self.password, self._index)
+
+def use_address_index(path: str, password: str) -> AddressIndex:
+    """
+    Включает индекс адресов на диске для get_address_from_private_key и
+    реестра кошельков; индекс дописывается и сохраняется при выходе
+    """
+    global address_index
+    address_index = AddressIndex(path, password)
+    atexit.register(address_index.save)
+    return address_index
+
+# Индекс можно включить переменными окружения ADDRESS_INDEX (файл) и ADDRESS_INDEX_PASSWORD
+if os.environ.get('ADDRESS_INDEX') and os.environ.get('ADDRESS_INDEX_PASSWORD'):
+    use_address_index(os.environ['ADDRESS_INDEX'], os.environ['ADDRESS_INDEX_PASSWORD'])